@@ -8,6 +8,14 @@ from .message import (
     MessageContent,
     EmbeddedContentPart,
     MessageAttachment,
+    ChunkedAttachment,
+    LazyMessageAttachment,
+)
+from .block_events import (
+    MessageReceived,
+    MessageEdited,
+    MessageDeleted,
+    AttachmentReceived,
 )
 from .exceptions import JoinFailureError
 
@@ -0,0 +1,133 @@
+"""Limiting how many correspondences keep their blockchain stacks open.
+
+An active correspondence keeps its MutaBlockchain(PrivateBlockchain(...))
+stack, block indexes and listeners in memory and syncing in the background.
+The ActivationManager lets correspondences activate on demand,
+deactivates those that have been idle for too long,
+and caps how many are active at once by deactivating the least recently used.
+"""
+
+from collections import OrderedDict
+from threading import Event, Lock, Thread
+import time
+from typing import Any
+
+from .log import logger_endra as logger
+
+
+class ActivationManager:
+    """Tracks the use of activatable objects, deactivating unused ones.
+
+    The managed objects must call `touch()` whenever they are activated
+    or accessed, holding a lock of their own.
+    They must also have a `deactivate_if_unused()` method, which the
+    manager calls on its own thread after evicting them.
+    Holding that same lock, it must deactivate the object unless
+    `is_active()` shows it has been touched again since.
+    """
+
+    def __init__(
+        self, max_active: int | None = None, idle_timeout: float | None = None
+    ):
+        """Create an activation manager.
+
+        Args:
+            max_active: the maximum number of objects to keep active,
+                or `None` for no limit
+            idle_timeout: the number of seconds after which unused objects
+                are deactivated, or `None` to keep them active
+        """
+        if max_active is not None and max_active < 1:
+            raise ValueError(f"max_active must be positive, not {max_active}")
+        self.max_active = max_active
+        self.idle_timeout = idle_timeout
+        self._lock = Lock()
+        # active objects -> when they were last used, least recently used first
+        self._last_used: OrderedDict[Any, float] = OrderedDict()
+        # evicted objects, waiting to be deactivated
+        self._evicted: list[Any] = []
+        # held while deactivating evicted objects
+        self._deactivation_lock = Lock()
+        self._wake = Event()
+        self._terminate = False
+        self._thread = Thread(
+            target=self._run, daemon=True, name="EndraActivationManager"
+        )
+        self._thread.start()
+
+    def touch(self, obj: Any) -> None:
+        """Record that an active object is being used.
+
+        Evicts the least recently used objects beyond `max_active`,
+        which are deactivated on the manager's thread.
+        """
+        with self._lock:
+            self._last_used[obj] = time.monotonic()
+            self._last_used.move_to_end(obj)
+            while self.max_active and len(self._last_used) > self.max_active:
+                self._evicted.append(self._last_used.popitem(last=False)[0])
+            if self._evicted:
+                self._wake.set()
+
+    def remove(self, obj: Any) -> None:
+        """Stop tracking an object, e.g. because it has been deactivated."""
+        with self._lock:
+            self._last_used.pop(obj, None)
+
+    def is_active(self, obj: Any) -> bool:
+        with self._lock:
+            return obj in self._last_used
+
+    def get_num_active(self) -> int:
+        with self._lock:
+            return len(self._last_used)
+
+    def deactivate_idle(self) -> None:
+        """Deactivate the objects that haven't been used for `idle_timeout`."""
+        if self.idle_timeout is None:
+            return
+        deadline = time.monotonic() - self.idle_timeout
+        with self._lock:
+            idle = []
+            for obj, last_used in self._last_used.items():
+                if last_used > deadline:
+                    break
+                idle.append(obj)
+            for obj in idle:
+                self._last_used.pop(obj)
+            self._evicted.extend(idle)
+        self.deactivate_evicted()
+
+    def deactivate_evicted(self) -> None:
+        """Deactivate the objects evicted so far, waiting until they are."""
+        with self._deactivation_lock:
+            with self._lock:
+                evicted = self._evicted
+                self._evicted = []
+            for obj in evicted:
+                try:
+                    obj.deactivate_if_unused()
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    logger.error(
+                        f"ActivationManager: failed to deactivate {obj}:\n{e}"
+                    )
+
+    def _run(self) -> None:
+        check_interval = None
+        if self.idle_timeout is not None:
+            check_interval = self.idle_timeout / 2
+        while True:
+            self._wake.wait(check_interval)
+            self._wake.clear()
+            if self._terminate:
+                return
+            if self.idle_timeout is None:
+                self.deactivate_evicted()
+            else:
+                self.deactivate_idle()
+
+    def terminate(self) -> None:
+        """Stop deactivating unused objects."""
+        self._terminate = True
+        self._wake.set()
+        self._thread.join()
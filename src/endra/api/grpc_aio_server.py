@@ -0,0 +1,454 @@
+"""asyncio-based alternative to GrpcServer.
+
+Subscription streams are coroutines instead of threads,
+so thousands of concurrent subscriptions don't starve other RPCs.
+The server runs its own event loop in a background thread
+and offers the same interface as GrpcServer.
+"""
+
+import asyncio
+import inspect
+import threading
+import time
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    Tuple,
+)
+
+import grpc
+
+from ..log import logger_endra as logger
+from . import myservice_pb2
+from . import myservice_pb2_grpc
+from .grpc_server import (
+    DEFAULT_BLOCK_TIMEOUT,
+    DEFAULT_SUBSCRIBER_QUEUE_SIZE,
+    SERVER_OPTIONS,
+    STREAM_BATCH_SIZE,
+    BaseSubscription,
+    EventFilter,
+    OverflowPolicy,
+    get_subscription_topics,
+    make_event,
+)
+
+# handlers may be coroutine functions (or async generator functions)
+RequestHandler = Callable[
+    [myservice_pb2.Request],
+    myservice_pb2.Response | Awaitable[myservice_pb2.Response],
+]
+BatchHandler = Callable[
+    [list[myservice_pb2.Request]],
+    list[myservice_pb2.Response] | Awaitable[list[myservice_pb2.Response]],
+]
+StreamHandler = Callable[
+    [myservice_pb2.Request],
+    Iterable[myservice_pb2.Response] | AsyncIterable[myservice_pb2.Response],
+]
+
+
+async def _call_handler(handler: Callable, *args: Any) -> Any:
+    """Await coroutine functions, run other functions in a worker thread."""
+    if inspect.iscoroutinefunction(handler):
+        return await handler(*args)
+    return await asyncio.to_thread(handler, *args)
+
+
+class AsyncSubscription(BaseSubscription):
+    """A subscriber's queue of events to deliver, for asyncio servers.
+
+    Not thread-safe: must only be used from the event loop it was created in.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        """Create a subscription, see BaseSubscription for the args."""
+        super().__init__(*args, **kwargs)
+        self._changed = asyncio.Event()
+
+    def _notify(self) -> None:
+        self._changed.set()
+
+    async def _wait_until(self, predicate: Callable[[], Any]) -> None:
+        while not predicate():
+            self._changed.clear()
+            await self._changed.wait()
+
+    def put_nowait(self, message: myservice_pb2.Event) -> bool:
+        """Queue an event for delivery without waiting.
+
+        With OverflowPolicy.BLOCK, an event that doesn't fit isn't queued,
+        use `put` to wait for space.
+
+        Returns:
+            whether the event was queued
+        """
+        return self._offer(message)
+
+    async def put(
+        self, message: myservice_pb2.Event, deadline: float | None = None
+    ) -> bool:
+        """Queue an event for delivery, applying the overflow policy.
+
+        With OverflowPolicy.BLOCK, if the queue doesn't get space by the
+        deadline, the event is dropped and the subscription is closed.
+
+        Args:
+            message: the event to queue
+            deadline: the `time.monotonic()` time to wait for space until,
+                by default `block_timeout` seconds from now
+        Returns:
+            whether the event was queued rather than dropped
+        """
+        if self._must_wait():
+            try:
+                await asyncio.wait_for(
+                    self._wait_until(self._has_space),
+                    self._get_wait_timeout(deadline),
+                )
+            except asyncio.TimeoutError:
+                self._on_wait_timeout()
+                return False
+        return self._offer(message)
+
+    async def get(self) -> myservice_pb2.Event | None:
+        """Wait for the next event, returning None once closed."""
+        await self._wait_until(lambda: self._messages or self.closed)
+        return self._take()
+
+    def close(self) -> None:
+        self.closed = True
+        self._messages.clear()
+        self._notify()
+
+
+class AsyncMyService(myservice_pb2_grpc.MyServiceServicer):
+    """MyService implementation for `grpc.aio` servers.
+
+    Must only be used from the event loop the server runs in.
+    """
+
+    def __init__(
+        self,
+        on_request_received: RequestHandler,
+        subscriber_queue_size: int = DEFAULT_SUBSCRIBER_QUEUE_SIZE,
+        overflow_policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+        on_batch_received: BatchHandler | None = None,
+        on_stream_request: StreamHandler | None = None,
+        block_timeout: float | None = DEFAULT_BLOCK_TIMEOUT,
+    ) -> None:
+        """Create the service.
+
+        Args:
+            on_request_received: Function to get executed when a remote
+                procedure call is received. Coroutine functions are awaited,
+                other functions are run in a worker thread.
+            subscriber_queue_size: the maximum number of undelivered
+                messages per subscriber
+            overflow_policy: what to do when a subscriber's queue is full
+            on_batch_received: Function to process many requests at once,
+                returning their responses in the same order.
+                By default on_request_received is called for each request.
+            on_stream_request: Function returning an iterable or
+                async iterable of responses to a request,
+                for streaming them to the client.
+                Without it, streamed responses aren't supported.
+            block_timeout: with OverflowPolicy.BLOCK, how many seconds
+                publishing waits for full subscribers before disconnecting
+                them, None to wait indefinitely
+        """
+        self.on_request_received = on_request_received
+        self.on_batch_received = on_batch_received
+        self.on_stream_request = on_stream_request
+        self.subscriber_queue_size = subscriber_queue_size
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout
+        self.subscribers: Dict[str, set[AsyncSubscription]] = {}
+
+    async def ProcessRequest(
+        self, request: myservice_pb2.Request, context: grpc.aio.ServicerContext
+    ) -> myservice_pb2.Response:
+        """Handles the RPC call."""
+        return await _call_handler(self.on_request_received, request)
+
+    async def process_batch(
+        self, requests: list[myservice_pb2.Request]
+    ) -> list[myservice_pb2.Response]:
+        """Process requests with the batch handler, if there is one."""
+        if self.on_batch_received:
+            responses = await _call_handler(self.on_batch_received, requests)
+        else:
+            responses = await asyncio.gather(
+                *[_call_handler(self.on_request_received, request) for request in requests]
+            )
+        if len(responses) != len(requests):
+            raise ValueError(
+                f"Got {len(responses)} responses to {len(requests)} requests."
+            )
+        return list(responses)
+
+    async def ProcessBatch(
+        self, request: myservice_pb2.BatchRequest, context: grpc.aio.ServicerContext
+    ) -> myservice_pb2.BatchResponse:
+        """Handles many RPC calls in one round trip."""
+        return myservice_pb2.BatchResponse(
+            responses=await self.process_batch(list(request.requests))
+        )
+
+    async def ProcessRequestStream(
+        self,
+        request_iterator: AsyncIterator[myservice_pb2.Request],
+        context: grpc.aio.ServicerContext,
+    ) -> myservice_pb2.BatchResponse:
+        """Handles a stream of RPC calls, processing them as they arrive."""
+        responses: list[myservice_pb2.Response] = []
+        batch: list[myservice_pb2.Request] = []
+        async for request in request_iterator:
+            batch.append(request)
+            if len(batch) >= STREAM_BATCH_SIZE:
+                responses += await self.process_batch(batch)
+                batch = []
+        if batch:
+            responses += await self.process_batch(batch)
+        return myservice_pb2.BatchResponse(responses=responses)
+
+    async def StreamResponses(
+        self, request: myservice_pb2.Request, context: grpc.aio.ServicerContext
+    ) -> AsyncIterator[myservice_pb2.Response]:
+        """Handles an RPC call whose responses are streamed."""
+        if not self.on_stream_request:
+            await context.abort(
+                grpc.StatusCode.UNIMPLEMENTED, "Streamed responses aren't supported."
+            )
+        if inspect.isasyncgenfunction(self.on_stream_request):
+            async for response in self.on_stream_request(request):
+                yield response
+            return
+        # produce the responses in a worker thread
+        responses = iter(await asyncio.to_thread(self.on_stream_request, request))
+        while (response := await asyncio.to_thread(next, responses, None)) is not None:
+            yield response
+
+    async def Subscribe(
+        self,
+        request: myservice_pb2.SubscriptionRequest,
+        context: grpc.aio.ServicerContext,
+    ) -> AsyncIterator[myservice_pb2.Message]:
+        """Handles client subscriptions to text messages and sends them."""
+        async for event in self._stream_events(
+            get_subscription_topics(request), EventFilter(["text"])
+        ):
+            yield myservice_pb2.Message(data=event.text)
+
+    async def SubscribeEvents(
+        self,
+        request: myservice_pb2.SubscriptionRequest,
+        context: grpc.aio.ServicerContext,
+    ) -> AsyncIterator[myservice_pb2.Event]:
+        """Handles client subscriptions to events and sends them."""
+        async for event in self._stream_events(
+            get_subscription_topics(request), EventFilter.from_request(request)
+        ):
+            yield event
+
+    async def _stream_events(
+        self, topics: list[str], event_filter: EventFilter
+    ) -> AsyncIterator[myservice_pb2.Event]:
+        subscription = self.add_subscription(topics, event_filter)
+        # when the client cancels, this coroutine is cancelled
+        try:
+            while (event := await subscription.get()) is not None:
+                yield event
+        finally:
+            self.remove_subscription(subscription)
+
+    def add_subscription(
+        self, topics: list[str], event_filter: EventFilter | None = None
+    ) -> AsyncSubscription:
+        """Register a new subscriber to topics."""
+        subscription = AsyncSubscription(
+            topics,
+            max_size=self.subscriber_queue_size,
+            overflow_policy=self.overflow_policy,
+            block_timeout=self.block_timeout,
+            event_filter=event_filter,
+        )
+        for topic in topics:
+            self.subscribers.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def remove_subscription(self, subscription: AsyncSubscription) -> None:
+        """Close a subscription and unregister it from its topics."""
+        subscription.close()
+        for topic in subscription.topics:
+            subscriptions = self.subscribers.get(topic)
+            if subscriptions is None:
+                continue
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self.subscribers.pop(topic)
+
+    def get_num_subscribers(self, topic: str) -> int:
+        return len(self.subscribers.get(topic, ()))
+
+    def _get_matching_subscriptions(
+        self, event: myservice_pb2.Event
+    ) -> list[AsyncSubscription]:
+        return [
+            subscription
+            for subscription in self.subscribers.get(event.topic, ())
+            if subscription.event_filter.matches(event)
+        ]
+
+    def publish_nowait(self, topic: str, message: str | myservice_pb2.Event) -> None:
+        """Publish a text message or event, dropping it for full subscribers."""
+        event = make_event(topic, message)
+        for subscription in self._get_matching_subscriptions(event):
+            subscription.put_nowait(event)
+
+    async def publish(self, topic: str, message: str | myservice_pb2.Event) -> None:
+        """Publish a text message or event to all subscribers of a topic.
+
+        With OverflowPolicy.BLOCK, waits for full subscribers concurrently,
+        for at most `block_timeout` seconds in total.
+        """
+        event = make_event(topic, message)
+        full_subscriptions = [
+            subscription
+            for subscription in self._get_matching_subscriptions(event)
+            if not subscription.put_nowait(event)
+            and subscription.overflow_policy == OverflowPolicy.BLOCK
+        ]
+        if not full_subscriptions:
+            return
+        deadline = (
+            None if self.block_timeout is None
+            else time.monotonic() + self.block_timeout
+        )
+        await asyncio.gather(
+            *[subscription.put(event, deadline) for subscription in full_subscriptions]
+        )
+
+    def close_all_subscriptions(self) -> None:
+        """End all subscription streams."""
+        for subscriptions in list(self.subscribers.values()):
+            for subscription in list(subscriptions):
+                subscription.close()
+
+
+class AsyncGrpcServer:
+    """gRPC server running MyService on an asyncio event loop.
+
+    Has the same interface as GrpcServer, running its event loop
+    in a background thread.
+    """
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        on_request_received: RequestHandler,
+        max_concurrent_rpcs: int | None = None,
+        subscriber_queue_size: int = DEFAULT_SUBSCRIBER_QUEUE_SIZE,
+        overflow_policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+        on_batch_received: BatchHandler | None = None,
+        on_stream_request: StreamHandler | None = None,
+        block_timeout: float | None = DEFAULT_BLOCK_TIMEOUT,
+    ) -> None:
+        """Listen for RPC calls.
+
+        Args:
+            address: IP address and port number
+            on_request_received: Function to get executed when a remote
+                procedure call is received. Coroutine functions are awaited,
+                other functions are run in a worker thread.
+            max_concurrent_rpcs: the maximum number of concurrent RPCs,
+                including open subscription streams, None for no limit
+            subscriber_queue_size: the maximum number of undelivered
+                messages per subscriber
+            overflow_policy: what to do when a subscriber's queue is full
+            on_batch_received: Function to process many requests at once,
+                returning their responses in the same order.
+                By default on_request_received is called for each request.
+            on_stream_request: Function returning an iterable or
+                async iterable of responses to a request,
+                for streaming them to the client.
+                Without it, streamed responses aren't supported.
+            block_timeout: with OverflowPolicy.BLOCK, how many seconds
+                publishing waits for full subscribers before disconnecting
+                them, None to wait indefinitely
+        """
+        self.address = address
+        self.max_concurrent_rpcs = max_concurrent_rpcs
+        self.service = AsyncMyService(
+            on_request_received,
+            subscriber_queue_size=subscriber_queue_size,
+            overflow_policy=overflow_policy,
+            on_batch_received=on_batch_received,
+            on_stream_request=on_stream_request,
+            block_timeout=block_timeout,
+        )
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        try:
+            self.server: grpc.aio.Server = self._run_in_loop(self._start())
+        except Exception:
+            self._stop_loop()
+            raise
+        logger.info(f"RPC server started at {address[0]}:{address[1]}")
+
+    async def _start(self) -> grpc.aio.Server:
+        server = grpc.aio.server(
+            options=SERVER_OPTIONS,
+            maximum_concurrent_rpcs=self.max_concurrent_rpcs,
+        )
+        myservice_pb2_grpc.add_MyServiceServicer_to_server(self.service, server)
+        server.add_insecure_port(f"{self.address[0]}:{self.address[1]}")
+        await server.start()
+        return server
+
+    def _run_in_loop(self, coroutine: Awaitable) -> Any:
+        """Run a coroutine in the server's event loop and wait for its result."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def publish(self, topic: str, message: str | myservice_pb2.Event) -> None:
+        """Publishes a text message or event to all subscribers of a topic.
+
+        Can be called from any thread.
+        With OverflowPolicy.BLOCK, waits until all subscribers have space
+        or `block_timeout` has passed.
+        """
+        if self.service.overflow_policy == OverflowPolicy.BLOCK:
+            self._run_in_loop(self.service.publish(topic, message))
+        else:
+            self.loop.call_soon_threadsafe(
+                self.service.publish_nowait, topic, message
+            )
+
+    def get_num_subscribers(self, topic: str) -> int:
+        async def get_num_subscribers() -> int:
+            return self.service.get_num_subscribers(topic)
+
+        return self._run_in_loop(get_num_subscribers())
+
+    async def _stop(self, grace: float) -> None:
+        self.service.close_all_subscriptions()
+        await self.server.stop(grace)
+
+    def _stop_loop(self) -> None:
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    def terminate(self) -> None:
+        """Cleanup resources."""
+        if self.loop.is_closed():
+            return
+        logger.info("Shutting down RPC server...")
+        self._run_in_loop(self._stop(5))
+        self._stop_loop()
@@ -1,40 +1,427 @@
 from time import sleep
+import json
 import threading
 import grpc
-from typing import Callable, Tuple
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Dict, Iterable, Iterator, Tuple
 from . import myservice_pb2
 from . import myservice_pb2_grpc
 
 
 
-def send_request(address: Tuple[str, int], request: myservice_pb2.Request) -> myservice_pb2.Response:
+# deadline for RPCs in seconds, None for no deadline
+DEFAULT_TIMEOUT: float | None = 30
+
+# retry policy for RPCs that failed because the server was unavailable
+DEFAULT_MAX_ATTEMPTS = 4
+
+# keep idle connections alive, the servers are configured to permit this
+CHANNEL_OPTIONS = [
+    ("grpc.keepalive_time_ms", 60000),
+    ("grpc.keepalive_timeout_ms", 10000),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+    # don't limit the size of messages, as batches can be large
+    ("grpc.max_send_message_length", -1),
+    ("grpc.max_receive_message_length", -1),
+]
+
+
+def get_channel_options(max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> list[tuple]:
+    """Get the options for creating channels to our gRPC servers.
+
+    Args:
+        max_attempts: the maximum number of attempts at an RPC whose
+            server is unavailable, 1 to disable retrying
+    """
+    service_config = {
+        "methodConfig": [{
+            "name": [{"service": "MyService"}],
+            "retryPolicy": {
+                "maxAttempts": max_attempts,
+                "initialBackoff": "0.1s",
+                "maxBackoff": "2s",
+                "backoffMultiplier": 2,
+                "retryableStatusCodes": ["UNAVAILABLE"],
+            },
+        }]
+    }
+    return CHANNEL_OPTIONS + [
+        ("grpc.enable_retries", 1 if max_attempts > 1 else 0),
+        ("grpc.service_config", json.dumps(service_config)),
+    ]
+
+
+class GrpcClient:
+    """Client for our gRPC servers, reusing one connection for all RPCs."""
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        timeout: float | None = DEFAULT_TIMEOUT,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ) -> None:
+        """Connect to a gRPC server.
+
+        Args:
+            address: IP address and port number
+            timeout: the default deadline for RPCs in seconds, None for none
+            max_attempts: the maximum number of attempts at an RPC whose
+                server is unavailable, 1 to disable retrying
+        """
+        self.address = address
+        self.timeout = timeout
+        self.channel: grpc.Channel = grpc.insecure_channel(
+            f"{address[0]}:{address[1]}", options=get_channel_options(max_attempts)
+        )
+        self.stub: myservice_pb2_grpc.MyServiceStub = myservice_pb2_grpc.MyServiceStub(self.channel)
+
+    def send_request(
+        self, request: myservice_pb2.Request, timeout: float | None = None
+    ) -> myservice_pb2.Response:
+        """Execute a remote procedure call.
+
+        Args:
+            request: The RPC data
+            timeout: the deadline for the RPC in seconds,
+                by default the client's timeout
+        Returns:
+            The response from the server
+        """
+        return self.stub.ProcessRequest(
+            request, timeout=timeout if timeout is not None else self.timeout
+        )
+
+    def send_batch(
+        self, requests: Iterable[myservice_pb2.Request], timeout: float | None = None
+    ) -> list[myservice_pb2.Response]:
+        """Execute many remote procedure calls in one round trip.
+
+        Args:
+            requests: The RPC data
+            timeout: the deadline for the RPC in seconds,
+                by default the client's timeout
+        Returns:
+            The responses from the server, in the order of the requests
+        """
+        response = self.stub.ProcessBatch(
+            myservice_pb2.BatchRequest(requests=requests),
+            timeout=timeout if timeout is not None else self.timeout,
+        )
+        return list(response.responses)
+
+    def send_request_stream(
+        self, requests: Iterable[myservice_pb2.Request], timeout: float | None = None
+    ) -> list[myservice_pb2.Response]:
+        """Stream remote procedure calls to the server.
+
+        Unlike `send_batch`, the requests are sent as they are produced
+        and the server processes them as they arrive.
+
+        Args:
+            requests: The RPC data, e.g. a generator
+            timeout: the deadline for the whole stream in seconds,
+                None for no deadline
+        Returns:
+            The responses from the server, in the order of the requests
+        """
+        response = self.stub.ProcessRequestStream(iter(requests), timeout=timeout)
+        return list(response.responses)
+
+    def stream_responses(
+        self, request: myservice_pb2.Request, timeout: float | None = None
+    ) -> Iterator[myservice_pb2.Response]:
+        """Execute a remote procedure call whose responses are streamed.
+
+        Args:
+            request: The RPC data
+            timeout: the deadline for the whole stream in seconds,
+                None for no deadline
+        Returns:
+            An iterator over the responses from the server
+        """
+        return self.stub.StreamResponses(request, timeout=timeout)
+
+    def subscribe(
+        self,
+        topic: str | Iterable[str],
+        on_message_received: Callable[[str], None] | None = None,
+        on_event_received: Callable[[myservice_pb2.Event], None] | None = None,
+        event_types: Iterable[str] = (),
+        correspondence_ids: Iterable[str] = (),
+    ) -> "MessageSubscriber":
+        """Subscribe to topics, reusing this client's connection.
+
+        See MessageSubscriber for the parameters.
+        """
+        return MessageSubscriber(
+            self.address,
+            on_message_received,
+            topic=topic,
+            channel=self.channel,
+            on_event_received=on_event_received,
+            event_types=event_types,
+            correspondence_ids=correspondence_ids,
+        )
+
+    def close(self) -> None:
+        self.channel.close()
+
+    def __enter__(self) -> "GrpcClient":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+
+class AsyncGrpcClient:
+    """asyncio client for our gRPC servers, reusing one connection for all RPCs.
+
+    Must only be used from the event loop it was created in.
+    """
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        timeout: float | None = DEFAULT_TIMEOUT,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ) -> None:
+        """Connect to a gRPC server.
+
+        Args:
+            address: IP address and port number
+            timeout: the default deadline for RPCs in seconds, None for none
+            max_attempts: the maximum number of attempts at an RPC whose
+                server is unavailable, 1 to disable retrying
+        """
+        self.address = address
+        self.timeout = timeout
+        self.channel: grpc.aio.Channel = grpc.aio.insecure_channel(
+            f"{address[0]}:{address[1]}", options=get_channel_options(max_attempts)
+        )
+        self.stub: myservice_pb2_grpc.MyServiceStub = myservice_pb2_grpc.MyServiceStub(self.channel)
+
+    async def send_request(
+        self, request: myservice_pb2.Request, timeout: float | None = None
+    ) -> myservice_pb2.Response:
+        """Execute a remote procedure call.
+
+        Args:
+            request: The RPC data
+            timeout: the deadline for the RPC in seconds,
+                by default the client's timeout
+        Returns:
+            The response from the server
+        """
+        return await self.stub.ProcessRequest(
+            request, timeout=timeout if timeout is not None else self.timeout
+        )
+
+    async def send_batch(
+        self, requests: Iterable[myservice_pb2.Request], timeout: float | None = None
+    ) -> list[myservice_pb2.Response]:
+        """Execute many remote procedure calls in one round trip.
+
+        Args:
+            requests: The RPC data
+            timeout: the deadline for the RPC in seconds,
+                by default the client's timeout
+        Returns:
+            The responses from the server, in the order of the requests
+        """
+        response = await self.stub.ProcessBatch(
+            myservice_pb2.BatchRequest(requests=requests),
+            timeout=timeout if timeout is not None else self.timeout,
+        )
+        return list(response.responses)
+
+    async def send_request_stream(
+        self,
+        requests: Iterable[myservice_pb2.Request] | AsyncIterable[myservice_pb2.Request],
+        timeout: float | None = None,
+    ) -> list[myservice_pb2.Response]:
+        """Stream remote procedure calls to the server.
+
+        Unlike `send_batch`, the requests are sent as they are produced
+        and the server processes them as they arrive.
+
+        Args:
+            requests: The RPC data, e.g. an async generator
+            timeout: the deadline for the whole stream in seconds,
+                None for no deadline
+        Returns:
+            The responses from the server, in the order of the requests
+        """
+        response = await self.stub.ProcessRequestStream(requests, timeout=timeout)
+        return list(response.responses)
+
+    async def stream_responses(
+        self, request: myservice_pb2.Request, timeout: float | None = None
+    ) -> AsyncIterator[myservice_pb2.Response]:
+        """Execute a remote procedure call whose responses are streamed.
+
+        Args:
+            request: The RPC data
+            timeout: the deadline for the whole stream in seconds,
+                None for no deadline
+        """
+        call = self.stub.StreamResponses(request, timeout=timeout)
+        try:
+            async for response in call:
+                yield response
+        finally:
+            call.cancel()
+
+    async def subscribe(self, topic: str | Iterable[str]) -> AsyncIterator[str]:
+        """Iterate over the text messages published to topics."""
+        call = self.stub.Subscribe(make_subscription_request(topic))
+        try:
+            async for message in call:
+                yield message.data
+        finally:
+            call.cancel()
+
+    async def subscribe_events(
+        self,
+        topic: str | Iterable[str],
+        event_types: Iterable[str] = (),
+        correspondence_ids: Iterable[str] = (),
+    ) -> AsyncIterator[myservice_pb2.Event]:
+        """Iterate over the events published to topics.
+
+        Args:
+            topic: the topic or topics to subscribe to
+            event_types: if not empty, the server only sends events of
+                these types, e.g. "message_received"
+            correspondence_ids: if not empty, the server only sends events
+                concerning these correspondences
+        """
+        call = self.stub.SubscribeEvents(
+            make_subscription_request(topic, event_types, correspondence_ids)
+        )
+        try:
+            async for event in call:
+                yield event
+        finally:
+            call.cancel()
+
+    async def close(self) -> None:
+        await self.channel.close()
+
+    async def __aenter__(self) -> "AsyncGrpcClient":
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        await self.close()
+
+
+# clients shared by calls to send_request, one per server address
+_clients: Dict[Tuple[str, int], GrpcClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(address: Tuple[str, int]) -> GrpcClient:
+    """Get the shared client for a server address, creating it if needed."""
+    address = tuple(address)
+    with _clients_lock:
+        client = _clients.get(address)
+        if client is None:
+            client = GrpcClient(address)
+            _clients[address] = client
+        return client
+
+
+def close_clients() -> None:
+    """Close the shared clients' connections."""
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+def send_request(
+    address: Tuple[str, int],
+    request: myservice_pb2.Request,
+    timeout: float | None = None,
+) -> myservice_pb2.Response:
     """Execute a remote procedure call.
+
+    Reuses a shared connection to the server for all calls.
+
     Args:
         address: IP address and port number
         request: The RPC data
+        timeout: the deadline for the RPC in seconds,
+            by default DEFAULT_TIMEOUT
     Returns:
         The response from the server
     """
-    # Connect to the RPC server
-    channel: grpc.Channel = grpc.insecure_channel(f"{address[0]}:{address[1]}")
-    stub: myservice_pb2_grpc.MyServiceStub = myservice_pb2_grpc.MyServiceStub(channel)
+    return get_client(address).send_request(request, timeout)
+
+
+def make_subscription_request(
+    topics: str | Iterable[str],
+    event_types: Iterable[str] = (),
+    correspondence_ids: Iterable[str] = (),
+) -> myservice_pb2.SubscriptionRequest:
+    """Make a request to subscribe to events.
+
+    Args:
+        topics: the topic or topics to subscribe to
+        event_types: if not empty, only events of these types are delivered,
+            identified by the names of the Event's `event` fields,
+            e.g. "message_received"
+        correspondence_ids: if not empty, only events concerning these
+            correspondences are delivered, identified by their DIDs
+    """
+    topics = [topics] if isinstance(topics, str) else list(topics)
+    # servers from before `topics` only read `topic`
+    return myservice_pb2.SubscriptionRequest(
+        topic=topics[0] if topics else "",
+        topics=topics[1:],
+        event_types=event_types,
+        correspondence_ids=correspondence_ids,
+    )
 
-    # Send the request and get the response
-    response: myservice_pb2.Response = stub.ProcessRequest(request)
-    return response
 
 class MessageSubscriber:
-    def __init__(self, address: Tuple[str, int], on_message_received: Callable[[str], None]) -> None:
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        on_message_received: Callable[[str], None] | None,
+        topic: str | Iterable[str] = "updates",
+        channel: grpc.Channel | None = None,
+        on_event_received: Callable[[myservice_pb2.Event], None] | None = None,
+        event_types: Iterable[str] = (),
+        correspondence_ids: Iterable[str] = (),
+    ) -> None:
         """Initialise Publish-Subscribe subscriber object.
 
         Args:
             address: IP address and port number
-            on_message_received: event handler function to be called when a message is received
+            on_message_received: event handler function to be called when a text message is received
+            topic: the topic or topics to subscribe to
+            channel: an existing channel to the server to reuse,
+                which is left open on termination
+            on_event_received: event handler function to be called when
+                a typed event is received, and when a text message is
+                received if on_message_received is None
+            event_types: if not empty, the server only sends events of
+                these types, e.g. "message_received"
+            correspondence_ids: if not empty, the server only sends events
+                concerning these correspondences
         """
-        self.channel: grpc.Channel = grpc.insecure_channel(f"{address[0]}:{address[1]}")
+        self.topic = topic
+        self._owns_channel = channel is None
+        if channel is None:
+            channel = grpc.insecure_channel(f"{address[0]}:{address[1]}", options=CHANNEL_OPTIONS)
+        self.channel: grpc.Channel = channel
         self.stub: myservice_pb2_grpc.MyServiceStub = myservice_pb2_grpc.MyServiceStub(self.channel)
-        self.on_message_received: Callable[[str], None] = on_message_received
+        self.on_message_received: Callable[[str], None] | None = on_message_received
+        self.on_event_received = on_event_received
         self.running: bool = True
+        self._call = self.stub.SubscribeEvents(
+            make_subscription_request(topic, event_types, correspondence_ids)
+        )
 
         # Start subscription in a separate thread
         self.thread: threading.Thread = threading.Thread(
@@ -43,12 +430,14 @@ class MessageSubscriber:
 
     def _listen_for_messages(self) -> None:
         """Private method to listen for messages in a separate thread."""
-        request: myservice_pb2.SubscriptionRequest = myservice_pb2.SubscriptionRequest(topic="updates")  # Set your topic
         try:
-            for message in self.stub.Subscribe(request):
+            for event in self._call:
                 if not self.running:
                     break
-                self.on_message_received(message.data)
+                if event.WhichOneof("event") == "text" and self.on_message_received:
+                    self.on_message_received(event.text)
+                elif self.on_event_received:
+                    self.on_event_received(event)
         except grpc.RpcError as e:
             if self.running:  # Only log errors if we are not terminating
                 print(f"Subscription error: {e}")
@@ -56,8 +445,12 @@ class MessageSubscriber:
 
     def terminate(self) -> None:
         """Cleanup resources."""
+        if not self.running:
+            return
         self.running = False  # Stop the message loop
-        self.channel.close()  # Now safely close the channel
+        self._call.cancel()  # End the subscription stream
+        if self._owns_channel:
+            self.channel.close()  # Now safely close the channel
         print("Subscriber terminated.")
 
     def __del__(self) -> None:
@@ -1,68 +1,486 @@
 import threading
 import grpc
+from abc import ABC, abstractmethod
+from collections import deque
 from concurrent import futures
+from enum import Enum
 import time
-from typing import Callable, Dict, Any, Tuple
+from typing import Callable, Dict, Any, Iterable, Iterator, Tuple
+from ..log import logger_endra as logger
 from . import myservice_pb2
 from . import myservice_pb2_grpc
-import queue
+
+
+# worker threads of the server, enough for hundreds of local app subscribers
+DEFAULT_MAX_WORKERS = 256
+
+# permit clients' keepalive pings on idle connections,
+# and don't limit the size of messages, as batches can be large
+SERVER_OPTIONS = [
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.min_recv_ping_interval_without_data_ms", 30000),
+    ("grpc.http2.max_pings_without_data", 0),
+    ("grpc.max_send_message_length", -1),
+    ("grpc.max_receive_message_length", -1),
+]
+
+# ProcessRequestStream passes streamed requests to the batch handler
+# in batches of up to this many requests
+STREAM_BATCH_SIZE = 100
+
+RequestHandler = Callable[[myservice_pb2.Request], myservice_pb2.Response]
+BatchHandler = Callable[
+    [list[myservice_pb2.Request]], list[myservice_pb2.Response]
+]
+StreamHandler = Callable[[myservice_pb2.Request], Iterable[myservice_pb2.Response]]
+
+# subscription queues hold at most this many undelivered messages by default
+DEFAULT_SUBSCRIBER_QUEUE_SIZE = 1000
+
+# with OverflowPolicy.BLOCK, subscribers that stay full for this many seconds
+# are disconnected, so that one stalled subscriber can't stall publishing
+DEFAULT_BLOCK_TIMEOUT = 1.0
+
+
+class OverflowPolicy(Enum):
+    """What to do when publishing to a subscriber whose queue is full."""
+
+    DROP_OLDEST = "drop_oldest"  # discard the oldest undelivered message
+    DROP_NEWEST = "drop_newest"  # discard the message being published
+    BLOCK = "block"  # wait for the subscriber to catch up, up to a timeout
+
+
+def make_event(
+    topic: str, message: str | myservice_pb2.Event
+) -> myservice_pb2.Event:
+    """Make the Event to publish to a topic for a text message or event."""
+    if isinstance(message, str):
+        return myservice_pb2.Event(topic=topic, text=message)
+    if message.topic != topic:
+        event = myservice_pb2.Event()
+        event.CopyFrom(message)
+        event.topic = topic
+        return event
+    return message
+
+
+def get_subscription_topics(request: myservice_pb2.SubscriptionRequest) -> list[str]:
+    """Get the topics a subscription request subscribes to."""
+    topics = [topic for topic in [request.topic, *request.topics] if topic]
+    return list(dict.fromkeys(topics)) or [""]
+
+
+class EventFilter:
+    """Selects which of the events published to a topic a subscriber gets.
+
+    Applied on the server, so that unwanted events are never sent.
+    """
+
+    def __init__(
+        self,
+        event_types: Iterable[str] = (),
+        correspondence_ids: Iterable[str] = (),
+    ) -> None:
+        """Create a filter, which lets all events pass by default.
+
+        Args:
+            event_types: if not empty, only events of these types pass,
+                identified by the names of the Event's `event` fields,
+                e.g. "message_received"
+            correspondence_ids: if not empty, only events concerning
+                these correspondences pass, identified by their DIDs
+        """
+        self.event_types = set(event_types)
+        self.correspondence_ids = set(correspondence_ids)
+
+    @classmethod
+    def from_request(
+        cls, request: myservice_pb2.SubscriptionRequest
+    ) -> "EventFilter":
+        return cls(request.event_types, request.correspondence_ids)
+
+    def matches(self, event: myservice_pb2.Event) -> bool:
+        event_type = event.WhichOneof("event")
+        if self.event_types and event_type not in self.event_types:
+            return False
+        if self.correspondence_ids:
+            payload = getattr(event, event_type) if event_type else None
+            correspondence_id = getattr(payload, "correspondence_id", None)
+            if correspondence_id not in self.correspondence_ids:
+                return False
+        return True
+
+
+class BaseSubscription(ABC):
+    """A single subscriber's bounded queue of events to deliver.
+
+    Implements the overflow policies for Subscription and AsyncSubscription,
+    which add the synchronisation and waiting.
+    """
+
+    def __init__(
+        self,
+        topics: list[str],
+        max_size: int = DEFAULT_SUBSCRIBER_QUEUE_SIZE,
+        overflow_policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+        block_timeout: float | None = DEFAULT_BLOCK_TIMEOUT,
+        event_filter: EventFilter | None = None,
+    ) -> None:
+        """Create a subscription.
+
+        Args:
+            topics: the topics subscribed to
+            max_size: the maximum number of undelivered events
+            overflow_policy: what to do when the queue is full
+            block_timeout: with OverflowPolicy.BLOCK, how long to wait for
+                space in the queue before dropping the event and
+                closing the subscription, None to wait indefinitely
+            event_filter: selects the events to deliver, by default all
+        """
+        self.topics = topics
+        self.max_size = max_size
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout
+        self.event_filter = event_filter or EventFilter()
+        self._messages: deque[myservice_pb2.Event] = deque()
+        self.closed = False
+        self.num_dropped = 0  # number of events dropped due to overflow
+
+    @abstractmethod
+    def _notify(self) -> None:
+        """Wake up the waiting publishers and delivering stream."""
+
+    @abstractmethod
+    def close(self) -> None:
+        """Stop delivering messages, waking up the delivering stream."""
+
+    def _has_space(self) -> bool:
+        return self.closed or len(self._messages) < self.max_size
+
+    def _must_wait(self) -> bool:
+        """Check whether a publisher must wait for space in the queue."""
+        return self.overflow_policy == OverflowPolicy.BLOCK and not self._has_space()
+
+    def _get_wait_timeout(self, deadline: float | None) -> float | None:
+        """Get how long to wait for space, given an optional deadline."""
+        if deadline is None:
+            return self.block_timeout
+        return max(deadline - time.monotonic(), 0)
+
+    def _offer(self, message: myservice_pb2.Event) -> bool:
+        """Queue an event if the overflow policy allows it."""
+        if self.closed:
+            return False
+        if len(self._messages) >= self.max_size:
+            if self.overflow_policy == OverflowPolicy.BLOCK:
+                return False
+            self.num_dropped += 1
+            if self.overflow_policy == OverflowPolicy.DROP_NEWEST:
+                return False
+            self._messages.popleft()
+        self._messages.append(message)
+        self._notify()
+        return True
+
+    def _take(self) -> myservice_pb2.Event | None:
+        """Take the next event from a non-empty queue, None once closed."""
+        if self.closed:
+            return None
+        message = self._messages.popleft()
+        self._notify()  # wake up blocked publishers
+        return message
+
+    def _on_wait_timeout(self) -> None:
+        """Drop the event and close the subscription after a blocking wait."""
+        self.num_dropped += 1
+        self.close()
+        logger.warning(
+            f"Disconnected subscriber of {self.topics}, "
+            "which isn't keeping up with events."
+        )
+
+
+class Subscription(BaseSubscription):
+    """A subscriber's thread-safe queue of events to deliver."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        """Create a subscription, see BaseSubscription for the args."""
+        super().__init__(*args, **kwargs)
+        self._condition = threading.Condition()
+
+    def _notify(self) -> None:
+        self._condition.notify_all()
+
+    def put_nowait(self, message: myservice_pb2.Event) -> bool:
+        """Queue an event for delivery without waiting.
+
+        With OverflowPolicy.BLOCK, an event that doesn't fit isn't queued,
+        use `put` to wait for space.
+
+        Returns:
+            whether the event was queued
+        """
+        with self._condition:
+            return self._offer(message)
+
+    def put(
+        self, message: myservice_pb2.Event, deadline: float | None = None
+    ) -> bool:
+        """Queue an event for delivery, applying the overflow policy.
+
+        With OverflowPolicy.BLOCK, if the queue doesn't get space by the
+        deadline, the event is dropped and the subscription is closed.
+
+        Args:
+            message: the event to queue
+            deadline: the `time.monotonic()` time to wait for space until,
+                by default `block_timeout` seconds from now
+        Returns:
+            whether the event was queued rather than dropped
+        """
+        with self._condition:
+            if self._must_wait() and not self._condition.wait_for(
+                self._has_space, self._get_wait_timeout(deadline)
+            ):
+                self._on_wait_timeout()
+                return False
+            return self._offer(message)
+
+    def get(self) -> myservice_pb2.Event | None:
+        """Wait for the next event, returning None once closed."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._messages or self.closed)
+            return self._take()
+
+    def close(self) -> None:
+        with self._condition:
+            self.closed = True
+            self._messages.clear()
+            self._condition.notify_all()
 
 
 class MyService(myservice_pb2_grpc.MyServiceServicer):
-    def __init__(self, on_request_received: Callable[[myservice_pb2.Request], myservice_pb2.Response]) -> None:
-        self.on_request_received: Callable[[myservice_pb2.Request], myservice_pb2.Response] = on_request_received
-        self.subscribers: Dict[str, "queue.Queue[str]"] = {}  # Dictionary to hold queues per topic
+    def __init__(
+        self,
+        on_request_received: RequestHandler,
+        subscriber_queue_size: int = DEFAULT_SUBSCRIBER_QUEUE_SIZE,
+        overflow_policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+        on_batch_received: BatchHandler | None = None,
+        on_stream_request: StreamHandler | None = None,
+        block_timeout: float | None = DEFAULT_BLOCK_TIMEOUT,
+    ) -> None:
+        self.on_request_received: RequestHandler = on_request_received
+        self.on_batch_received = on_batch_received
+        self.on_stream_request = on_stream_request
+        self.subscriber_queue_size = subscriber_queue_size
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout
+        # each subscriber has its own queue, so every subscriber of a topic
+        # receives every message published to it
+        self.subscribers: Dict[str, set[Subscription]] = {}
+        self._subscribers_lock = threading.Lock()
 
     def ProcessRequest(self, request: myservice_pb2.Request, context: grpc.ServicerContext) -> myservice_pb2.Response:
         """Handles the RPC call."""
         response: myservice_pb2.Response = self.on_request_received(request)
         return response
 
+    def process_batch(
+        self, requests: list[myservice_pb2.Request]
+    ) -> list[myservice_pb2.Response]:
+        """Process requests with the batch handler, if there is one."""
+        if self.on_batch_received:
+            responses = self.on_batch_received(requests)
+        else:
+            responses = [self.on_request_received(request) for request in requests]
+        if len(responses) != len(requests):
+            raise ValueError(
+                f"Got {len(responses)} responses to {len(requests)} requests."
+            )
+        return responses
+
+    def ProcessBatch(self, request: myservice_pb2.BatchRequest, context: grpc.ServicerContext) -> myservice_pb2.BatchResponse:
+        """Handles many RPC calls in one round trip."""
+        return myservice_pb2.BatchResponse(
+            responses=self.process_batch(list(request.requests))
+        )
+
+    def ProcessRequestStream(self, request_iterator: Iterator[myservice_pb2.Request], context: grpc.ServicerContext) -> myservice_pb2.BatchResponse:
+        """Handles a stream of RPC calls, processing them as they arrive."""
+        responses: list[myservice_pb2.Response] = []
+        batch: list[myservice_pb2.Request] = []
+        for request in request_iterator:
+            batch.append(request)
+            if len(batch) >= STREAM_BATCH_SIZE:
+                responses += self.process_batch(batch)
+                batch = []
+        if batch:
+            responses += self.process_batch(batch)
+        return myservice_pb2.BatchResponse(responses=responses)
+
+    def StreamResponses(self, request: myservice_pb2.Request, context: grpc.ServicerContext) -> Iterator[myservice_pb2.Response]:
+        """Handles an RPC call whose responses are streamed."""
+        if not self.on_stream_request:
+            context.abort(grpc.StatusCode.UNIMPLEMENTED, "Streamed responses aren't supported.")
+        yield from self.on_stream_request(request)
+
     def Subscribe(self, request: myservice_pb2.SubscriptionRequest, context: grpc.ServicerContext) -> Any:
-        """Handles client subscriptions and sends updates."""
-        topic: str = request.topic
-        if topic not in self.subscribers:
-            self.subscribers[topic] = queue.Queue()
+        """Handles client subscriptions to text messages and sends them."""
+        for event in self._stream_events(
+            get_subscription_topics(request), EventFilter(["text"]), context
+        ):
+            yield myservice_pb2.Message(data=event.text)
+
+    def SubscribeEvents(self, request: myservice_pb2.SubscriptionRequest, context: grpc.ServicerContext) -> Any:
+        """Handles client subscriptions to events and sends them."""
+        yield from self._stream_events(
+            get_subscription_topics(request), EventFilter.from_request(request), context
+        )
+
+    def _stream_events(
+        self, topics: list[str], event_filter: EventFilter, context: grpc.ServicerContext
+    ) -> Iterator[myservice_pb2.Event]:
+        subscription = self.add_subscription(topics, event_filter)
+        # wake up and end the stream when the client cancels or disconnects
+        context.add_callback(subscription.close)
+        try:
+            while (event := subscription.get()) is not None:
+                yield event
+        finally:
+            self.remove_subscription(subscription)
 
-        print(f"Client subscribed to {topic}")
+    def add_subscription(
+        self, topics: list[str], event_filter: EventFilter | None = None
+    ) -> Subscription:
+        """Register a new subscriber to topics."""
+        subscription = Subscription(
+            topics,
+            max_size=self.subscriber_queue_size,
+            overflow_policy=self.overflow_policy,
+            block_timeout=self.block_timeout,
+            event_filter=event_filter,
+        )
+        with self._subscribers_lock:
+            for topic in topics:
+                self.subscribers.setdefault(topic, set()).add(subscription)
+        return subscription
 
-        while True:
-            try:
-                message: str = self.subscribers[topic].get(timeout=10)  # Wait for a message
-                yield myservice_pb2.Message(data=message)
-            except queue.Empty:
-                continue  # Keep the stream open
+    def remove_subscription(self, subscription: Subscription) -> None:
+        """Close a subscription and unregister it from its topics."""
+        subscription.close()
+        with self._subscribers_lock:
+            for topic in subscription.topics:
+                subscriptions = self.subscribers.get(topic)
+                if subscriptions is None:
+                    continue
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    self.subscribers.pop(topic)
 
-    def publish(self, topic: str, message: str) -> None:
-        """Publishes a message to subscribers."""
-        if topic in self.subscribers:
-            self.subscribers[topic].put(message)
+    def get_num_subscribers(self, topic: str) -> int:
+        with self._subscribers_lock:
+            return len(self.subscribers.get(topic, ()))
+
+    def publish(self, topic: str, message: str | myservice_pb2.Event) -> None:
+        """Publishes a text message or event to all subscribers of a topic.
+
+        With OverflowPolicy.BLOCK, waits for full subscribers concurrently,
+        for at most `block_timeout` seconds in total.
+        """
+        event = make_event(topic, message)
+        with self._subscribers_lock:
+            subscriptions = list(self.subscribers.get(topic, ()))
+        # queue the event for all subscribers that have space first,
+        # so that those don't wait for the full ones
+        full_subscriptions = [
+            subscription
+            for subscription in subscriptions
+            if subscription.event_filter.matches(event)
+            and not subscription.put_nowait(event)
+            and subscription.overflow_policy == OverflowPolicy.BLOCK
+        ]
+        if not full_subscriptions:
+            return
+        deadline = (
+            None if self.block_timeout is None
+            else time.monotonic() + self.block_timeout
+        )
+        for subscription in full_subscriptions:
+            subscription.put(event, deadline)
+
+    def close_all_subscriptions(self) -> None:
+        """End all subscription streams."""
+        with self._subscribers_lock:
+            subscriptions = {
+                subscription
+                for topic_subscriptions in self.subscribers.values()
+                for subscription in topic_subscriptions
+            }
+        for subscription in subscriptions:
+            subscription.close()
 
 
 class GrpcServer:
-    def __init__(self, address: Tuple[str, int], on_request_received: Callable[[myservice_pb2.Request], myservice_pb2.Response]) -> None:
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        on_request_received: RequestHandler,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        subscriber_queue_size: int = DEFAULT_SUBSCRIBER_QUEUE_SIZE,
+        overflow_policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+        on_batch_received: BatchHandler | None = None,
+        on_stream_request: StreamHandler | None = None,
+        block_timeout: float | None = DEFAULT_BLOCK_TIMEOUT,
+    ) -> None:
         """Listen for RPC calls.
 
         Args:
             address: IP address and port number
             on_request_received: Function to get executed when a remote procedure call is received.
+            max_workers: the maximum number of concurrent RPCs,
+                each open subscription stream occupies one worker
+            subscriber_queue_size: the maximum number of undelivered
+                messages per subscriber
+            overflow_policy: what to do when a subscriber's queue is full
+            on_batch_received: Function to process many requests at once,
+                returning their responses in the same order.
+                By default on_request_received is called for each request.
+            on_stream_request: Function returning an iterable of responses
+                to a request, for streaming them to the client.
+                Without it, streamed responses aren't supported.
+            block_timeout: with OverflowPolicy.BLOCK, how many seconds
+                publishing waits for full subscribers before disconnecting
+                them, None to wait indefinitely
         """
-        self.executor = futures.ThreadPoolExecutor(max_workers=10)  # Store executor
-        self.server = grpc.server(self.executor)
-        self.service: MyService = MyService(on_request_received)
+        self.executor = futures.ThreadPoolExecutor(max_workers=max_workers)  # Store executor
+        self.server = grpc.server(self.executor, options=SERVER_OPTIONS)
+        self.service: MyService = MyService(
+            on_request_received,
+            subscriber_queue_size=subscriber_queue_size,
+            overflow_policy=overflow_policy,
+            on_batch_received=on_batch_received,
+            on_stream_request=on_stream_request,
+            block_timeout=block_timeout,
+        )
         myservice_pb2_grpc.add_MyServiceServicer_to_server(self.service, self.server)
         self.server.add_insecure_port(f"{address[0]}:{address[1]}")
         self.server.start()
-        print(f"RPC server started at {address[0]}:{address[1]}")
+        logger.info(f"RPC server started at {address[0]}:{address[1]}")
 
-    def publish(self, topic: str, message: str) -> None:
-        """Publishes a message to all subscribers of a topic."""
+    def publish(self, topic: str, message: str | myservice_pb2.Event) -> None:
+        """Publishes a text message or event to all subscribers of a topic."""
         self.service.publish(topic, message)
 
+    def get_num_subscribers(self, topic: str) -> int:
+        return self.service.get_num_subscribers(topic)
+
     def terminate(self) -> None:
         """Cleanup resources."""
-        print("Shutting down server...")
-        
+        logger.info("Shutting down RPC server...")
+
+        # end subscription streams so that their workers are freed
+        self.service.close_all_subscriptions()
+
         # Stop the server gracefully
         self.server.stop(5)
         
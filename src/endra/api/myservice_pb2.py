@@ -24,7 +24,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0fmyservice.proto\"\x17\n\x07Request\x12\x0c\n\x04\x64\x61ta\x18\x01 \x01(\t\"\x1a\n\x08Response\x12\x0e\n\x06result\x18\x01 \x01(\t\"$\n\x13SubscriptionRequest\x12\r\n\x05topic\x18\x01 \x01(\t\"\x17\n\x07Message\x12\x0c\n\x04\x64\x61ta\x18\x01 \x01(\t2a\n\tMyService\x12%\n\x0eProcessRequest\x12\x08.Request\x1a\t.Response\x12-\n\tSubscribe\x12\x14.SubscriptionRequest\x1a\x08.Message0\x01\x62\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0fmyservice.proto\"\x17\n\x07Request\x12\x0c\n\x04\x64\x61ta\x18\x01 \x01(\t\"\x1a\n\x08Response\x12\x0e\n\x06result\x18\x01 \x01(\t\"*\n\x0c\x42\x61tchRequest\x12\x1a\n\x08requests\x18\x01 \x03(\x0b\x32\x08.Request\"-\n\rBatchResponse\x12\x1c\n\tresponses\x18\x01 \x03(\x0b\x32\t.Response\"e\n\x13SubscriptionRequest\x12\r\n\x05topic\x18\x01 \x01(\t\x12\x0e\n\x06topics\x18\x02 \x03(\t\x12\x13\n\x0b\x65vent_types\x18\x03 \x03(\t\x12\x1a\n\x12\x63orrespondence_ids\x18\x04 \x03(\t\"\x17\n\x07Message\x12\x0c\n\x04\x64\x61ta\x18\x01 \x01(\t\"\x85\x02\n\x05\x45vent\x12\r\n\x05topic\x18\x01 \x01(\t\x12\x0e\n\x04text\x18\x02 \x01(\tH\x00\x12,\n\x10message_received\x18\x03 \x01(\x0b\x32\x10.MessageReceivedH\x00\x12\x32\n\x13\x61ttachment_received\x18\x04 \x01(\x0b\x32\x13.AttachmentReceivedH\x00\x12\x36\n\x15\x63orrespondence_joined\x18\x05 \x01(\x0b\x32\x15.CorrespondenceJoinedH\x00\x12:\n\x17\x63orrespondence_archived\x18\x06 \x01(\x0b\x32\x17.CorrespondenceArchivedH\x00\x42\x07\n\x05\x65vent\"@\n\x0fMessageReceived\x12\x19\n\x11\x63orrespondence_id\x18\x01 \x01(\t\x12\x12\n\nmessage_id\x18\x02 \x01(\x0c\"Z\n\x12\x41ttachmentReceived\x12\x19\n\x11\x63orrespondence_id\x18\x01 \x01(\t\x12\x15\n\rattachment_id\x18\x02 \x01(\x0c\x12\x12\n\nmedia_type\x18\x03 \x01(\t\"1\n\x14\x43orrespondenceJoined\x12\x19\n\x11\x63orrespondence_id\x18\x01 \x01(\t\"3\n\x16\x43orrespondenceArchived\x12\x19\n\x11\x63orrespondence_id\x18\x01 \x01(\t2\xa1\x02\n\tMyService\x12%\n\x0eProcessRequest\x12\x08.Request\x1a\t.Response\x12-\n\x0cProcessBatch\x12\r.BatchRequest\x1a\x0e.BatchResponse\x12\x32\n\x14ProcessRequestStream\x12\x08.Request\x1a\x0e.BatchResponse(\x01\x12(\n\x0fStreamResponses\x12\x08.Request\x1a\t.Response0\x01\x12-\n\tSubscribe\x12\x14.SubscriptionRequest\x1a\x08.Message0\x01\x12\x31\n\x0fSubscribeEvents\x12\x14.SubscriptionRequest\x1a\x06.Event0\x01\x62\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -35,10 +35,24 @@ if not _descriptor._USE_C_DESCRIPTORS:
   _globals['_REQUEST']._serialized_end=42
   _globals['_RESPONSE']._serialized_start=44
   _globals['_RESPONSE']._serialized_end=70
-  _globals['_SUBSCRIPTIONREQUEST']._serialized_start=72
-  _globals['_SUBSCRIPTIONREQUEST']._serialized_end=108
-  _globals['_MESSAGE']._serialized_start=110
-  _globals['_MESSAGE']._serialized_end=133
-  _globals['_MYSERVICE']._serialized_start=135
-  _globals['_MYSERVICE']._serialized_end=232
+  _globals['_BATCHREQUEST']._serialized_start=72
+  _globals['_BATCHREQUEST']._serialized_end=114
+  _globals['_BATCHRESPONSE']._serialized_start=116
+  _globals['_BATCHRESPONSE']._serialized_end=161
+  _globals['_SUBSCRIPTIONREQUEST']._serialized_start=163
+  _globals['_SUBSCRIPTIONREQUEST']._serialized_end=264
+  _globals['_MESSAGE']._serialized_start=266
+  _globals['_MESSAGE']._serialized_end=289
+  _globals['_EVENT']._serialized_start=292
+  _globals['_EVENT']._serialized_end=553
+  _globals['_MESSAGERECEIVED']._serialized_start=555
+  _globals['_MESSAGERECEIVED']._serialized_end=619
+  _globals['_ATTACHMENTRECEIVED']._serialized_start=621
+  _globals['_ATTACHMENTRECEIVED']._serialized_end=711
+  _globals['_CORRESPONDENCEJOINED']._serialized_start=713
+  _globals['_CORRESPONDENCEJOINED']._serialized_end=762
+  _globals['_CORRESPONDENCEARCHIVED']._serialized_start=764
+  _globals['_CORRESPONDENCEARCHIVED']._serialized_end=815
+  _globals['_MYSERVICE']._serialized_start=818
+  _globals['_MYSERVICE']._serialized_end=1107
 # @@protoc_insertion_point(module_scope)
@@ -3,10 +3,10 @@
 import grpc
 import warnings
 
-import myservice_pb2 as myservice__pb2
+from . import myservice_pb2 as myservice__pb2
 
 GRPC_GENERATED_VERSION = '1.71.0'
-GRPC_VERSION = grpc.__version__/mnt/Uverlin/Programming/Endra/EndraApp
+GRPC_VERSION = grpc.__version__
 _version_not_supported = False
 
 try:
@@ -39,11 +39,31 @@ class MyServiceStub(object):
                 request_serializer=myservice__pb2.Request.SerializeToString,
                 response_deserializer=myservice__pb2.Response.FromString,
                 _registered_method=True)
+        self.ProcessBatch = channel.unary_unary(
+                '/MyService/ProcessBatch',
+                request_serializer=myservice__pb2.BatchRequest.SerializeToString,
+                response_deserializer=myservice__pb2.BatchResponse.FromString,
+                _registered_method=True)
+        self.ProcessRequestStream = channel.stream_unary(
+                '/MyService/ProcessRequestStream',
+                request_serializer=myservice__pb2.Request.SerializeToString,
+                response_deserializer=myservice__pb2.BatchResponse.FromString,
+                _registered_method=True)
+        self.StreamResponses = channel.unary_stream(
+                '/MyService/StreamResponses',
+                request_serializer=myservice__pb2.Request.SerializeToString,
+                response_deserializer=myservice__pb2.Response.FromString,
+                _registered_method=True)
         self.Subscribe = channel.unary_stream(
                 '/MyService/Subscribe',
                 request_serializer=myservice__pb2.SubscriptionRequest.SerializeToString,
                 response_deserializer=myservice__pb2.Message.FromString,
                 _registered_method=True)
+        self.SubscribeEvents = channel.unary_stream(
+                '/MyService/SubscribeEvents',
+                request_serializer=myservice__pb2.SubscriptionRequest.SerializeToString,
+                response_deserializer=myservice__pb2.Event.FromString,
+                _registered_method=True)
 
 
 class MyServiceServicer(object):
@@ -55,8 +75,38 @@ class MyServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def ProcessBatch(self, request, context):
+        """process many requests in one round trip, e.g. to multi-get
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def ProcessRequestStream(self, request_iterator, context):
+        """process a stream of requests, e.g. to send many messages
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def StreamResponses(self, request, context):
+        """stream the responses to a request, e.g. to export a history
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def Subscribe(self, request, context):
-        """Missing associated documentation comment in .proto file."""
+        """stream the text messages published to topics,
+        kept unchanged for clients from before typed events
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def SubscribeEvents(self, request, context):
+        """stream the text messages and typed events published to topics
+        """
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
@@ -69,11 +119,31 @@ def add_MyServiceServicer_to_server(servicer, server):
                     request_deserializer=myservice__pb2.Request.FromString,
                     response_serializer=myservice__pb2.Response.SerializeToString,
             ),
+            'ProcessBatch': grpc.unary_unary_rpc_method_handler(
+                    servicer.ProcessBatch,
+                    request_deserializer=myservice__pb2.BatchRequest.FromString,
+                    response_serializer=myservice__pb2.BatchResponse.SerializeToString,
+            ),
+            'ProcessRequestStream': grpc.stream_unary_rpc_method_handler(
+                    servicer.ProcessRequestStream,
+                    request_deserializer=myservice__pb2.Request.FromString,
+                    response_serializer=myservice__pb2.BatchResponse.SerializeToString,
+            ),
+            'StreamResponses': grpc.unary_stream_rpc_method_handler(
+                    servicer.StreamResponses,
+                    request_deserializer=myservice__pb2.Request.FromString,
+                    response_serializer=myservice__pb2.Response.SerializeToString,
+            ),
             'Subscribe': grpc.unary_stream_rpc_method_handler(
                     servicer.Subscribe,
                     request_deserializer=myservice__pb2.SubscriptionRequest.FromString,
                     response_serializer=myservice__pb2.Message.SerializeToString,
             ),
+            'SubscribeEvents': grpc.unary_stream_rpc_method_handler(
+                    servicer.SubscribeEvents,
+                    request_deserializer=myservice__pb2.SubscriptionRequest.FromString,
+                    response_serializer=myservice__pb2.Event.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'MyService', rpc_method_handlers)
@@ -112,6 +182,87 @@ class MyService(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def ProcessBatch(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/MyService/ProcessBatch',
+            myservice__pb2.BatchRequest.SerializeToString,
+            myservice__pb2.BatchResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def ProcessRequestStream(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_unary(
+            request_iterator,
+            target,
+            '/MyService/ProcessRequestStream',
+            myservice__pb2.Request.SerializeToString,
+            myservice__pb2.BatchResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def StreamResponses(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/MyService/StreamResponses',
+            myservice__pb2.Request.SerializeToString,
+            myservice__pb2.Response.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
     @staticmethod
     def Subscribe(request,
             target,
@@ -138,3 +289,30 @@ class MyService(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def SubscribeEvents(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/MyService/SubscribeEvents',
+            myservice__pb2.SubscriptionRequest.SerializeToString,
+            myservice__pb2.Event.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
@@ -0,0 +1,98 @@
+"""Publish a Profile's events as typed events on a gRPC server's topic.
+
+Apps embedding a GrpcServer or AsyncGrpcServer use this to let their
+clients subscribe to messages and attachments being received and to
+correspondences being joined or archived.
+"""
+
+from threading import Thread
+
+from ..block_events import AttachmentReceived, BlockEvent, MessageReceived
+from ..change_feed import Change, ChangeType
+from ..endra_model import Profile
+from ..log import logger_endra as logger
+from . import myservice_pb2
+from .grpc_aio_server import AsyncGrpcServer
+from .grpc_server import GrpcServer
+
+# the topic profile events are published to by default
+DEFAULT_EVENTS_TOPIC = "endra-events"
+
+# how often the publisher checks whether it's been terminated, in seconds
+CHANGE_POLL_INTERVAL = 1
+
+
+def block_event_to_grpc(event: BlockEvent) -> myservice_pb2.Event | None:
+    """Convert a block event to a gRPC event, None if it has no counterpart."""
+    if isinstance(event, MessageReceived):
+        return myservice_pb2.Event(message_received=myservice_pb2.MessageReceived(
+            correspondence_id=event.correspondence_id,
+            message_id=event.message.id,
+        ))
+    if isinstance(event, AttachmentReceived):
+        return myservice_pb2.Event(attachment_received=myservice_pb2.AttachmentReceived(
+            correspondence_id=event.correspondence_id,
+            attachment_id=event.attachment_id,
+            media_type=event.attachment.media_type,
+        ))
+    return None
+
+
+def correspondence_change_to_grpc(change: Change) -> myservice_pb2.Event:
+    """Convert a change to a profile's correspondences to a gRPC event."""
+    if change.change_type == ChangeType.ADDED:
+        return myservice_pb2.Event(correspondence_joined=myservice_pb2.CorrespondenceJoined(
+            correspondence_id=change.key
+        ))
+    return myservice_pb2.Event(correspondence_archived=myservice_pb2.CorrespondenceArchived(
+        correspondence_id=change.key
+    ))
+
+
+class ProfileEventPublisher:
+    """Publishes a Profile's events on a gRPC server until terminated."""
+
+    def __init__(
+        self,
+        profile: Profile,
+        server: GrpcServer | AsyncGrpcServer,
+        topic: str = DEFAULT_EVENTS_TOPIC,
+    ) -> None:
+        self.profile = profile
+        self.server = server
+        self.topic = topic
+        self._running = True
+        self._subscription = profile.subscribe(
+            self._on_block_event, (MessageReceived, AttachmentReceived)
+        )
+        self._thread = Thread(
+            target=self._publish_correspondence_changes,
+            daemon=True,
+            name="EndraProfileEventPublisher",
+        )
+        self._thread.start()
+
+    def _on_block_event(self, event: BlockEvent) -> None:
+        grpc_event = block_event_to_grpc(event)
+        if grpc_event:
+            self.server.publish(self.topic, grpc_event)
+
+    def _publish_correspondence_changes(self) -> None:
+        changes_feed = self.profile.correspondence_changes
+        sequence = changes_feed.sequence
+        while self._running:
+            changes = changes_feed.wait_for_changes(sequence, CHANGE_POLL_INTERVAL)
+            if changes is None:
+                logger.warning(
+                    "Endra: missed correspondence changes for gRPC subscribers."
+                )
+                sequence = changes_feed.sequence
+                continue
+            for change in changes:
+                self.server.publish(self.topic, correspondence_change_to_grpc(change))
+                sequence = change.sequence
+
+    def terminate(self) -> None:
+        self._running = False
+        self.profile.unsubscribe(self._subscription)
+        self._thread.join()
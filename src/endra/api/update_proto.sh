@@ -0,0 +1,8 @@
+#!/bin/bash
+# Regenerate the Python gRPC code from myservice.proto.
+# Requires grpcio-tools: pip install grpcio-tools
+set -e
+cd "$(dirname "$0")"
+python -m grpc_tools.protoc -I. --python_out=. --grpc_python_out=. myservice.proto
+# the generated code imports its sibling module as a top-level module
+sed -i 's/^import myservice_pb2 as myservice__pb2$/from . import myservice_pb2 as myservice__pb2/' myservice_pb2_grpc.py
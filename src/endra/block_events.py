@@ -0,0 +1,290 @@
+"""Typed events for the blocks a profile's correspondences receive.
+
+Blocks arrive on the networking thread. Handling them there directly
+would make every consumer check topics and decode payloads on that thread,
+stalling block ingestion while they do.
+Instead, received blocks are processed in order on a thread of their own,
+e.g. to index them, then decoded on a worker pool and delivered as typed
+events to subscribers, each of which has a bounded queue and a thread of
+its own, so that slow handlers neither hold up block ingestion nor each other.
+"""
+
+import queue
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from enum import Enum
+from threading import Lock, Thread, current_thread
+from typing import Callable
+
+from walytis_mutability.mutablock import DELETION_BLOCK, ORIGINAL_BLOCK, UPDATE_BLOCK
+
+from .log import logger_endra as logger
+from .message import (
+    BLOCK_TOPIC_ATTACHMENTS,
+    BLOCK_TOPIC_CHUNKED_ATTACHMENTS,
+    BLOCK_TOPIC_MESSAGES,
+    ChunkedAttachment,
+    Message,
+    MessageAttachment,
+)
+
+# the number of threads decoding received blocks
+DECODE_WORKERS = 4
+# the number of events a subscriber can fall behind before events are dropped
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+
+class BlockKind(Enum):
+    MESSAGE = "message"
+    MESSAGE_EDIT = "message_edit"
+    MESSAGE_DELETION = "message_deletion"
+    ATTACHMENT = "attachment"  # normal or chunked
+
+
+def classify_block(topics: list[str]) -> BlockKind | None:
+    """Classify a received MutaBlockchain block by its topics.
+
+    Edits and deletions are classified as those of messages, as their
+    topics don't say what kind of block they modify.
+
+    Returns:
+        the kind of block, or `None` for blocks that don't produce events
+    """
+    if not topics:
+        return None
+    if topics[0] == UPDATE_BLOCK:
+        return BlockKind.MESSAGE_EDIT
+    if topics[0] == DELETION_BLOCK:
+        return BlockKind.MESSAGE_DELETION
+    if topics[0] != ORIGINAL_BLOCK:
+        return None
+    if BLOCK_TOPIC_MESSAGES in topics[1:]:
+        return BlockKind.MESSAGE
+    if (
+        BLOCK_TOPIC_ATTACHMENTS in topics[1:]
+        or BLOCK_TOPIC_CHUNKED_ATTACHMENTS in topics[1:]
+    ):
+        return BlockKind.ATTACHMENT
+    return None  # e.g. attachment chunks
+
+
+@dataclass(frozen=True)
+class BlockEvent:
+    correspondence_id: str
+
+
+@dataclass(frozen=True)
+class MessageReceived(BlockEvent):
+    message: Message
+
+
+@dataclass(frozen=True)
+class MessageEdited(BlockEvent):
+    message: Message  # with the edited content
+
+
+@dataclass(frozen=True)
+class MessageDeleted(BlockEvent):
+    message_id: bytes
+
+
+@dataclass(frozen=True)
+class AttachmentReceived(BlockEvent):
+    attachment_id: bytes
+    attachment: MessageAttachment | ChunkedAttachment
+
+
+class Subscription:
+    """Delivers events to a handler on a thread of its own.
+
+    Events are queued, so that delivering them never blocks the pipeline.
+    If the handler falls too far behind, new events are dropped.
+    """
+
+    _STOP = object()  # queued to stop the delivery thread
+
+    def __init__(
+        self,
+        handler: Callable[[BlockEvent], None],
+        event_types: tuple[type[BlockEvent], ...] | None = None,
+        correspondence_id: str | None = None,
+        max_queue_size: int = SUBSCRIBER_QUEUE_SIZE,
+    ):
+        """Create a subscription.
+
+        Args:
+            handler: the function to call with each event
+            event_types: the types of events to deliver, or `None` for all
+            correspondence_id: the correspondence to deliver events of,
+                or `None` for all
+            max_queue_size: the number of events the handler can fall behind
+                before events are dropped
+        """
+        self.handler = handler
+        self.event_types = event_types
+        self.correspondence_id = correspondence_id
+        self.num_dropped = 0  # number of events dropped because of a full queue
+        self._num_dropped_lock = Lock()
+        self._queue: queue.Queue = queue.Queue(max_queue_size)
+        self._thread = Thread(
+            target=self._run, daemon=True, name="EndraBlockEventSubscription"
+        )
+        self._thread.start()
+
+    def matches(self, event: BlockEvent) -> bool:
+        """Check whether the given event is one this subscription delivers."""
+        if self.event_types and not isinstance(event, self.event_types):
+            return False
+        return (
+            self.correspondence_id is None
+            or event.correspondence_id == self.correspondence_id
+        )
+
+    def deliver(self, event: BlockEvent) -> None:
+        """Queue an event for the handler, dropping it if the queue is full."""
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            with self._num_dropped_lock:
+                num_dropped = self.num_dropped
+                self.num_dropped += 1
+            if num_dropped % self._queue.maxsize == 0:
+                logger.warning(
+                    f"Endra: block event handler {self.handler} "
+                    "isn't keeping up with events, dropping events."
+                )
+
+    def _run(self) -> None:
+        while True:
+            event = self._queue.get()
+            if event is Subscription._STOP:
+                return
+            try:
+                self.handler(event)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logger.error(f"Endra: block event handler {self.handler} failed:\n{e}")
+
+    def terminate(self) -> None:
+        """Deliver the queued events, then stop."""
+        self._queue.put(Subscription._STOP)
+        if current_thread() is not self._thread:
+            self._thread.join()
+
+
+class BlockEventPipeline:
+    """Processes received blocks in order, decoding their events in parallel."""
+
+    _STOP = object()  # queued to stop the dispatching thread
+
+    def __init__(self, max_workers: int = DECODE_WORKERS):
+        # a single thread, so that blocks are processed in order
+        self._processor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="EndraBlockProcessor"
+        )
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="EndraBlockEventDecoder"
+        )
+        # decoding tasks, in the order the blocks were received
+        self._decoding: queue.Queue = queue.Queue()
+        self._subscriptions: list[Subscription] = []
+        self._lock = Lock()
+        self._terminating = False  # no longer processing new blocks
+        self._terminated = False  # no longer decoding new blocks
+        self._dispatcher_thread = Thread(
+            target=self._dispatch, daemon=True, name="EndraBlockEventDispatcher"
+        )
+        self._dispatcher_thread.start()
+
+    def process(self, process: Callable[[], None]) -> bool:
+        """Queue work on a received block, without waiting for it.
+
+        Blocks are processed one at a time in the order they are queued,
+        so that e.g. indexing a message's edits can't race.
+        To produce an event, `process` can `submit` the block for decoding.
+
+        Args:
+            process: processes the block; called on the processing thread
+        Returns:
+            whether the work was queued, which it isn't once terminating
+        """
+        with self._lock:
+            if self._terminating:
+                return False
+            self._processor.submit(self._run_process, process)
+            return True
+
+    def _run_process(self, process: Callable[[], None]) -> None:
+        try:
+            process()
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.error(f"Endra: failed to process received block:\n{e}")
+
+    def submit(self, decode: Callable[[], BlockEvent | None]) -> None:
+        """Queue a received block for decoding, without waiting for it.
+
+        Args:
+            decode: decodes the block into an event, or returns `None`
+                if it doesn't produce one; called on a worker thread
+        """
+        with self._lock:
+            if self._terminated:
+                return
+            self._decoding.put(self._executor.submit(decode))
+
+    def subscribe(
+        self,
+        handler: Callable[[BlockEvent], None],
+        event_types: tuple[type[BlockEvent], ...] | None = None,
+        correspondence_id: str | None = None,
+        max_queue_size: int = SUBSCRIBER_QUEUE_SIZE,
+    ) -> Subscription:
+        """Call a handler with the events of received blocks.
+
+        The handler is called on a thread of its own, with events in the
+        order their blocks were received. See `Subscription` for the args.
+        """
+        subscription = Subscription(
+            handler, event_types, correspondence_id, max_queue_size
+        )
+        with self._lock:
+            self._subscriptions = self._subscriptions + [subscription]
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscriptions = [
+                s for s in self._subscriptions if s is not subscription
+            ]
+        subscription.terminate()
+
+    def _dispatch(self) -> None:
+        while True:
+            decoding: Future = self._decoding.get()
+            if decoding is BlockEventPipeline._STOP:
+                return
+            try:
+                event = decoding.result()
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logger.error(f"Endra: failed to decode received block:\n{e}")
+                continue
+            if event is None:
+                continue
+            for subscription in self._subscriptions:
+                if subscription.matches(event):
+                    subscription.deliver(event)
+
+    def terminate(self) -> None:
+        """Deliver the events of the blocks received so far, then stop."""
+        with self._lock:
+            if self._terminating:
+                return
+            self._terminating = True
+        # processing the queued blocks may still submit them for decoding
+        self._processor.shutdown()
+        with self._lock:
+            self._terminated = True
+            self._decoding.put(BlockEventPipeline._STOP)
+        self._dispatcher_thread.join()
+        self._executor.shutdown()
+        for subscription in self._subscriptions:
+            subscription.terminate()
@@ -0,0 +1,109 @@
+"""Persistent index of a correspondence's blocks by topic.
+
+Maps each block topic to the IDs of the blocks carrying it, in arrival order,
+so that listing messages or attachments costs only the size of the result
+rather than a scan of the whole blockchain.
+
+The index is persisted as an append-only JSON-lines file, one line per block,
+so that recording a new block is O(1) and restarting only needs to index the
+blocks received while the index wasn't running.
+"""
+
+import json
+import os
+from threading import Lock
+
+from .log import logger_endra as logger
+
+
+class BlockIndex:
+    """Topic -> block IDs index, kept in arrival order."""
+
+    def __init__(self, index_path: str | None = None):
+        """Load or create a block index.
+
+        Args:
+            index_path: the file to persist the index in, or `None` to keep
+                the index in memory only
+        """
+        self.index_path = index_path
+        self._lock = Lock()
+        # block ID -> the block's topics, in arrival order
+        self._blocks: dict[bytes, list[str]] = {}
+        # topic -> block IDs in arrival order
+        self._topics: dict[str, list[bytes]] = {}
+        # topic -> {block ID: position in self._topics[topic]}
+        self._positions: dict[str, dict[bytes, int]] = {}
+        if self.index_path and os.path.exists(self.index_path):
+            self._load()
+
+    def _load(self) -> None:
+        with open(self.index_path, "r") as file:
+            for line in file:
+                try:
+                    block_id, topics = json.loads(line)
+                except ValueError:
+                    # tolerate a truncated last line after a crash
+                    logger.warning(
+                        f"BlockIndex: skipping corrupt entry in {self.index_path}"
+                    )
+                    continue
+                self._add(bytes.fromhex(block_id), topics)
+
+    def _add(self, block_id: bytes, topics: list[str]) -> bool:
+        if block_id in self._blocks:
+            return False
+        self._blocks[block_id] = topics
+        for topic in topics:
+            block_ids = self._topics.setdefault(topic, [])
+            self._positions.setdefault(topic, {})[block_id] = len(block_ids)
+            block_ids.append(block_id)
+        return True
+
+    def add_block(self, block_id: bytes | bytearray, topics: list[str]) -> None:
+        """Record a block, ignoring it if it is already indexed."""
+        block_id = bytes(block_id)
+        topics = list(topics)
+        with self._lock:
+            if not self._add(block_id, topics):
+                return
+            if self.index_path:
+                with open(self.index_path, "a") as file:
+                    file.write(json.dumps([block_id.hex(), topics]) + "\n")
+
+    def has_block(self, block_id: bytes | bytearray) -> bool:
+        """Check whether the given block has been indexed."""
+        return bytes(block_id) in self._blocks
+
+    def get_block_ids(self, topic: str) -> list[bytes]:
+        """Get the IDs of the blocks with the given topic in arrival order."""
+        with self._lock:
+            return list(self._topics.get(topic, []))
+
+    def get_position(self, topic: str, block_id: bytes | bytearray) -> int:
+        """Get the arrival position of a block among those with its topic.
+
+        Raises:
+            KeyError: if the block isn't indexed under the given topic
+        """
+        return self._positions.get(topic, {})[bytes(block_id)]
+
+    def slice_block_ids(
+        self, topic: str, start: int, stop: int | None = None
+    ) -> list[bytes]:
+        """Get a window of the IDs of the blocks with the given topic."""
+        with self._lock:
+            return self._topics.get(topic, [])[start:stop]
+
+    def count(self, topic: str) -> int:
+        """Get the number of blocks with the given topic."""
+        return len(self._topics.get(topic, []))
+
+    def __len__(self) -> int:
+        return len(self._blocks)
+
+    def delete(self) -> None:
+        """Delete the persisted index file."""
+        with self._lock:
+            if self.index_path and os.path.exists(self.index_path):
+                os.remove(self.index_path)
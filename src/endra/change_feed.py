@@ -0,0 +1,75 @@
+"""Incremental feed of changes to a profile's set of correspondences.
+
+Instead of fetching and diffing the whole set of active correspondences on
+every poll, UIs can remember the sequence number of the last change they saw
+and ask only for the changes since then.
+"""
+
+from collections import deque
+from dataclasses import dataclass
+from enum import Enum
+from threading import Condition
+
+# the number of changes a ChangeFeed remembers
+DEFAULT_FEED_LENGTH = 1000
+
+
+class ChangeType(Enum):
+    ADDED = "added"
+    REMOVED = "removed"
+
+
+@dataclass(frozen=True)
+class Change:
+    sequence: int  # increases by one with each change
+    change_type: ChangeType
+    key: str
+
+
+class ChangeFeed:
+    """A bounded, thread-safe log of changes with sequence numbers."""
+
+    def __init__(self, max_length: int = DEFAULT_FEED_LENGTH):
+        self._changes: deque[Change] = deque(maxlen=max_length)
+        self._sequence = 0  # the sequence number of the latest change
+        self._condition = Condition()
+
+    @property
+    def sequence(self) -> int:
+        """The sequence number of the latest change, 0 if there are none."""
+        return self._sequence
+
+    def add(self, change_type: ChangeType, key: str) -> Change:
+        with self._condition:
+            self._sequence += 1
+            change = Change(self._sequence, change_type, key)
+            self._changes.append(change)
+            self._condition.notify_all()
+        return change
+
+    def get_changes(self, since: int = 0) -> list[Change] | None:
+        """Get the changes after the given sequence number.
+
+        Returns:
+            the changes in order, or `None` if some of them have already been
+            forgotten, in which case the caller needs to reload the full state
+        """
+        with self._condition:
+            return self._get_changes(since)
+
+    def wait_for_changes(
+        self, since: int = 0, timeout: float | None = None
+    ) -> list[Change] | None:
+        """Like `get_changes`, but wait for changes if there are none yet."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._sequence > since, timeout)
+            return self._get_changes(since)
+
+    def _get_changes(self, since: int) -> list[Change] | None:
+        if since >= self._sequence:
+            return []
+        num_changes = self._sequence - since
+        if num_changes > len(self._changes):
+            return None
+        return list(self._changes)[-num_changes:]
+
@@ -12,25 +12,365 @@ to subscribed applications.
 from .log import logger_endra as logger
 import json
 import os
+import queue
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from threading import Lock, Thread
 from types import ModuleType
+from typing import Callable
 
 
 from brenthy_tools_beta.utils import (
+    bytes_to_string,
     function_name,
     load_module_from_path,
+    string_to_bytes,
 )
 from brenthy_tools_beta.version_utils import decode_version, encode_version
 from brenthy_tools_beta.versions import BRENTHY_CORE_VERSION
+from .message import (
+    decode_attachment,
+    decode_message,
+    encode_attachment,
+    encode_message,
+)
 
 # list of files and folders in the brenthy_api_protocols folder
 # which are not BrenthyAPI protocol modules
 BAP_EXCLUDED_MODULES = ["__init__.py", "__main__.py", "__pycache__", ".tmp"]
 bap_protocol_modules: list[ModuleType] = []
 
+# the number of requests processed in parallel
+REQUEST_WORKERS = 16
+
+NOT_UNDERSTOOD_ERROR = "not understood"
+NO_SUCH_PROFILE_ERROR = "no such profile"
+NO_SUCH_CORRESPONDENCE_ERROR = "no such correspondence"
+INVALID_REQUEST_ERROR = "invalid request"
+
+# the maximum length of the function names in requests
+MAX_FUNCTION_NAME_LENGTH = 64
+
+# the maximum number of events waiting to be published per BAP protocol
+EVENT_QUEUE_SIZE = 10000
+# how long to wait for more events to publish them together, in seconds
+EVENT_BATCH_WINDOW = 0.01
+# the maximum number of events published together
+EVENT_BATCH_SIZE = 500
+
+# the profiles served to apps, by DID
+profiles: dict[str, Profile] = {}
+# serialises the requests that modify a profile
+_profile_locks: dict[str, Lock] = {}
+_profiles_lock = Lock()
+
+# created on the first request, shut down by terminate()
+_request_executor: ThreadPoolExecutor | None = None
+_request_executor_lock = Lock()
+
+
+def register_profile(profile: Profile) -> None:
+    """Serve a profile to apps via BrenthyAPI."""
+    with _profiles_lock:
+        profiles[profile.did] = profile
+        _profile_locks.setdefault(profile.did, Lock())
+
+
+def unregister_profile(profile_did: str) -> None:
+    """Stop serving a profile to apps via BrenthyAPI."""
+    with _profiles_lock:
+        profiles.pop(profile_did, None)
+        _profile_locks.pop(profile_did, None)
+
+
+def _get_profile(data: dict) -> tuple[Profile, Lock] | None:
+    """Get the profile a request is for, and the lock for modifying it.
+
+    Requests specify the profile by its DID as `profile_did`,
+    which is optional if only one profile is served.
+    """
+    with _profiles_lock:
+        profile_did = data.get("profile_did")
+        if profile_did is None and len(profiles) == 1:
+            profile_did = next(iter(profiles))
+        profile = profiles.get(profile_did)
+        if profile is None:
+            return None
+        return profile, _profile_locks[profile_did]
+
+
+def _decode_string(value: object) -> str:
+    if not isinstance(value, str):
+        raise TypeError(f"Expected a string, not {type(value).__name__}")
+    return value
+
+
+def _decode_bytes(value: object) -> bytes:
+    return bytes(string_to_bytes(_decode_string(value)))
+
+
+def _decode_int(value: object) -> int:
+    # bool is a subclass of int, but JSON's true and false aren't numbers
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise TypeError(f"Expected an integer, not {type(value).__name__}")
+    return value
+
+
+# how each request parameter is decoded from its JSON value,
+# raising LookupError, TypeError or ValueError if it is invalid
+PARAMETER_DECODERS: dict[str, Callable[[object], object]] = {
+    "correspondence_id": _decode_string,
+    "invitation": _decode_string,
+    "before": _decode_bytes,
+    "limit": _decode_int,
+    "content": lambda value: decode_message(_decode_bytes(value)),
+    "attachment_id": _decode_bytes,
+    "attachment": lambda value: decode_attachment(_decode_bytes(value)),
+}
+
+
+def get_profile_did(profile: Profile, params: dict) -> dict:
+    return {"profile_did": profile.did}
+
+
+def get_devices(profile: Profile, params: dict) -> dict:
+    return {"devices": list(profile.get_devices())}
+
+
+def get_active_correspondences(profile: Profile, params: dict) -> dict:
+    return {"correspondence_ids": list(profile.get_active_correspondences())}
+
+
+def get_archived_correspondences(profile: Profile, params: dict) -> dict:
+    return {"correspondence_ids": list(profile.get_archived_correspondences())}
+
+
+def create_correspondence(profile: Profile, params: dict) -> dict:
+    return {"correspondence_id": profile.create_correspondence().id}
+
+
+def join_correspondence(profile: Profile, params: dict) -> dict:
+    correspondence = profile.join_correspondence(params["invitation"])
+    return {"correspondence_id": correspondence.id}
+
 
+def archive_correspondence(profile: Profile, params: dict) -> dict:
+    profile.archive_correspondence(params["correspondence_id"])
+    return {}
 
-def request_router(request:bytearray):
-    pass
+
+def create_correspondence_invitation(profile: Profile, params: dict) -> dict:
+    correspondence = profile.get_correspondence(params["correspondence_id"])
+    return {"invitation": correspondence.create_invitation()}
+
+
+def get_num_messages(profile: Profile, params: dict) -> dict:
+    correspondence = profile.get_correspondence(params["correspondence_id"])
+    return {"num_messages": correspondence.get_num_messages()}
+
+
+def get_messages(profile: Profile, params: dict) -> dict:
+    """Get a window of messages, encoded with endra.message.encode_message."""
+    correspondence = profile.get_correspondence(params["correspondence_id"])
+    messages = correspondence.get_messages(
+        before=params.get("before") or None,
+        limit=params.get("limit"),
+    )
+    return {
+        "messages": [
+            {
+                "message_id": bytes_to_string(message.id),
+                "content": bytes_to_string(encode_message(message.content)),
+            }
+            for message in messages
+        ]
+    }
+
+
+def add_message(profile: Profile, params: dict) -> dict:
+    correspondence = profile.get_correspondence(params["correspondence_id"])
+    correspondence.add_message(params["content"])
+    return {}
+
+
+def get_attachment_metadata(profile: Profile, params: dict) -> dict:
+    correspondence = profile.get_correspondence(params["correspondence_id"])
+    attachment = correspondence.get_attachment_metadata(params["attachment_id"])
+    return {
+        "media_type": attachment.media_type,
+        "payload_hash": attachment.payload_hash,
+        "size": attachment.size,
+        "derived_properties": attachment.derived_properties,
+        "user_attributes": attachment.user_attributes,
+    }
+
+
+def get_attachment(profile: Profile, params: dict) -> dict:
+    """Get an attachment, encoded with endra.message.encode_attachment."""
+    correspondence = profile.get_correspondence(params["correspondence_id"])
+    attachment = correspondence.get_attachment(params["attachment_id"])
+    return {"attachment": bytes_to_string(encode_attachment(attachment))}
+
+
+def add_attachment(profile: Profile, params: dict) -> dict:
+    correspondence = profile.get_correspondence(params["correspondence_id"])
+    attachment_id = correspondence.add_attachment(params["attachment"])
+    return {"attachment_id": bytes_to_string(attachment_id)}
+
+
+@dataclass
+class RequestHandler:
+    # takes the profile and the request's decoded parameters,
+    # returns the reply data
+    function: Callable[[Profile, dict], dict]
+    # the names of the parameters the request must have
+    parameters: tuple[str, ...] = ()
+    # the names of the parameters the request may have
+    optional_parameters: tuple[str, ...] = ()
+    # whether the request modifies the profile, so that it must not run
+    # concurrently with other modifying requests for the same profile
+    modifies: bool = False
+
+    def decode_parameters(self, data: dict) -> dict:
+        """Decode and validate the request's parameters.
+
+        Raises:
+            LookupError, TypeError, ValueError: if a parameter is missing
+                or invalid
+        """
+        params = {}
+        for name in self.parameters:
+            if name not in data:
+                raise KeyError(f"Missing parameter: {name}")
+            params[name] = PARAMETER_DECODERS[name](data[name])
+        for name in self.optional_parameters:
+            if data.get(name) is not None:
+                params[name] = PARAMETER_DECODERS[name](data[name])
+        return params
+
+
+# the function names apps can call, encoded as they are in requests
+REQUEST_HANDLERS: dict[bytes, RequestHandler] = {
+    name.encode(): handler
+    for name, handler in {
+        "get_profile_did": RequestHandler(get_profile_did),
+        "get_devices": RequestHandler(get_devices),
+        "get_active_correspondences": RequestHandler(get_active_correspondences),
+        "get_archived_correspondences": RequestHandler(
+            get_archived_correspondences
+        ),
+        "create_correspondence": RequestHandler(
+            create_correspondence, modifies=True
+        ),
+        "join_correspondence": RequestHandler(
+            join_correspondence, ("invitation",), modifies=True
+        ),
+        "archive_correspondence": RequestHandler(
+            archive_correspondence, ("correspondence_id",), modifies=True
+        ),
+        "create_correspondence_invitation": RequestHandler(
+            create_correspondence_invitation, ("correspondence_id",)
+        ),
+        "get_num_messages": RequestHandler(
+            get_num_messages, ("correspondence_id",)
+        ),
+        "get_messages": RequestHandler(
+            get_messages, ("correspondence_id",), ("before", "limit")
+        ),
+        "add_message": RequestHandler(
+            add_message, ("correspondence_id", "content"), modifies=True
+        ),
+        "get_attachment_metadata": RequestHandler(
+            get_attachment_metadata, ("correspondence_id", "attachment_id")
+        ),
+        "get_attachment": RequestHandler(
+            get_attachment, ("correspondence_id", "attachment_id")
+        ),
+        "add_attachment": RequestHandler(
+            add_attachment, ("correspondence_id", "attachment"), modifies=True
+        ),
+    }.items()
+}
+
+
+def _encode_reply(reply: dict) -> bytes:
+    return json.dumps(reply).encode()
+
+
+def request_router(request: bytearray | memoryview) -> bytes:
+    """Process a request from an app, passing it to its handler.
+
+    Requests consist of the name of the function to call,
+    a null byte, and the function's parameters as JSON.
+    Replies are JSON, with `success` indicating whether the call succeeded.
+    The parameters are validated before the handler is called,
+    so errors raised by the handler propagate as internal errors.
+    """
+    request = memoryview(request)
+    # function names are short, so search only the start of the request
+    separator = bytes(request[:MAX_FUNCTION_NAME_LENGTH + 1]).find(0)
+    if separator == -1:
+        return _encode_reply({"success": False, "error": NOT_UNDERSTOOD_ERROR})
+    handler = REQUEST_HANDLERS.get(bytes(request[:separator]))
+    if handler is None:
+        logger.warning(
+            "Endra BrenthyAPI: Received request that was not understood: "
+            f"{bytes(request[:separator])}"
+        )
+        return _encode_reply({"success": False, "error": NOT_UNDERSTOOD_ERROR})
+    payload = request[separator + 1 :]
+    try:
+        # decode the view directly rather than copying it to bytes first
+        data = json.loads(str(payload, "utf-8")) if payload else {}
+        if not isinstance(data, dict):
+            raise TypeError("Request parameters must be a JSON object.")
+        profile_did = data.get("profile_did")
+        if profile_did is not None:
+            _decode_string(profile_did)
+        params = handler.decode_parameters(data)
+    # missing or malformed parameters, e.g. invalid JSON or base64
+    except (LookupError, TypeError, ValueError) as e:
+        # log only the error, as requests can hold private message content
+        logger.warning(
+            "Endra BrenthyAPI: Received invalid request for "
+            f"{bytes(request[:separator])}: {type(e).__name__}: {e}"
+        )
+        return _encode_reply({"success": False, "error": INVALID_REQUEST_ERROR})
+
+    profile_and_lock = _get_profile(data)
+    if profile_and_lock is None:
+        return _encode_reply({"success": False, "error": NO_SUCH_PROFILE_ERROR})
+    profile, profile_lock = profile_and_lock
+    if (
+        "correspondence_id" in params
+        and params["correspondence_id"]
+        not in profile.get_active_correspondences()
+    ):
+        return _encode_reply(
+            {"success": False, "error": NO_SUCH_CORRESPONDENCE_ERROR}
+        )
+    if handler.modifies:
+        with profile_lock:
+            reply = handler.function(profile, params)
+    else:
+        reply = handler.function(profile, params)
+    return _encode_reply({"success": True, **reply})
+
+
+def submit_request(request: bytearray) -> "Future[bytearray]":
+    """Handle a BrenthyAPI request on the worker pool.
+
+    Lets listeners process many requests concurrently without
+    dedicating a thread of their own to each one.
+    """
+    global _request_executor  # pylint: disable=global-statement
+    with _request_executor_lock:
+        if _request_executor is None:
+            _request_executor = ThreadPoolExecutor(
+                max_workers=REQUEST_WORKERS, thread_name_prefix="EndraBrenthyAPI"
+            )
+        return _request_executor.submit(handle_request, request)
 
 
 
@@ -43,22 +383,27 @@ def handle_request(request: bytearray) -> bytearray:
     """
     # try to decapsulate request and pass it on to its destination
     try:
-        # extract brenthy_tools version
+        # extract brenthy_tools version, slicing a view to avoid copying
+        # the request
+        separator = request.index(0)
+        view = memoryview(request)
         brenthy_tools_version = decode_version(  # pylint: disable=unused-variable
-            request[: request.index(bytearray([0]))]
+            bytes(view[:separator])
         )
-        request = request[request.index(bytearray([0])) + 1:]
 
-
-        # forward request to its destination blockchain type or brenthy
-        reply = request_router(request)
+        # forward request to its destination blockchain type or brenthy,
+        # bytearray([1]) signals that we processed the request,
+        # whether or not the call succeeded
+        reply = bytearray([1]) + request_router(view[separator + 1 :])
 
     except Exception as e:  # pylint: disable=broad-exception caught
+        # log only the request's size, as requests can hold private
+        # message content
         logger.error(
-            f"Unhandled Exception in api_terminal.{function_name()}:\n"
-            f"{str(request)}\n{e}"
+            f"Unhandled Exception in api_terminal.{function_name()} "
+            f"for a request of {len(request)} bytes:\n{e}"
         )
-        # bytearray([0]) signals failure
+        # bytearray([0]) signals that we failed to process the request
         reply = (
             bytearray([0])
             + json.dumps({
@@ -107,13 +452,112 @@ def publish_event(payload: dict, topics: list | None = None
     for topic in topics:
         data = {"topic": topic}
         data.update(payload)
-        logger.info(f"api_terminal.publish_event: {topic}")
+        logger.debug(f"api_terminal.publish_event: {topic}")
         publish_on_all_endpoints(data)
 
 
+class EventPublisher:
+    """Publishes events via a BAP protocol module on a thread of its own.
+
+    Events are queued, so that publishing never blocks the caller
+    and a slow protocol doesn't hold up the others.
+    Events that arrive in quick succession are published as a batch.
+    """
+
+    _STOP = object()  # queued to stop the publishing thread
+
+    def __init__(self, protocol: ModuleType):
+        self.protocol = protocol
+        self._queue: queue.Queue = queue.Queue(EVENT_QUEUE_SIZE)
+        self.num_dropped = 0  # number of events dropped because of a full queue
+        self._num_dropped_lock = Lock()  # events are published from any thread
+        self._thread = Thread(
+            target=self._run, daemon=True, name="EndraEventPublisher"
+        )
+        self._thread.start()
+
+    def publish(self, data: dict) -> None:
+        """Queue an event for publishing, dropping it if the queue is full."""
+        try:
+            self._queue.put_nowait(data)
+        except queue.Full:
+            with self._num_dropped_lock:
+                num_dropped = self.num_dropped
+                self.num_dropped += 1
+            if num_dropped % EVENT_QUEUE_SIZE == 0:
+                logger.warning(
+                    f"api_terminal: BAP protocol {self.protocol.BAP_VERSION} "
+                    "isn't keeping up with events, dropping events."
+                )
+
+    def _run(self) -> None:
+        while True:
+            data = self._queue.get()
+            if data is EventPublisher._STOP:
+                return
+            batch = [data]
+            stop = False
+            deadline = time.monotonic() + EVENT_BATCH_WINDOW
+            while len(batch) < EVENT_BATCH_SIZE:
+                try:
+                    data = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if data is EventPublisher._STOP:
+                    stop = True
+                    break
+                batch.append(data)
+            self._publish_batch(batch)
+            if stop:
+                return
+
+    def _publish_batch(self, batch: list[dict]) -> None:
+        """Publish events, in one call if the protocol supports batches."""
+        try:
+            if hasattr(self.protocol, "publish_batch"):
+                self.protocol.publish_batch(batch)
+            else:
+                for data in batch:
+                    self.protocol.publish(data)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.error(
+                f"Unhandled Exception in api_terminal.{function_name()}:\n{e}"
+            )
+
+    def terminate(self) -> None:
+        """Publish the queued events, then stop."""
+        self._queue.put(EventPublisher._STOP)
+        self._thread.join()
+
+
+_event_publishers: dict[int, EventPublisher] = {}
+_event_publishers_lock = Lock()
+
+
+def _get_event_publishers() -> list[EventPublisher]:
+    """Get the event publishers of the loaded BAP protocols."""
+    with _event_publishers_lock:
+        for protocol in bap_protocol_modules:
+            if id(protocol) not in _event_publishers:
+                _event_publishers[id(protocol)] = EventPublisher(protocol)
+        return [
+            _event_publishers[id(protocol)] for protocol in bap_protocol_modules
+        ]
+
+
+def stop_event_publishers() -> None:
+    """Publish all queued events, then stop the publishing threads."""
+    with _event_publishers_lock:
+        publishers = list(_event_publishers.values())
+        _event_publishers.clear()
+    for publisher in publishers:
+        publisher.terminate()
+
+
 def load_brenthy_api_protocols() -> None:  # pylint: disable=unused-variable
     """Load the BrenthyAPI modules."""
     global bap_protocol_modules  # pylint: disable=global-statement
+    stop_event_publishers()
     bap_protocol_modules = []
     protocols_path = os.path.join(
         os.path.dirname(__file__), "brenthy_api_protocols"
@@ -145,12 +589,21 @@ def start_listening_for_requests() -> None:
 
 
 def publish_on_all_endpoints(data: dict) -> None:
-    """Publish a message using all BrenthyAPI modules."""
-    for protocol in bap_protocol_modules:
-        protocol.publish(data)
+    """Publish a message using all BrenthyAPI modules.
+
+    Returns immediately, each module publishes on its own thread.
+    """
+    for publisher in _get_event_publishers():
+        publisher.publish(data)
 
 
 def terminate() -> None:  # pylint: disable=unused-variable
     """Shut down BrenthyAPI communications, cleaning up resources."""
+    global _request_executor  # pylint: disable=global-statement
+    stop_event_publishers()
     for protocol in bap_protocol_modules:
         protocol.terminate()
+    with _request_executor_lock:
+        if _request_executor is not None:
+            _request_executor.shutdown(wait=False, cancel_futures=True)
+            _request_executor = None
@@ -1,16 +1,19 @@
-from typing import Callable
+from typing import Callable, Generator
 from walytis_identities.generics import GroupDidManagerWrapper
 from walytis_identities.did_manager_blocks import get_info_blocks
 from walytis_beta_embedded import Blockchain, join_blockchain, JoinFailureError
 from walytis_identities.did_manager import did_from_blockchain_id
-from threading import Lock, Event
+from threading import Condition, Lock, Event, RLock
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait
+import time
 from walytis_identities.did_manager import blockchain_id_from_did
 import os
+import weakref
 from walytis_beta_embedded import decode_short_id
-from brenthy_tools_beta.utils import bytes_to_string
+from brenthy_tools_beta.utils import bytes_to_string, string_to_bytes
 from walytis_offchain import PrivateBlockchain, DataBlock
 from walytis_identities.key_objects import Key
-from walytis_identities.did_manager_blocks import InfoBlock
+from walytis_identities.did_manager_blocks import InfoBlock, SuperRegistrationBlock
 from walytis_identities.group_did_manager import GroupDidManager
 from walytis_mutability import MutaBlockchain, MutaBlock
 from walytis_identities import DidManager
@@ -22,35 +25,551 @@ from walytis_identities.key_store import KeyStore
 from walytis_beta_embedded import Block
 from walytis_identities.utils import logger
 from walytis_identities import DidManagerWithSupers
+from walytis_mutability.mutablock import ORIGINAL_BLOCK, UPDATE_BLOCK, DELETION_BLOCK
+from .activation_manager import ActivationManager
+from .block_events import (
+    AttachmentReceived,
+    BlockEvent,
+    BlockEventPipeline,
+    BlockKind,
+    MessageDeleted,
+    MessageEdited,
+    MessageReceived,
+    Subscription,
+    classify_block,
+)
+from .change_feed import ChangeFeed, ChangeType
+from .block_index import BlockIndex
+from .search_index import (
+    SearchIndex,
+    SearchHit,
+    get_message_text,
+    iter_top_hits,
+    search_index_file,
+    DEFAULT_SEARCH_LIMIT,
+)
 from .message import (
     get_message_content_parts,
+    resolve_message_content_parts,
+    decode_attachment_block,
+    load_attachment_metadata,
+    decoded_cache,
+    LazyMessageAttachment,
     Message,
     MessageContent,
     MessageAttachment,
+    ChunkedAttachment,
     encode_attachment,
+    encode_chunked_attachment,
     encode_message,
-    decode_attachment,
+    decode_attachment_metadata,
+    decode_chunked_attachment,
     decode_message,
+    iter_chunks,
+    get_payload_size,
+    hash_payload,
+    PayloadHasher,
+    DEFAULT_CHUNK_SIZE,
+    ProgressHandler,
+    PayloadSource,
     BLOCK_TOPIC_MESSAGES,
     BLOCK_TOPIC_ATTACHMENTS,
+    BLOCK_TOPIC_CHUNKED_ATTACHMENTS,
+    BLOCK_TOPIC_ATTACHMENT_CHUNKS,
 )  # noqa
 
 WALYTIS_BLOCK_TOPIC = "Endra"
 
+# the number of correspondences caught up concurrently when loading lazily
+STARTUP_WORKERS = 4
+# the number of correspondences searched concurrently by Profile.search
+SEARCH_WORKERS = 8
+
+
+def get_appdata_path(key_store_path: str, name: str, extension: str = "jsonl") -> str:
+    """Get the path of a file Endra stores next to a correspondence's KeyStore."""
+    return os.path.splitext(key_store_path)[0] + f"_endra_{name}.{extension}"
+
+
+def get_key_store_path(key_store_dir: str, corresp_id: str) -> str:
+    """Get the path of a correspondence's KeyStore, named as by DidManagerWithSupers.
+
+    For correspondences that aren't loaded, e.g. archived ones.
+    """
+    return os.path.join(key_store_dir, blockchain_id_from_did(corresp_id) + ".json")
+
 
 class CorrespondenceDidManager(GroupDidManagerWrapper):
-    def __init__(self, did_manager: GroupDidManager):
+    # whether to open the blockchain stack, catching up with missed blocks,
+    # on initialisation, or to leave that to `load_missed_blocks`,
+    # the first access or the first incoming block
+    auto_load_missed_blocks = True
+
+    def __init__(
+        self,
+        did_manager: GroupDidManager,
+        activation_manager: ActivationManager | None = None,
+    ):
+        """Wrap a correspondence's GroupDidManager.
+
+        Args:
+            did_manager: the correspondence's GroupDidManager
+            activation_manager: if set, the blockchain stack is only opened
+                when needed, and closed again when the manager decides
+        """
         self._org_did_manager = did_manager
-        self._did_manager = MutaBlockchain(PrivateBlockchain(did_manager))
+        self._block_received_handler: Callable[[Block], None] | None = None
+        # set by the Profile, to decode received blocks into typed events
+        self.block_event_pipeline: BlockEventPipeline | None = None
+        self.activation_manager = activation_manager
+        self._activation_lock = RLock()
+        # notified when blocks finish being handled or deactivating finishes
+        self._activation_changed = Condition(self._activation_lock)
+        # the blockchain stack and indexes, only while active
+        self._private_blockchain: PrivateBlockchain | None = None
+        self._did_manager: MutaBlockchain | None = None
+        self._block_index: BlockIndex | None = None
+        self._attachment_hash_index: BlockIndex | None = None
+        self._search_index: SearchIndex | None = None
+        # whether messages received before the search index existed are indexed
+        self._search_index_updated = False
+        # the number of blocks the blockchain stack is handling
+        self._num_blocks_handling = 0
+        # whether the blockchain stack is being closed
+        self._deactivating = False
+        # blocks the blockchain stack received while being closed
+        self._blocks_received_while_deactivating: list[Block] = []
+        if activation_manager or not self.auto_load_missed_blocks:
+            self._org_did_manager.block_received_handler = (
+                self._on_block_received_while_inactive
+            )
+        else:
+            self._activate()
+
+    @classmethod
+    def create(
+        cls,
+        group_key_store: KeyStore | str,
+        member: GroupDidManager | KeyStore,
+        other_blocks_handler: Callable[[Block], None] | None = None,
+        activation_manager: ActivationManager | None = None,
+    ) -> "CorrespondenceDidManager":
+        did_manager = GroupDidManager.create(
+            group_key_store=group_key_store,
+            member=member,
+            other_blocks_handler=other_blocks_handler,
+        )
+        return cls(did_manager, activation_manager)
+
+    @classmethod
+    def join(
+        cls,
+        invitation: str | dict,
+        group_key_store: KeyStore | str,
+        member: GroupDidManager,
+        other_blocks_handler: Callable[[Block], None] | None = None,
+        activation_manager: ActivationManager | None = None,
+    ) -> "CorrespondenceDidManager":
+        did_manager = GroupDidManager.join(
+            invitation=invitation,
+            group_key_store=group_key_store,
+            member=member,
+            other_blocks_handler=other_blocks_handler,
+        )
+        return cls(did_manager, activation_manager)
+
+    def set_activation_manager(self, activation_manager: ActivationManager) -> None:
+        """Have an activation manager close our blockchain stack when unused.
+
+        For correspondences DidManagerWithSupers constructs,
+        which it can't pass an activation manager to.
+        """
+        with self._activation_lock:
+            self.activation_manager = activation_manager
+            if self.is_active:
+                activation_manager.touch(self)
+
+    def _activate(self) -> None:
+        """Open the blockchain stack and indexes, catching up with missed blocks."""
+        self._private_blockchain = PrivateBlockchain(self._org_did_manager)
+        self._did_manager = MutaBlockchain(self._private_blockchain)
+        self._block_index = BlockIndex(self._get_appdata_path("index"))
+        # payload hash -> attachment ID, for deduplicating attachments
+        self._attachment_hash_index = BlockIndex(
+            self._get_appdata_path("attachment_hashes")
+        )
+        self._search_index = SearchIndex(self._get_appdata_path("search", "sqlite"))
+        self._search_index_updated = False
+        self._did_manager.block_received_handler = self._on_stack_block_received
+        self._update_block_index()
+
+    def activate(self) -> MutaBlockchain:
+        """Make sure the blockchain stack is open, returning it."""
+        with self._activation_lock:
+            # the GroupDidManager is only reloaded once deactivating finishes
+            self._activation_changed.wait_for(lambda: not self._deactivating)
+            if self._did_manager is None:
+                self._activate()
+            if self.activation_manager:
+                # holding our lock, so that the activation manager can't
+                # deactivate us between our activation and this
+                self.activation_manager.touch(self)
+            return self._did_manager
+
+    def deactivate(self) -> None:
+        """Close the blockchain stack, reloading only the GroupDidManager.
+
+        It is reopened on the next access or incoming block.
+        """
+        self._deactivate(only_if_unused=False)
+
+    def deactivate_if_unused(self) -> None:
+        """Deactivate, unless used since the activation manager evicted us."""
+        self._deactivate(only_if_unused=True)
+
+    def _deactivate(self, only_if_unused: bool) -> None:
+        with self._activation_lock:
+            # closing the stack waits for its threads,
+            # so let them finish handling blocks first
+            self._activation_changed.wait_for(
+                lambda: not self._num_blocks_handling and not self._deactivating
+            )
+            if self._did_manager is None:
+                return
+            if (
+                only_if_unused
+                and self.activation_manager
+                and self.activation_manager.is_active(self)
+            ):
+                return
+            if self.activation_manager:
+                self.activation_manager.remove(self)
+            did_manager = self._did_manager
+            search_index = self._search_index
+            self._private_blockchain = None
+            self._did_manager = None
+            self._block_index = None
+            self._attachment_hash_index = None
+            self._search_index = None
+            self._deactivating = True
+        try:
+            # not holding our lock, as the stack's threads may be waiting for it
+            self._terminate_stack(did_manager, terminate_member=False)
+            search_index.close()
+            self._org_did_manager = self._reload_group_did_manager()
+        finally:
+            with self._activation_lock:
+                self._deactivating = False
+                self._activation_changed.notify_all()
+                received_blocks = self._blocks_received_while_deactivating
+                self._blocks_received_while_deactivating = []
+        for block in received_blocks:
+            self._on_block_received_while_inactive(block)
+        # catches up with the blocks received while deactivating,
+        # activating us again if there are any
+        self._org_did_manager.load_missed_blocks()
+
+    def _terminate_stack(
+        self, did_manager: MutaBlockchain, terminate_member: bool
+    ) -> None:
+        if not terminate_member:
+            # PrivateBlockchain.terminate() terminates its members' DidManagers,
+            # which include our member's
+            member = self._org_did_manager.member_did_manager
+            did_manager.base_blockchain.members.pop(member.did, None)
+        did_manager.terminate(terminate_member=terminate_member)
+
+    def _reload_group_did_manager(self) -> GroupDidManager:
+        """Load a terminated GroupDidManager again, to receive blocks while inactive."""
+        key_store = self._org_did_manager.key_store
+        return GroupDidManager(
+            group_key_store=KeyStore(key_store.key_store_path, key_store.key),
+            member=self._org_did_manager.member_did_manager,
+            other_blocks_handler=self._on_block_received_while_inactive,
+            auto_load_missed_blocks=False,
+        )
 
     @property
-    def did_manager(self):
-        return self._did_manager
+    def is_active(self) -> bool:
+        return self._did_manager is not None
+
+    def _on_block_received_while_inactive(self, block: Block) -> None:
+        with self._activation_lock:
+            self.activate()
+            # the PrivateBlockchain is now the GroupDidManager's block handler
+            handle_block = self._org_did_manager.block_received_handler
+        # the stack didn't exist when the block arrived, so pass it on,
+        # MutaBlockchain ignoring it if the stack found it when loading
+        handle_block(block)
+
+    def _on_stack_block_received(self, block: Block) -> None:
+        with self._activation_lock:
+            if self._deactivating:
+                # handle it once we're done
+                self._blocks_received_while_deactivating.append(block)
+                return
+            was_deactivated = self._did_manager is None
+            if not was_deactivated:
+                self._num_blocks_handling += 1
+        if was_deactivated:
+            # the stack was closed before the block reached us
+            self._on_block_received_while_inactive(block)
+            return
+        try:
+            self._on_block_received(block)
+        finally:
+            self._finish_handling_block()
+
+    def _finish_handling_block(self) -> None:
+        """Let deactivating proceed once no more blocks are being handled."""
+        with self._activation_lock:
+            self._num_blocks_handling -= 1
+            self._activation_changed.notify_all()
+
+    def _get_appdata_path(self, name: str, extension: str = "jsonl") -> str:
+        return get_appdata_path(
+            self._org_did_manager.key_store.key_store_path, name, extension
+        )
+
+    def _update_block_index(self) -> None:
+        """Index the blocks we received while the index wasn't running."""
+        for block_id in self._did_manager.get_block_ids():
+            if not self._block_index.has_block(block_id):
+                block = self._did_manager.get_block(block_id)
+                self._block_index.add_block(block_id, block.topics)
+
+    def load_missed_blocks(self) -> None:
+        """Catch up with the blocks we missed while we were offline."""
+        with self._activation_lock:
+            was_active = self.is_active
+            # opening the blockchain stack catches up with them
+            private_blockchain = self._get_while_active("_private_blockchain")
+        if was_active:
+            private_blockchain.load_missed_blocks()
+
+    def get_last_activity(self) -> float:
+        """Get the time we last received a block, as a UNIX timestamp."""
+        try:
+            return os.path.getmtime(self._get_appdata_path("index"))
+        except OSError:
+            return 0
+
+    def update_search_index(self) -> None:
+        """Index the messages we received while the search index wasn't running."""
+        # holding our lock, so that the search index isn't closed meanwhile
+        with self._activation_lock:
+            if self._search_index_updated:
+                return
+            search_index = self.search_index
+            indexed_message_ids = search_index.get_message_ids()
+            for message_id in self.block_index.get_block_ids(BLOCK_TOPIC_MESSAGES):
+                if message_id not in indexed_message_ids:
+                    content_version = self.did_manager.get_block(
+                        message_id
+                    ).get_content_versions()[-1]
+                    self._index_message_text(
+                        message_id, content_version.content, content_version.type
+                    )
+            self._search_index_updated = True
+
+    def search_messages(
+        self, query: str, limit: int = DEFAULT_SEARCH_LIMIT
+    ) -> list[tuple[float, bytes]]:
+        """Search the message text index, without activating if inactive.
+
+        Returns:
+            relevance scores (higher is better) and message IDs,
+            most relevant first
+        """
+        with self._activation_lock:
+            if self._search_index is not None:
+                self.update_search_index()
+                return self._search_index.search_with_scores(query, limit)
+        return search_index_file(
+            self._get_appdata_path("search", "sqlite"), query, limit
+        )
+
+    def _index_message_text(
+        self, message_id: bytes, content: bytes, block_type: str
+    ) -> None:
+        """Index the text of a message's latest content version."""
+        if block_type == DELETION_BLOCK:
+            # keep deleted messages indexed without text, so they aren't
+            # mistaken for messages that haven't been indexed yet
+            self.search_index.add_message(message_id, "")
+            return
+        try:
+            text = get_message_text(decode_message(content))
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.warning(f"Endra: failed to index message text:\n{e}")
+            return
+        self.search_index.add_message(message_id, text)
+
+    def _on_block_received(self, block: Block) -> None:
+        # only original MutaBlocks are listed, updates & deletions aren't
+        if block.topics and block.topics[0] == ORIGINAL_BLOCK:
+            self.block_index.add_block(block.long_id, block.topics[1:])
+        if classify_block(block.topics):
+            if self.block_event_pipeline:
+                # off the networking thread, counting the block as being
+                # handled until then, so that we aren't deactivated meanwhile
+                with self._activation_lock:
+                    self._num_blocks_handling += 1
+                if not self.block_event_pipeline.process(
+                    lambda: self._process_queued_block(block)
+                ):
+                    self._finish_handling_block()
+            else:
+                self._process_received_block(block)
+        if self._block_received_handler:
+            self._block_received_handler(block)
+
+    def _process_queued_block(self, block: Block) -> None:
+        try:
+            self._process_received_block(block)
+        finally:
+            self._finish_handling_block()
+
+    def _process_received_block(self, block: Block) -> None:
+        """Index a received block's message text and queue its event."""
+        # holding our lock, so that the search index isn't closed meanwhile
+        with self._activation_lock:
+            block_kind = classify_block(block.topics)
+            if block.topics[0] == ORIGINAL_BLOCK:
+                if block_kind == BlockKind.MESSAGE:
+                    self._index_message_text(
+                        block.long_id, block.content, ORIGINAL_BLOCK
+                    )
+                self._queue_block_event(block_kind, block.long_id)
+                return
+            if len(block.topics) < 2:
+                return
+            message_id = bytes(
+                self.did_manager.verify_original(string_to_bytes(block.topics[1])).cv_id
+            )
+            try:
+                self.block_index.get_position(BLOCK_TOPIC_MESSAGES, message_id)
+            except KeyError:
+                return  # not a message
+            decoded_cache.invalidate(message_id)
+            self._index_message_text(message_id, block.content, block.topics[0])
+            self._queue_block_event(block_kind, message_id)
+
+    def _queue_block_event(self, block_kind: BlockKind, block_id: bytes) -> None:
+        """Have a received block decoded into an event on the pipeline's workers."""
+        if self.block_event_pipeline:
+            block_id = bytes(block_id)
+            self.block_event_pipeline.submit(
+                lambda: self._decode_block_event(block_kind, block_id)
+            )
+
+    def _decode_block_event(self, block_kind: BlockKind, block_id: bytes) -> BlockEvent:
+        if block_kind == BlockKind.MESSAGE_DELETION:
+            return MessageDeleted(self.did, block_id)
+        if block_kind == BlockKind.ATTACHMENT:
+            return AttachmentReceived(
+                self.did, block_id, decode_attachment_block(self, block_id)
+            )
+        message = Message.from_block(self.did_manager.get_block(block_id))
+        _ = message.content  # decode here rather than on the subscribers' threads
+        if block_kind == BlockKind.MESSAGE_EDIT:
+            return MessageEdited(self.did, message)
+        return MessageReceived(self.did, message)
+
+    def get_block_ids(self, topic: str | None = None) -> list[bytes]:
+        """Get the IDs of all blocks, or only those with the given topic."""
+        if topic is None:
+            return self.did_manager.get_block_ids()
+        return self.block_index.get_block_ids(topic)
+
+    @property
+    def did_manager(self) -> MutaBlockchain:
+        return self.activate()
+
+    @property
+    def block_index(self) -> BlockIndex:
+        return self._get_while_active("_block_index")
+
+    @property
+    def attachment_hash_index(self) -> BlockIndex:
+        return self._get_while_active("_attachment_hash_index")
+
+    @property
+    def search_index(self) -> SearchIndex:
+        return self._get_while_active("_search_index")
+
+    def _get_while_active(self, attribute: str):
+        """Get a part of the blockchain stack, activating it if needed.
+
+        It is closed when we're deactivated, which waits for the blocks
+        being handled and for whoever holds our lock.
+        """
+        with self._activation_lock:
+            self.activate()
+            return getattr(self, attribute)
 
     @property
     def org_did_manager(self):
         return self._org_did_manager
 
+    @property
+    def block_received_handler(self) -> Callable[[Block], None] | None:
+        return self._block_received_handler
+
+    @block_received_handler.setter
+    def block_received_handler(
+        self, block_received_handler: Callable[[Block], None]
+    ) -> None:
+        self._block_received_handler = block_received_handler
+
+    def clear_block_received_handler(self) -> None:
+        self._block_received_handler = None
+
+    def terminate(self, terminate_member: bool = True):
+        with self._activation_lock:
+            self._activation_changed.wait_for(
+                lambda: not self._num_blocks_handling and not self._deactivating
+            )
+            if self.activation_manager:
+                self.activation_manager.remove(self)
+            did_manager = self._did_manager
+            search_index = self._search_index
+        # not holding our lock, as the stack's threads may be waiting for it
+        if did_manager is None:
+            # PrivateBlockchain.terminate() would do this for us
+            self._org_did_manager.terminate(terminate_member=terminate_member)
+        else:
+            self._terminate_stack(did_manager, terminate_member)
+            search_index.close()
+
+    def delete(self, terminate_member: bool = True):
+        self.block_index.delete()
+        self.attachment_hash_index.delete()
+        self.search_index.delete()
+        if self.activation_manager:
+            self.activation_manager.remove(self)
+        GroupDidManagerWrapper.delete(self, terminate_member=terminate_member)
+
+
+class LazyCorrespondenceDidManager(CorrespondenceDidManager):
+    """A CorrespondenceDidManager that opens its blockchain stack only when needed."""
+
+    auto_load_missed_blocks = False
+
+
+def _has_metadata(
+    attachment: MessageAttachment | ChunkedAttachment,
+    media_type: str,
+    derived_properties: dict,
+    user_attributes: dict,
+) -> bool:
+    """Check whether an attachment has the given metadata."""
+    return (
+        attachment.media_type == media_type
+        and attachment.derived_properties == derived_properties
+        and attachment.user_attributes == user_attributes
+    )
+
 
 class Correspondence:
     def __init__(self, did_manager: CorrespondenceDidManager):
@@ -64,36 +583,415 @@ class Correspondence:
             encode_message(message_content), topics=BLOCK_TOPIC_MESSAGES
         )
 
-    def add_attachment(self, attachment: MessageAttachment) -> str:
-        """Returns the attachment ID."""
+    def add_attachment(self, attachment: MessageAttachment) -> bytes:
+        """Store an attachment, returning its ID.
+
+        The attachment's `payload_hash` is always calculated from its
+        payload, replacing any hash it was given.
+        If an attachment with the same payload, media type, derived
+        properties and user attributes is already stored in this
+        correspondence, it isn't stored again,
+        and the existing attachment's ID is returned instead.
+        """
+        attachment.payload_hash = attachment._calculate_hash()
+        for attachment_id in self._find_attachments(attachment.payload_hash):
+            if _has_metadata(
+                load_attachment_metadata(self._did_manager, attachment_id),
+                attachment.media_type,
+                attachment.derived_properties,
+                attachment.user_attributes,
+            ):
+                return attachment_id
         block = self._did_manager.add_block(
             encode_attachment(attachment),
             topics=[BLOCK_TOPIC_ATTACHMENTS, attachment.media_type],
         )
+        self._did_manager.attachment_hash_index.add_block(
+            block.long_id, [attachment.payload_hash]
+        )
         return bytes(block.long_id)
 
-    def get_messages(self) -> list[Message]:
+    def find_attachment(self, payload_hash: str) -> bytes | None:
+        """Get the ID of a stored attachment with the given payload hash.
+
+        Finds both normal and chunked attachments, whose payloads have been
+        checked to match the hash.
+        Returns None if no such attachment is stored in this correspondence.
+        """
+        attachment_ids = self._find_attachments(payload_hash)
+        return attachment_ids[0] if attachment_ids else None
+
+    def _find_attachments(self, payload_hash: str) -> list[bytes]:
+        """Get the IDs of the stored attachments with the given payload hash."""
+        if not payload_hash:
+            return []
+        self._update_attachment_hash_index()
+        return self._did_manager.attachment_hash_index.get_block_ids(payload_hash)
+
+    def _update_attachment_hash_index(self) -> None:
+        """Index the payload hashes of attachments not yet indexed.
+
+        Attachments received from other members are indexed lazily here
+        rather than on the block-received path, to avoid reading their
+        payloads on the networking thread.
+        Other members can claim any payload hash for their attachments,
+        so an attachment is only indexed under its hash if its payload
+        matches it, which is checked without decoding the payload.
+        """
+        hash_index = self._did_manager.attachment_hash_index
+        for topic in [BLOCK_TOPIC_ATTACHMENTS, BLOCK_TOPIC_CHUNKED_ATTACHMENTS]:
+            for block_id in self._did_manager.get_block_ids(topic):
+                if hash_index.has_block(block_id):
+                    continue
+                try:
+                    payload_hash = self._get_verified_payload_hash(block_id, topic)
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    # e.g. chunks not yet received, check again next time
+                    logger.warning(
+                        f"Endra: failed to check an attachment's payload hash:\n{e}"
+                    )
+                    continue
+                # index attachments without valid hashes too, to not check
+                # them again
+                hash_index.add_block(block_id, [payload_hash] if payload_hash else [])
+
+    def _get_verified_payload_hash(self, block_id: bytes, topic: str) -> str | None:
+        """Get an attachment's payload hash, None if its payload doesn't match.
+
+        Only hashes calculated with the default hashing algorithm are
+        accepted, as those are the ones we look attachments up by.
+        """
+        content = self._did_manager.get_block(block_id).content
+        if topic == BLOCK_TOPIC_CHUNKED_ATTACHMENTS:
+            manifest = decode_chunked_attachment(content)
+            payload_hash = manifest.payload_hash
+            payload = (
+                self._did_manager.get_block(chunk_id).content
+                for chunk_id in manifest.chunk_ids
+            )
+        else:
+            attachment = decode_attachment_metadata(content)
+            payload_hash = attachment.payload_hash
+            payload = attachment.get_payload_view()
+        if payload_hash and hash_payload(payload) == payload_hash:
+            return payload_hash
+        return None
+
+    def get_messages(
+        self, before: bytes | None = None, limit: int | None = None
+    ) -> list[Message]:
+        """Get this correspondence's messages in the order we received them.
+
+        The order is that of the local block index, i.e. the order in which
+        this device received the messages, which may differ from the order
+        in which they were sent.
+        Only the blocks of the requested window are loaded.
+
+        Args:
+            before: the ID of a message, to get only the messages received
+                before it
+            limit: the maximum number of messages to get, the most recently
+                received ones of the window are returned
+        Returns:
+            list[Message]: the requested messages, earliest received first
+        Raises:
+            ValueError: if `before` isn't the ID of a message of this
+                correspondence
+        """
+        block_index = self._did_manager.block_index
+        stop = self._get_message_position(block_index, before)
+        start = 0 if limit is None else max(stop - limit, 0)
+        return [
+            Message.from_block(self._did_manager.get_block(block_id))
+            for block_id in block_index.slice_block_ids(
+                BLOCK_TOPIC_MESSAGES, start, stop
+            )
+        ]
+
+    def iter_messages(
+        self,
+        reverse: bool = False,
+        before: bytes | None = None,
+        page_size: int = 50,
+    ) -> Generator[Message, None, None]:
+        """Iterate lazily through this correspondence's messages.
+
+        Messages are iterated in the order we received them, like
+        `get_messages`. Blocks are loaded page by page as the iteration
+        progresses.
+
+        Args:
+            reverse: iterate from the most recently received message backwards
+            before: the ID of a message, to iterate only over the messages
+                received before it
+            page_size: the number of message IDs to read from the index at once
+        Raises:
+            ValueError: if `before` isn't the ID of a message of this
+                correspondence
+        """
+        if reverse:
+            while True:
+                messages = self.get_messages(before=before, limit=page_size)
+                if not messages:
+                    return
+                for message in reversed(messages):
+                    yield message
+                before = messages[0].id
+        else:
+            block_index = self._did_manager.block_index
+            stop = self._get_message_position(block_index, before)
+            for start in range(0, stop, page_size):
+                for block_id in block_index.slice_block_ids(
+                    BLOCK_TOPIC_MESSAGES, start, min(start + page_size, stop)
+                ):
+                    yield Message.from_block(self._did_manager.get_block(block_id))
+
+    @staticmethod
+    def _get_message_position(block_index: BlockIndex, before: bytes | None) -> int:
+        """Get the index position of a pagination cursor, the end if None.
+
+        Raises:
+            ValueError: if `before` isn't the ID of an indexed message
+        """
+        if before is None:
+            return block_index.count(BLOCK_TOPIC_MESSAGES)
+        try:
+            return block_index.get_position(BLOCK_TOPIC_MESSAGES, before)
+        except KeyError:
+            raise ValueError(f"Unknown message ID: {bytes(before).hex()}") from None
+
+    def get_message(self, message_id: bytes) -> Message:
+        return Message.from_block(self._did_manager.get_block(message_id))
+
+    def get_num_messages(self) -> int:
+        return self._did_manager.block_index.count(BLOCK_TOPIC_MESSAGES)
+
+    def search(self, query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[Message]:
+        """Find the messages whose text contains all the words of a query.
+
+        Searches the text/* parts of the latest versions of messages.
+
+        Returns:
+            the matching messages, most relevant first
+        """
+        self._did_manager.update_search_index()
         return [
-            Message.from_block(block)
-            for block in self._did_manager.get_blocks()
-            if BLOCK_TOPIC_MESSAGES in block.topics
+            self.get_message(message_id)
+            for _, message_id in self._did_manager.search_messages(query, limit)
         ]
 
     def get_attachments(self) -> list[MessageAttachment]:
         return [
-            decode_attachment(block.content)
-            for block in self._did_manager.get_blocks()
-            if BLOCK_TOPIC_ATTACHMENTS in block.topics
+            decode_attachment_block(self._did_manager, block_id)
+            for block_id in self._did_manager.get_block_ids(
+                BLOCK_TOPIC_ATTACHMENTS
+            )
         ]
 
     def get_attachment(self, attachment_id: bytes) -> MessageAttachment:
-        return decode_attachment(self._did_manager.get_block(attachment_id).content)
+        return decode_attachment_block(self._did_manager, attachment_id)
+
+    def get_attachment_metadata(self, attachment_id: bytes) -> LazyMessageAttachment:
+        """Get an attachment without loading its payload until it's accessed.
+
+        Works for both normal and chunked attachments.
+        """
+        return load_attachment_metadata(self._did_manager, attachment_id)
+
+    def get_attachments_metadata(self) -> list[LazyMessageAttachment]:
+        """Get all attachments without loading their payloads."""
+        return [
+            load_attachment_metadata(self._did_manager, block_id)
+            for topic in [BLOCK_TOPIC_ATTACHMENTS, BLOCK_TOPIC_CHUNKED_ATTACHMENTS]
+            for block_id in self._did_manager.get_block_ids(topic)
+        ]
+
+    def add_chunked_attachment(
+        self,
+        media_type: str,
+        payload: PayloadSource,
+        derived_properties: dict | None = None,
+        user_attributes: dict | None = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        progress_handler: ProgressHandler | None = None,
+    ) -> bytes:
+        """Add a large attachment, storing its payload in fixed-size chunks.
+
+        The payload is streamed from its source one chunk at a time,
+        so memory usage is bounded by the chunk size.
+
+        Args:
+            media_type: the MIME type of the payload
+            payload: a file path, a bytes-like object,
+                or an iterable of bytes-like objects
+            derived_properties: metadata extracted from the payload
+            user_attributes: metadata defined by the user
+            chunk_size: the number of payload bytes per chunk block
+            progress_handler: called after each chunk is stored with the
+                number of bytes stored so far and the total size, if known
+        Returns:
+            bytes: the attachment ID, which is the ID of the manifest block
+                or, if an attachment with the same payload is already stored
+                in this correspondence, the existing attachment's ID
+        """
+        total_size = get_payload_size(payload)
+        if total_size is not None:
+            # the source can be read twice, so deduplicate before uploading
+            attachment_id = self._add_chunked_attachment_duplicate(
+                hash_payload(iter_chunks(payload, chunk_size)),
+                media_type,
+                derived_properties or {},
+                user_attributes or {},
+            )
+            if attachment_id:
+                if progress_handler:
+                    progress_handler(total_size, total_size)
+                return attachment_id
+        hasher = PayloadHasher()
+        chunk_ids = []
+        size = 0
+        for chunk in iter_chunks(payload, chunk_size):
+            hasher.update(chunk)
+            block = self._did_manager.add_block(
+                chunk, topics=BLOCK_TOPIC_ATTACHMENT_CHUNKS
+            )
+            chunk_ids.append(bytes(block.long_id))
+            size += len(chunk)
+            if progress_handler:
+                progress_handler(size, total_size)
+        payload_hash = hasher.get_hash()
+        manifest = ChunkedAttachment(
+            media_type=media_type,
+            payload_hash=payload_hash,
+            size=size,
+            derived_properties=derived_properties or {},
+            user_attributes=user_attributes or {},
+            chunk_size=chunk_size,
+            chunk_ids=chunk_ids,
+        )
+        block = self._did_manager.add_block(
+            encode_chunked_attachment(manifest),
+            topics=[BLOCK_TOPIC_CHUNKED_ATTACHMENTS, media_type],
+        )
+        self._did_manager.attachment_hash_index.add_block(
+            block.long_id, [payload_hash]
+        )
+        return bytes(block.long_id)
+
+    def _add_chunked_attachment_duplicate(
+        self,
+        payload_hash: str,
+        media_type: str,
+        derived_properties: dict,
+        user_attributes: dict,
+    ) -> bytes | None:
+        """Reuse a stored attachment with the same payload, if there is one.
+
+        Returns the ID of a stored attachment with the same payload and
+        metadata. Failing that, if a chunked attachment with the same payload
+        is stored, a manifest with the given metadata that refers to its
+        chunks is stored and its ID is returned, so that the chunks aren't
+        uploaded again.
+
+        Returns:
+            bytes: the ID of the attachment, or None if no stored attachment
+                has the same payload
+        """
+        attachment_ids = self._find_attachments(payload_hash)
+        for attachment_id in attachment_ids:
+            if _has_metadata(
+                load_attachment_metadata(self._did_manager, attachment_id),
+                media_type,
+                derived_properties,
+                user_attributes,
+            ):
+                return attachment_id
+        chunked_attachment_ids = set(
+            self._did_manager.get_block_ids(BLOCK_TOPIC_CHUNKED_ATTACHMENTS)
+        )
+        manifest_ids = [i for i in attachment_ids if i in chunked_attachment_ids]
+        if not manifest_ids:
+            return None
+        manifest = decode_attachment_block(self._did_manager, manifest_ids[0])
+        block = self._did_manager.add_block(
+            encode_chunked_attachment(
+                ChunkedAttachment(
+                    media_type=media_type,
+                    payload_hash=payload_hash,
+                    size=manifest.size,
+                    derived_properties=derived_properties,
+                    user_attributes=user_attributes,
+                    chunk_size=manifest.chunk_size,
+                    chunk_ids=manifest.chunk_ids,
+                )
+            ),
+            topics=[BLOCK_TOPIC_CHUNKED_ATTACHMENTS, media_type],
+        )
+        self._did_manager.attachment_hash_index.add_block(
+            block.long_id, [payload_hash]
+        )
+        return bytes(block.long_id)
+
+    def get_chunked_attachment(self, attachment_id: bytes) -> ChunkedAttachment:
+        return decode_attachment_block(self._did_manager, attachment_id)
+
+    def get_chunked_attachments(self) -> list[ChunkedAttachment]:
+        return [
+            decode_attachment_block(self._did_manager, block_id)
+            for block_id in self._did_manager.get_block_ids(
+                BLOCK_TOPIC_CHUNKED_ATTACHMENTS
+            )
+        ]
+
+    def iter_attachment_chunks(
+        self,
+        attachment: bytes | ChunkedAttachment,
+        progress_handler: ProgressHandler | None = None,
+    ) -> Generator[bytes, None, None]:
+        """Stream the payload of a chunked attachment chunk by chunk.
+
+        Args:
+            attachment: the ChunkedAttachment or its ID
+            progress_handler: called after each chunk is loaded with the
+                number of bytes loaded so far and the total size
+        """
+        if not isinstance(attachment, ChunkedAttachment):
+            attachment = self.get_chunked_attachment(attachment)
+        loaded = 0
+        for chunk_id in attachment.chunk_ids:
+            chunk = self._did_manager.get_block(chunk_id).content
+            loaded += len(chunk)
+            if progress_handler:
+                progress_handler(loaded, attachment.size)
+            yield chunk
+
+    def save_chunked_attachment(
+        self,
+        attachment: bytes | ChunkedAttachment,
+        file_path: str,
+        progress_handler: ProgressHandler | None = None,
+    ) -> None:
+        """Write the payload of a chunked attachment to a file."""
+        with open(file_path, "wb") as file:
+            for chunk in self.iter_attachment_chunks(attachment, progress_handler):
+                file.write(chunk)
 
     def get_message_content_parts(self, message: Message):
         return get_message_content_parts(
             blockchain=self._did_manager, message_content=message.content
         )
 
+    def resolve_message_content_parts(self, messages: list[Message]) -> list[list]:
+        """Get the resolved content parts of many messages in one pass.
+
+        Each attachment or referenced message is loaded and decoded only
+        once, however many of the given messages' parts refer to it.
+        """
+        return resolve_message_content_parts(
+            blockchain=self._did_manager,
+            message_contents=[message.content for message in messages],
+        )
+
     def create_invitation(self) -> dict:
         return self._did_manager.did_manager.base_blockchain.group_blockchain.invite_member()
 
@@ -114,6 +1012,29 @@ class Correspondence:
     def clear_block_received_handler(self) -> None:
         self._did_manager.clear_block_received_handler()
 
+    def subscribe(
+        self,
+        handler: Callable[[BlockEvent], None],
+        event_types: tuple[type[BlockEvent], ...] | None = None,
+    ) -> Subscription:
+        """Call a handler with typed events for the blocks we receive.
+
+        Unlike `block_received_handler`, the handler is called with decoded
+        `MessageReceived`, `MessageEdited`, `MessageDeleted` and
+        `AttachmentReceived` events, on a thread of its own,
+        so a slow handler doesn't hold up receiving blocks.
+
+        Args:
+            handler: the function to call with each event
+            event_types: the types of events to handle, or `None` for all
+        """
+        return self._did_manager.block_event_pipeline.subscribe(
+            handler, event_types, correspondence_id=self.id
+        )
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self._did_manager.block_event_pipeline.unsubscribe(subscription)
+
 
 CRYPTO_FAMILY = "EC-secp256k1"
 
@@ -123,27 +1044,175 @@ class Device:
         self.id = did_manager_id
 
 
+class ProfileDidManager(DidManagerWithSupers):
+    """A DidManagerWithSupers that reports correspondences being added and removed.
+
+    Covers those joined or archived by our other devices too.
+    The callbacks are called after the correspondence has been added or removed.
+    """
+
+    # called with each added correspondence's CorrespondenceDidManager
+    on_super_added: Callable[[CorrespondenceDidManager], None] | None = None
+    # called with each removed correspondence's ID
+    on_super_removed: Callable[[str], None] | None = None
+
+    def create_super(self) -> CorrespondenceDidManager:
+        correspondence = DidManagerWithSupers.create_super(self)
+        self._report_super_added(correspondence)
+        return correspondence
+
+    def join_super(self, invitation: dict | str) -> CorrespondenceDidManager:
+        correspondence = DidManagerWithSupers.join_super(self, invitation)
+        self._report_super_added(correspondence)
+        return correspondence
+
+    def _join_already_joined_super(
+        self, registration: SuperRegistrationBlock
+    ) -> CorrespondenceDidManager | None:
+        # returns the correspondence we already have, if any
+        was_active = registration.correspondence_id in self.correspondences
+        correspondence = DidManagerWithSupers._join_already_joined_super(
+            self, registration
+        )
+        if correspondence and not was_active:
+            self._report_super_added(correspondence)
+        return correspondence
+
+    def archive_super(self, correspondence_id: str, register: bool = True):
+        was_active = correspondence_id in self.correspondences
+        DidManagerWithSupers.archive_super(self, correspondence_id, register)
+        if was_active and self.on_super_removed:
+            self.on_super_removed(correspondence_id)
+
+    def _report_super_added(self, correspondence: CorrespondenceDidManager) -> None:
+        if self.on_super_added:
+            self.on_super_added(correspondence)
+
+
 class Profile:
     avatar: None
     did_manager: GroupDidManager
 
     def __init__(
         self,
-        did_manager: DidManagerWithSupers,
+        did_manager: ProfileDidManager,
         auto_run=True,
         on_correspondence_event=None,
+        activation_manager: ActivationManager | None = None,
     ):
         self.did_manager = did_manager
         self.did_manager.block_received_handler = self._on_block_received
+        # how long each phase of loading this profile took, in seconds
+        self.startup_timings: dict[str, float] = {}
+        # correspondence ID -> future that completes once it has caught up
+        self._correspondences_ready: dict[str, Future] = {}
+        self._startup_executor: ThreadPoolExecutor | None = None
+        self._all_ready: Future | None = None
+        # opens and closes correspondences' blockchain stacks, if limited
+        self.activation_manager = activation_manager
+
+        # correspondence ID -> the Correspondence object still in use for it
+        self._correspondences: weakref.WeakValueDictionary[str, Correspondence] = (
+            weakref.WeakValueDictionary()
+        )
+        self._correspondences_lock = Lock()
+        # correspondences being added to and removed from the active ones,
+        # including those joined or archived by our other devices
+        self.correspondence_changes = ChangeFeed()
+        # its threads are only started when searching
+        self._search_executor = ThreadPoolExecutor(
+            max_workers=SEARCH_WORKERS, thread_name_prefix="EndraSearch"
+        )
+        # decodes the blocks our correspondences receive into typed events
+        self.block_events = BlockEventPipeline()
+        with self.did_manager.lock:
+            for corresp_did_manager in self.did_manager.correspondences.values():
+                corresp_did_manager.block_event_pipeline = self.block_events
+                if activation_manager:
+                    corresp_did_manager.set_activation_manager(activation_manager)
+            self.did_manager.on_super_added = self._on_correspondence_added
+            self.did_manager.on_super_removed = self._on_correspondence_removed
         if auto_run:
             self.run()
 
     def _on_block_received(self, block):
         pass
 
+    def _on_correspondence_added(self, did_manager: CorrespondenceDidManager) -> None:
+        did_manager.block_event_pipeline = self.block_events
+        if self.activation_manager:
+            did_manager.set_activation_manager(self.activation_manager)
+        self.correspondence_changes.add(ChangeType.ADDED, did_manager.did)
+
+    def _on_correspondence_removed(self, corresp_id: str) -> None:
+        with self._correspondences_lock:
+            self._correspondences.pop(corresp_id, None)
+        self.correspondence_changes.add(ChangeType.REMOVED, corresp_id)
+
     def run(self) -> None:
         self.did_manager.load_missed_blocks()
 
+    def _run_lazily(self, max_workers: int) -> None:
+        """Catch up the profile and its correspondences in the background.
+
+        Correspondences are caught up most recently active first.
+        """
+        self._startup_executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="EndraProfileStartup"
+        )
+
+        def timed(phase: str, function: Callable[[], None]) -> None:
+            start_time = time.monotonic()
+            function()
+            self.startup_timings[phase] = time.monotonic() - start_time
+
+        profile_ready = self._startup_executor.submit(
+            timed, "profile_catch_up", self.run
+        )
+
+        correspondences = sorted(
+            self.did_manager.correspondences.items(),
+            key=lambda item: item[1].get_last_activity(),
+            reverse=True,
+        )
+        for corresp_id, did_manager in correspondences:
+            if did_manager.activation_manager:
+                continue  # catches up when activated
+            self._correspondences_ready[corresp_id] = self._startup_executor.submit(
+                did_manager.load_missed_blocks
+            )
+        all_ready = Future()
+
+        def on_all_ready() -> None:
+            start_time = time.monotonic()
+            wait([profile_ready, *self._correspondences_ready.values()])
+            self.startup_timings["correspondences_catch_up"] = (
+                time.monotonic() - start_time
+            )
+            logger.debug(f"Endra: Profile startup timings: {self.startup_timings}")
+            all_ready.set_result(None)
+
+        # runs after the correspondences' catch-up tasks, which were queued first
+        self._startup_executor.submit(on_all_ready)
+        self._all_ready = all_ready
+
+    def get_correspondence_readiness(self, corresp_id: str) -> Future:
+        """Get a future that completes once the correspondence has caught up.
+
+        The future raises any exception that occurred while catching up.
+        Correspondences that aren't being caught up are ready immediately.
+        """
+        if corresp_id in self._correspondences_ready:
+            return self._correspondences_ready[corresp_id]
+        future = Future()
+        future.set_result(None)
+        return future
+
+    def wait_until_ready(self, timeout: float | None = None) -> None:
+        """Wait until the profile and all its correspondences have caught up."""
+        if self._all_ready:
+            self._all_ready.result(timeout)
+
     @classmethod
     def create(cls, config_dir: str, key: Key, auto_run) -> "Profile":
         device_keystore_path = os.path.join(config_dir, "device_keystore.json")
@@ -165,7 +1234,7 @@ class Profile:
         group_did_manager = GroupDidManager(
             profile_did_keystore, device_did_manager, auto_load_missed_blocks=False
         )
-        dmws = DidManagerWithSupers(
+        dmws = ProfileDidManager(
             did_manager=group_did_manager,
             super_type=CorrespondenceDidManager,
             auto_load_missed_blocks=auto_run,
@@ -176,24 +1245,75 @@ class Profile:
         )
 
     @classmethod
-    def load(cls, config_dir: str, key: Key, auto_run=True) -> "Profile":
+    def load(
+        cls,
+        config_dir: str,
+        key: Key,
+        auto_run=True,
+        lazy: bool = False,
+        max_workers: int = STARTUP_WORKERS,
+        max_active_correspondences: int | None = None,
+        correspondence_idle_timeout: float | None = None,
+    ) -> "Profile":
+        """Load a profile from its config directory.
+
+        Args:
+            config_dir: the directory the profile's KeyStores are in
+            key: the key the profile's KeyStores are encrypted with
+            auto_run: whether to catch up with missed blocks
+            lazy: if `auto_run`, return as soon as the profile is usable,
+                catching up with missed blocks in the background,
+                correspondences most recently active first.
+                See `get_correspondence_readiness` and `wait_until_ready`.
+            max_workers: how many correspondences to catch up concurrently
+                when loading lazily
+            max_active_correspondences: if set, correspondences open their
+                blockchain stacks only when accessed or receiving blocks,
+                and the least recently used are closed beyond this number
+            correspondence_idle_timeout: if set, correspondences open their
+                blockchain stacks only when accessed or receiving blocks,
+                and close them after being unused for this many seconds
+        """
+        start_time = time.monotonic()
         device_keystore_path = os.path.join(config_dir, "device_keystore.json")
         profile_keystore_path = os.path.join(config_dir, "profile_keystore.json")
 
         device_did_keystore = KeyStore(device_keystore_path, key)
         profile_did_keystore = KeyStore(profile_keystore_path, key)
+        keystores_time = time.monotonic()
         group_did_manager = GroupDidManager(
             profile_did_keystore, device_did_keystore, auto_load_missed_blocks=False
         )
-        dmws = DidManagerWithSupers(
+        lazy = lazy and auto_run
+        activation_manager = None
+        if max_active_correspondences or correspondence_idle_timeout:
+            activation_manager = ActivationManager(
+                max_active_correspondences, correspondence_idle_timeout
+            )
+        if activation_manager or lazy:
+            # the Profile hands them the activation manager
+            super_type = LazyCorrespondenceDidManager
+        else:
+            super_type = CorrespondenceDidManager
+        dmws = ProfileDidManager(
             did_manager=group_did_manager,
-            super_type=CorrespondenceDidManager,
-            auto_load_missed_blocks=auto_run,
+            super_type=super_type,
+            auto_load_missed_blocks=auto_run and not lazy,
         )
-        return cls(
+        if super_type is LazyCorrespondenceDidManager:
+            # correspondences created or joined from now on catch up immediately
+            dmws.super_type = CorrespondenceDidManager
+        did_managers_time = time.monotonic()
+        profile = cls(
             did_manager=dmws,
-            auto_run=auto_run,
+            auto_run=auto_run and not lazy,
+            activation_manager=activation_manager,
         )
+        profile.startup_timings["keystores"] = keystores_time - start_time
+        profile.startup_timings["did_managers"] = did_managers_time - keystores_time
+        if lazy:
+            profile._run_lazily(max_workers)
+        return profile
 
     def invite(self) -> dict:
         return self.did_manager.did_manager.invite_member()
@@ -213,7 +1333,7 @@ class Profile:
         )
 
         logger.debug("EndraProtocol: loading DMWS...")
-        dmws = DidManagerWithSupers(
+        dmws = ProfileDidManager(
             did_manager=profile_did_manager,
             super_type=CorrespondenceDidManager,
             auto_load_missed_blocks=auto_run,
@@ -225,16 +1345,51 @@ class Profile:
         )
 
     def create_correspondence(self) -> Correspondence:
-        return Correspondence(self.did_manager.create_super())
+        return self._get_correspondence(self.did_manager.create_super())
 
     def join_correspondence(self, invitation: dict) -> Correspondence:
-        return Correspondence(self.did_manager.join_super(invitation))
+        return self._get_correspondence(self.did_manager.join_super(invitation))
 
     def archive_correspondence(self, corresp_id: str):
         self.did_manager.archive_super(corresp_id)
 
     def get_correspondence(self, corresp_id: str) -> Correspondence:
-        return Correspondence(self.did_manager.get_super(corresp_id))
+        """Get an active correspondence.
+
+        Returns the same Correspondence object for as long as it is in use,
+        so that its cached state is shared.
+        """
+        with self._correspondences_lock:
+            correspondence = self._correspondences.get(corresp_id)
+        if correspondence:
+            return correspondence
+        return self._get_correspondence(self.did_manager.get_super(corresp_id))
+
+    def _get_correspondence(
+        self, did_manager: CorrespondenceDidManager
+    ) -> Correspondence:
+        """Get the Correspondence object for a correspondence's DidManager."""
+        with self._correspondences_lock:
+            correspondence = self._correspondences.get(did_manager.did)
+            if not correspondence:
+                correspondence = Correspondence(did_manager)
+                self._correspondences[did_manager.did] = correspondence
+            return correspondence
+
+    def subscribe(
+        self,
+        handler: Callable[[BlockEvent], None],
+        event_types: tuple[type[BlockEvent], ...] | None = None,
+    ) -> Subscription:
+        """Call a handler with typed events for the blocks all our
+        correspondences receive.
+
+        See `Correspondence.subscribe`.
+        """
+        return self.block_events.subscribe(handler, event_types)
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self.block_events.unsubscribe(subscription)
 
     def get_active_correspondences(self) -> set[str]:
         return self.did_manager.get_active_supers()
@@ -242,6 +1397,66 @@ class Profile:
     def get_archived_correspondences(self):
         return self.did_manager.get_archived_supers()
 
+    def search(
+        self,
+        query: str,
+        limit: int = DEFAULT_SEARCH_LIMIT,
+        include_archived: bool = False,
+    ) -> Generator[SearchHit, None, None]:
+        """Find the messages whose text contains all the words of a query.
+
+        Searches all correspondences' search indexes in parallel,
+        yielding each correspondence's hits as soon as it has been searched,
+        provided they rank among the best `limit` hits found so far.
+        So the first hits are yielded before all correspondences have been
+        searched, and the best `limit` of all yielded hits are the overall
+        most relevant ones, while more hits may be yielded in total.
+        Inactive correspondences aren't activated; hits only carry message
+        IDs, which `get_correspondence(...).get_message(...)` loads.
+
+        Args:
+            query: the words to search for
+            limit: the number of most relevant hits to find
+            include_archived: whether to search archived correspondences too
+        """
+        futures = {
+            self._search_executor.submit(
+                self.did_manager.get_super(corresp_id).search_messages, query, limit
+            ): corresp_id
+            for corresp_id in self.get_active_correspondences()
+        }
+        if include_archived:
+            for corresp_id in self.get_archived_correspondences():
+                index_path = get_appdata_path(
+                    get_key_store_path(self.did_manager.key_store_dir, corresp_id),
+                    "search",
+                    "sqlite",
+                )
+                future = self._search_executor.submit(
+                    search_index_file, index_path, query, limit
+                )
+                futures[future] = corresp_id
+
+        def iter_results():
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result()
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    corresp_id = futures[future]
+                    logger.warning(
+                        f"Endra: failed to search correspondence {corresp_id}:\n{e}"
+                    )
+
+        try:
+            for corresp_id, score, message_id in iter_top_hits(iter_results(), limit):
+                yield SearchHit(
+                    correspondence_id=corresp_id, message_id=message_id, score=score
+                )
+        finally:
+            # stop searching if the caller stops iterating
+            for future in futures:
+                future.cancel()
+
     def get_devices(self) -> set[str]:
         return set(self.did_manager.did_manager.get_members_dids())
 
@@ -256,6 +1471,12 @@ class Profile:
         self.did_manager.delete()
 
     def terminate(self):
+        if self._startup_executor:
+            self._startup_executor.shutdown(wait=False, cancel_futures=True)
+        if self.activation_manager:
+            self.activation_manager.terminate()
+        self._search_executor.shutdown(wait=False, cancel_futures=True)
+        self.block_events.terminate()
         self.did_manager.terminate()
 
     def __del__(self):
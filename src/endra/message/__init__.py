@@ -4,16 +4,49 @@ from .message_content import (
     ReferencedContentPart,
     AttachedContentPart,
     MessageAttachment,
+    LazyMessageAttachment,
+    ChunkedAttachment,
 )
 from .message_encoding import (
     encode_message,
     decode_message,
     encode_attachment,
     decode_attachment,
+    encode_chunked_attachment,
+    decode_chunked_attachment,
+    decode_attachment_metadata,
+    decode_attachment_payload,
+    decode_attachment_payload_view,
+    decode_attachment_view,
+    decode_message_view,
+    encode_message_frames,
+    encode_attachment_frames,
 )
 from .message import (
     Message,
     BLOCK_TOPIC_ATTACHMENTS,
+    BLOCK_TOPIC_CHUNKED_ATTACHMENTS,
+    BLOCK_TOPIC_ATTACHMENT_CHUNKS,
     BLOCK_TOPIC_MESSAGES,
     get_message_content_parts,
+    resolve_message_content_parts,
+    decode_attachment_block,
+    load_attachment_metadata,
+)
+from .decoded_cache import (
+    DecodedCache,
+    decoded_cache,
+)
+from .attachment_chunking import (
+    DEFAULT_CHUNK_SIZE,
+    ProgressHandler,
+    PayloadSource,
+    iter_chunks,
+    get_payload_size,
+    ChunkStreamReader,
+)
+from .payload_hashing import (
+    PayloadHasher,
+    hash_payload,
+    verify_payload_hash,
 )
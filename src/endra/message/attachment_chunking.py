@@ -0,0 +1,93 @@
+"""Splitting attachment payloads into fixed-size chunks for streaming.
+
+Large attachments are stored as a ChunkedAttachment manifest block plus one
+block per chunk of the payload, so that they can be added and read without
+ever holding more than one chunk in memory.
+"""
+
+import io
+import mmap
+import os
+from typing import Callable, Generator, Iterable
+
+# the number of payload bytes stored in each chunk block
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# called with the number of bytes processed so far and the total number of
+# bytes, which is None if unknown
+ProgressHandler = Callable[[int, int | None], None]
+
+# what an attachment payload can be streamed from:
+# a file path, a bytes-like object, or an iterable of bytes-like objects
+PayloadSource = (
+    str | os.PathLike | bytes | bytearray | memoryview | mmap.mmap | Iterable[bytes]
+)
+
+
+def get_payload_size(source: PayloadSource) -> int | None:
+    """Get the number of bytes of a payload source, if it can be known."""
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source)
+    if isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+        return len(source)
+    return None
+
+
+def iter_chunks(
+    source: PayloadSource, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Generator[bytes, None, None]:
+    """Stream a payload source as chunks of exactly `chunk_size` bytes.
+
+    Only the last chunk may be smaller.
+
+    Args:
+        source: a file path, a bytes-like object, or an iterable of
+            bytes-like objects of any sizes
+        chunk_size: the number of bytes per chunk
+    """
+    if chunk_size <= 0:
+        raise ValueError(f"chunk_size must be positive, not {chunk_size}")
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as file:
+            while chunk := file.read(chunk_size):
+                yield chunk
+        return
+    if isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+        view = memoryview(source)
+        for i in range(0, len(view), chunk_size):
+            yield bytes(view[i : i + chunk_size])
+        return
+
+    buffer = bytearray()
+    for data in source:
+        buffer += data
+        while len(buffer) >= chunk_size:
+            yield bytes(buffer[:chunk_size])
+            del buffer[:chunk_size]
+    if buffer:
+        yield bytes(buffer)
+
+
+class ChunkStreamReader(io.RawIOBase):
+    """Read-only binary file-like object over a stream of chunks.
+
+    Only one chunk is held in memory at a time.
+    """
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._chunk = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._chunk:
+            try:
+                self._chunk = memoryview(next(self._chunks))
+            except StopIteration:
+                return 0
+        n_bytes = min(len(buffer), len(self._chunk))
+        buffer[:n_bytes] = self._chunk[:n_bytes]
+        self._chunk = self._chunk[n_bytes:]
+        return n_bytes
@@ -0,0 +1,196 @@
+"""Shared LRU cache of decoded MessageContent and attachment objects.
+
+Decoding a block's content means parsing protobuf and rebuilding metadata
+dicts, which is wasted work when the same messages are listed again and again.
+Decoded objects are cached by block ID and content version ID.
+A block's current content is cached under the version ID `None`,
+so looking it up doesn't require finding its latest content version,
+and has to be invalidated when the block is edited or deleted.
+Invalidating a block also bumps its generation, and objects decoded before
+that are not cached, so that content decoded while the block was being
+edited can't be cached as current.
+
+The cache is bounded by the estimated memory size of the cached objects
+rather than their number, and objects larger than `max_entry_size`
+(typically attachments with large payloads) are not cached at all.
+
+Callers get copies of the cached objects, so that modifying them doesn't
+affect other callers. Payloads are shared rather than copied.
+"""
+
+import copy
+import dataclasses
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Hashable
+
+from .message_content import (
+    MessageContent,
+    MessageAttachment,
+    ChunkedAttachment,
+    EmbeddedContentPart,
+)
+
+DEFAULT_CACHE_SIZE = 64 * 1024 * 1024
+DEFAULT_MAX_ENTRY_SIZE = 4 * 1024 * 1024
+
+# rough per-object overhead in bytes, for size estimation
+_OBJECT_OVERHEAD = 256
+
+
+def estimate_size(obj: Any) -> int:
+    """Estimate the number of bytes of memory a decoded object occupies."""
+    if isinstance(obj, MessageContent):
+        return _OBJECT_OVERHEAD + sum(
+            _OBJECT_OVERHEAD
+            + (len(part.payload) if isinstance(part, EmbeddedContentPart) else 0)
+            for part in obj.message_parts
+        )
+    if isinstance(obj, MessageAttachment):
+        return _OBJECT_OVERHEAD + len(obj.payload)
+    if isinstance(obj, ChunkedAttachment):
+        return _OBJECT_OVERHEAD + sum(len(chunk_id) for chunk_id in obj.chunk_ids)
+    return _OBJECT_OVERHEAD
+
+
+def copy_decoded(obj: Any) -> Any:
+    """Copy a decoded object, sharing its payloads but not its metadata."""
+    if isinstance(obj, MessageContent):
+        content = MessageContent(copy.deepcopy(obj.message_metadata))
+        content.message_parts = [
+            dataclasses.replace(
+                part, rendering_metadata=copy.deepcopy(part.rendering_metadata)
+            )
+            if hasattr(part, "rendering_metadata")
+            else dataclasses.replace(part)
+            for part in obj.message_parts
+        ]
+        return content
+    if isinstance(obj, (MessageAttachment, ChunkedAttachment)):
+        changes = dict(
+            derived_properties=copy.deepcopy(obj.derived_properties),
+            user_attributes=copy.deepcopy(obj.user_attributes),
+        )
+        if isinstance(obj, ChunkedAttachment):
+            changes["chunk_ids"] = list(obj.chunk_ids)
+        return dataclasses.replace(obj, **changes)
+    return obj
+
+
+class DecodedCache:
+    """Size-bounded LRU cache of decoded objects keyed by block ID & version."""
+
+    def __init__(
+        self,
+        max_size: int = DEFAULT_CACHE_SIZE,
+        max_entry_size: int = DEFAULT_MAX_ENTRY_SIZE,
+    ):
+        """Create a cache.
+
+        Args:
+            max_size: the maximum total estimated size of cached objects
+            max_entry_size: objects estimated to be larger than this
+                aren't cached
+        """
+        self.max_size = max_size
+        self.max_entry_size = max_entry_size
+        self._lock = Lock()
+        # (block ID, version ID) -> (object, size), least recently used first
+        self._entries: OrderedDict[tuple, tuple[Any, int]] = OrderedDict()
+        # block ID -> the keys of its cached versions, for invalidation
+        self._versions: dict[Hashable, set[tuple]] = {}
+        # block ID -> the number of times it has been invalidated
+        self._generations: dict[Hashable, int] = {}
+        self.size = 0
+
+    def get(self, block_id: Hashable, version_id: Hashable = None) -> Any | None:
+        """Get a copy of a cached object, or None if it isn't cached."""
+        key = (block_id, version_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+        return copy_decoded(entry[0])
+
+    def get_generation(self, block_id: Hashable) -> int:
+        """Get the number of times the given block has been invalidated."""
+        return self._generations.get(block_id, 0)
+
+    def put(
+        self,
+        block_id: Hashable,
+        version_id: Hashable,
+        obj: Any,
+        size: int | None = None,
+        generation: int | None = None,
+    ) -> None:
+        """Cache an object, evicting the least recently used ones if needed.
+
+        The object mustn't be modified afterwards, cache a copy if needed.
+
+        Args:
+            generation: the block's generation from before the object was
+                decoded, if the block has been invalidated since then the
+                object isn't cached
+        """
+        if size is None:
+            size = estimate_size(obj)
+        if size > self.max_entry_size or size > self.max_size:
+            return
+        key = (block_id, version_id)
+        with self._lock:
+            if generation is not None and generation != self.get_generation(
+                block_id
+            ):
+                return
+            self._remove(key)
+            self._entries[key] = (obj, size)
+            self._versions.setdefault(block_id, set()).add(key)
+            self.size += size
+            while self.size > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def get_or_decode(
+        self,
+        block_id: Hashable,
+        version_id: Hashable,
+        decode: Callable[[], Any],
+    ) -> Any:
+        """Get a copy of a cached object, decoding and caching it if needed."""
+        obj = self.get(block_id, version_id)
+        if obj is None:
+            generation = self.get_generation(block_id)
+            obj = decode()
+            self.put(block_id, version_id, copy_decoded(obj), generation=generation)
+        return obj
+
+    def _remove(self, key: tuple) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.size -= entry[1]
+        versions = self._versions[key[0]]
+        versions.discard(key)
+        if not versions:
+            self._versions.pop(key[0])
+
+    def invalidate(self, block_id: Hashable) -> None:
+        """Remove all cached versions of the given block."""
+        with self._lock:
+            self._generations[block_id] = self.get_generation(block_id) + 1
+            for key in list(self._versions.get(block_id, ())):
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+            self.size = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# the cache shared by Message, Correspondence and the content-part resolver
+decoded_cache = DecodedCache()
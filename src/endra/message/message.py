@@ -1,44 +1,80 @@
-from .message_encoding import decode_attachment
+import io
+from .message_encoding import (
+    decode_attachment,
+    decode_chunked_attachment,
+    decode_attachment_metadata,
+    decode_attachment_payload,
+    decode_attachment_payload_view,
+)
+from .attachment_chunking import ChunkStreamReader
 from .message_content import (
     EmbeddedContentPart,
     ReferencedContentPart,
     AttachedContentPart,
+    MessageAttachment,
+    LazyMessageAttachment,
+    ChunkedAttachment,
 )
 from walytis_mutability import MutaBlock
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from .message_content import MessageContent
-from .message_encoding import decode_message
+from .message_encoding import decode_message, encode_message
+from .decoded_cache import decoded_cache
 
 BLOCK_TOPIC_MESSAGES = "EndraMessage"
 BLOCK_TOPIC_ATTACHMENTS = "EndraAttachments"
+BLOCK_TOPIC_CHUNKED_ATTACHMENTS = "EndraChunkedAttachments"
+BLOCK_TOPIC_ATTACHMENT_CHUNKS = "EndraAttachmentChunks"
 
 
-@dataclass
+@dataclass(slots=True)
 class Message:
     block: MutaBlock
-
-    def __post_init__(self):
-        self._content = None
+    # the decoded content, loaded on first access
+    _content: MessageContent | None = field(
+        default=None, init=False, repr=False, compare=False
+    )
+    # the block's decoded-cache generation _content was loaded in,
+    # it is reloaded once the block is invalidated, e.g. by a remote edit
+    _content_generation: int = field(
+        default=0, init=False, repr=False, compare=False
+    )
 
     @classmethod
     def from_block(cls, block: MutaBlock):
         return cls(block)
 
+    @property
+    def id(self) -> bytes:
+        return bytes(self.block.long_id)
+
     @property
     def content(self) -> MessageContent:
-        if not self._content:
-            self._content = decode_message(self.block.content)
+        generation = decoded_cache.get_generation(self.id)
+        if not self._content or self._content_generation != generation:
+            # cached as the current version, invalidated when edited or deleted,
+            # to avoid looking up the block's content versions
+            self._content = decoded_cache.get_or_decode(
+                self.id, None, lambda: decode_message(self.block.content)
+            )
+            self._content_generation = generation
         return self._content
 
     def edit(self, message_content: MessageContent) -> None:
-        self.block.edit(message_content.to_bytes())
+        self.block.edit(encode_message(message_content))
+        self._content = None
+        decoded_cache.invalidate(self.id)
 
     def delete(self) -> None:
         self.block.delete()
+        self._content = None
+        decoded_cache.invalidate(self.id)
 
     def get_content_versions(self) -> list[MessageContent]:
         return [
-            MessageContent.from_bytes(cv.content)
+            decoded_cache.get_or_decode(
+                self.id, bytes(cv.cv_id), lambda: decode_message(cv.content)
+            )
             for cv in self.block.get_content_versions()
         ]
 
@@ -51,26 +87,139 @@ class Message:
         pass
 
 
+def _block_key(block_id: bytes | bytearray | str) -> bytes | str:
+    """Make a block ID usable as a dictionary key."""
+    return bytes(block_id) if isinstance(block_id, bytearray) else block_id
+
+
+def decode_attachment_block(
+    blockchain, attachment_id: bytes
+) -> MessageAttachment | ChunkedAttachment:
+    """Load and decode an attachment, using the shared decoded-object cache.
+
+    Attachments are never edited, so they are cached by block ID alone.
+    """
+    attachment_id = _block_key(attachment_id)
+
+    def decode():
+        block = blockchain.get_block(attachment_id)
+        if BLOCK_TOPIC_CHUNKED_ATTACHMENTS in block.topics:
+            return decode_chunked_attachment(block.content)
+        return decode_attachment(block.content)
+
+    return decoded_cache.get_or_decode(attachment_id, None, decode)
+
+
+def load_attachment_metadata(
+    blockchain, attachment_id: bytes
+) -> LazyMessageAttachment:
+    """Load an attachment without its payload, which is loaded on access.
+
+    Works for both normal and chunked attachments.
+    The payload of a normal attachment is loaded by fetching its block again,
+    that of a chunked attachment by joining its chunks,
+    and `open_payload()` of a chunked attachment streams its chunks.
+
+    The blockchain can only load a block's content in full, so loading
+    the metadata of a normal attachment still reads its payload from the
+    block store, it just isn't decoded or kept in memory. Only chunked
+    attachments avoid reading their payloads, so store large files with
+    `Correspondence.add_chunked_attachment` to keep galleries cheap.
+    """
+    attachment_id = _block_key(attachment_id)
+    block = blockchain.get_block(attachment_id)
+    if BLOCK_TOPIC_CHUNKED_ATTACHMENTS in block.topics:
+        manifest = decode_attachment_block(blockchain, attachment_id)
+
+        def iter_chunks():
+            for chunk_id in manifest.chunk_ids:
+                yield blockchain.get_block(chunk_id).content
+
+        return LazyMessageAttachment(
+            media_type=manifest.media_type,
+            payload_hash=manifest.payload_hash,
+            size=manifest.size,
+            derived_properties=manifest.derived_properties,
+            user_attributes=manifest.user_attributes,
+            payload_loader=lambda: b"".join(iter_chunks()),
+            stream_opener=lambda: io.BufferedReader(
+                ChunkStreamReader(iter_chunks()), buffer_size=manifest.chunk_size
+            ),
+        )
+
+    def load_payload() -> bytes:
+        return decode_attachment_payload(blockchain.get_block(attachment_id).content)
+
+    def load_payload_view() -> memoryview:
+        return decode_attachment_payload_view(
+            blockchain.get_block(attachment_id).content
+        )
+
+    return decode_attachment_metadata(
+        block.content,
+        payload_loader=load_payload,
+        payload_view_loader=load_payload_view,
+    )
+
+
+def resolve_message_content_parts(
+    blockchain, message_contents: list[MessageContent]
+) -> list[list[EmbeddedContentPart | MessageAttachment | ChunkedAttachment]]:
+    """Resolve the content parts of many MessageContents in one pass.
+
+    Gathers the IDs of all blocks referred to by the given MessageContents'
+    AttachedContentParts and ReferencedContentParts, then loads and decodes
+    each of those blocks only once, no matter how many parts refer to it.
+
+    Returns:
+        list: for each given MessageContent, the list of its resolved parts
+    """
+    attachment_ids: dict[bytes | str, None] = {}
+    ref_content_ids: dict[bytes | str, None] = {}
+    for message_content in message_contents:
+        for content_part in message_content.message_parts:
+            if isinstance(content_part, AttachedContentPart):
+                attachment_ids[_block_key(content_part.attachment_id)] = None
+            elif isinstance(content_part, ReferencedContentPart):
+                ref_content_ids[_block_key(content_part.ref_content_id)] = None
+
+    attachments = {
+        attachment_id: decode_attachment_block(blockchain, attachment_id)
+        for attachment_id in attachment_ids
+    }
+    ref_contents = {}
+    for ref_content_id in ref_content_ids:
+        block = blockchain.get_block(ref_content_id)
+        ref_contents[ref_content_id] = decoded_cache.get_or_decode(
+            ref_content_id, None, lambda: decode_message(block.content)
+        )
+
+    resolved = []
+    for message_content in message_contents:
+        content_parts = []
+        for content_part in message_content.message_parts:
+            if isinstance(content_part, EmbeddedContentPart):
+                content_parts.append(content_part)
+            elif isinstance(content_part, AttachedContentPart):
+                content_parts.append(
+                    attachments[_block_key(content_part.attachment_id)]
+                )
+            elif isinstance(content_part, ReferencedContentPart):
+                ref_content = ref_contents[_block_key(content_part.ref_content_id)]
+                ref_content_part = ref_content.get_message_part(
+                    content_part.ref_part_id
+                )
+                if not isinstance(ref_content_part, EmbeddedContentPart):
+                    raise Exception(
+                        "The referenced content part is not an "
+                        f"EmbeddedContentPart, but a {type(ref_content_part)}"
+                    )
+                content_parts.append(ref_content_part)
+        resolved.append(content_parts)
+    return resolved
+
+
 def get_message_content_parts(
     blockchain, message_content: MessageContent
-) -> list[EmbeddedContentPart]:
-    content_parts = []
-    for content_part in message_content.message_parts:
-        if isinstance(content_part, EmbeddedContentPart):
-            content_parts.append(content_part)
-        elif isinstance(content_part, AttachedContentPart):
-            attachment = decode_attachment(
-                blockchain.get_block(content_part.attachment_id).content
-            )
-            content_parts.append(attachment)
-        elif isinstance(content_part, ReferencedContentPart):
-            block = blockchain.get_block(content_part.ref_content_id)
-            ref_content = decode_message(block.content)
-            ref_content_part = ref_content.get_message_part(content_part.ref_part_id)
-            if not isinstance(ref_content_part, EmbeddedContentPart):
-                raise Exception(
-                    "The referenced content part is not an "
-                    f"EmbeddedContentPart, but a {type(ref_content_part)}"
-                )
-            content_parts.append(ref_content_part)
-    return content_parts
+) -> list[EmbeddedContentPart | MessageAttachment | ChunkedAttachment]:
+    return resolve_message_content_parts(blockchain, [message_content])[0]
@@ -1,28 +1,34 @@
 from dataclasses import dataclass
 from dataclasses_json import dataclass_json
 
+import io
 from abc import ABC
+from typing import Callable
+from .payload_hashing import hash_payload, verify_payload_hash
 
 
 class GenericContentPart(ABC):
     """A subsection of a message content."""
 
+    __slots__ = ()
+
     part_id: int
 
 
 @dataclass_json
-@dataclass
+@dataclass(slots=True)
 class EmbeddedContentPart(GenericContentPart):
     """A message content part that embeds its payload."""
 
     part_id: int
     media_type: str
     rendering_metadata: dict
+    # may also be a memoryview or mmap when encoding, decoding returns bytes
     payload: bytes
 
 
 @dataclass_json
-@dataclass
+@dataclass(slots=True)
 class ReferencedContentPart(GenericContentPart):
     """A message content part that refers to another message content part."""
 
@@ -32,7 +38,7 @@ class ReferencedContentPart(GenericContentPart):
 
 
 @dataclass_json
-@dataclass
+@dataclass(slots=True)
 class AttachedContentPart(GenericContentPart):
     """A message content part that references a MessageAttachment."""
 
@@ -42,7 +48,7 @@ class AttachedContentPart(GenericContentPart):
 
 
 @dataclass_json
-@dataclass
+@dataclass(slots=True)
 class MessageAttachment:
     """Message Content Part Attachment
 
@@ -66,17 +72,19 @@ class MessageAttachment:
     # metadata defined by user, e.g. filename, title-override
     user_attributes: dict
 
-    # raw file data
+    # raw file data, may also be a memoryview or mmap when encoding,
+    # decoding returns bytes
     payload: bytes
 
     def _calculate_hash(self) -> str:
-        return ""
+        return hash_payload(self.payload)
 
     def verify_hash(self) -> bool:
-        return self.hash == self._calculate_hash()
+        return verify_payload_hash(self.payload, self.payload_hash)
 
-    def _calculate_size(self) -> None:
-        return len(self.payload)
+    def _calculate_size(self) -> int:
+        # in bytes, also for memoryviews of items larger than a byte
+        return memoryview(self.payload).nbytes
 
     @classmethod
     def create(
@@ -108,10 +116,135 @@ class MessageAttachment:
     #     return encode_attachment(self)
 
 
+class LazyMessageAttachment(MessageAttachment):
+    """A MessageAttachment whose payload is only loaded on first access.
+
+    Created by metadata-only decoding, for displaying attachments
+    without loading their payloads.
+    The payload is loaded by calling `payload_loader` when `payload` is first
+    accessed, and is then kept until `release_payload()` is called.
+    """
+
+    def __init__(
+        self,
+        media_type: str,
+        payload_hash: str,
+        size: int,
+        derived_properties: dict,
+        user_attributes: dict,
+        payload_loader: Callable[[], bytes | memoryview],
+        stream_opener: Callable[[], io.BufferedIOBase] | None = None,
+        payload_view_loader: Callable[[], memoryview] | None = None,
+    ):
+        """Create a LazyMessageAttachment.
+
+        Args:
+            payload_loader: loads the payload, may return a memoryview
+            stream_opener: opens the payload as a file-like object without
+                loading it in full, defaults to wrapping the loaded payload
+            payload_view_loader: loads the payload as a view into the
+                encoded attachment without copying it, defaults to viewing
+                the loaded payload
+        """
+        self._payload = None
+        self._payload_loader = payload_loader
+        self._stream_opener = stream_opener
+        self._payload_view_loader = payload_view_loader
+        MessageAttachment.__init__(
+            self,
+            media_type=media_type,
+            payload_hash=payload_hash,
+            size=size,
+            derived_properties=derived_properties,
+            user_attributes=user_attributes,
+            payload=None,
+        )
+
+    @property
+    def payload(self) -> bytes | memoryview:
+        if self._payload is None:
+            self._payload = self._payload_loader()
+        return self._payload
+
+    @payload.setter
+    def payload(self, payload: bytes | memoryview | None) -> None:
+        self._payload = payload
+
+    @property
+    def is_payload_loaded(self) -> bool:
+        return self._payload is not None
+
+    def release_payload(self) -> None:
+        """Drop the loaded payload to free memory, it is reloaded if needed."""
+        self._payload = None
+
+    def get_payload_view(self) -> memoryview:
+        """Get the payload as a memoryview, avoiding copies where possible.
+
+        Unless the payload is already loaded, the view is of the encoded
+        attachment rather than of a copy of the payload, and isn't kept.
+        """
+        if self._payload is None and self._payload_view_loader:
+            return self._payload_view_loader()
+        return memoryview(self.payload)
+
+    def open_payload(self) -> io.BufferedIOBase:
+        """Open the payload as a read-only binary file-like object."""
+        if self._stream_opener and self._payload is None:
+            return self._stream_opener()
+        return io.BytesIO(self.payload)
+
+    def __repr__(self) -> str:
+        # don't load the payload just to display the object
+        return (
+            f"{type(self).__name__}(media_type={self.media_type!r}, "
+            f"payload_hash={self.payload_hash!r}, size={self.size!r}, "
+            f"derived_properties={self.derived_properties!r}, "
+            f"user_attributes={self.user_attributes!r}, "
+            f"is_payload_loaded={self.is_payload_loaded})"
+        )
+
+
+@dataclass_json
+@dataclass
+class ChunkedAttachment:
+    """Manifest of a MessageAttachment whose payload is stored in chunks.
+
+    Holds the same metadata as a MessageAttachment, but instead of the payload
+    it lists the IDs of the blocks holding the payload's fixed-size chunks,
+    in order, so that large files can be streamed without ever being held
+    in memory in full.
+    """
+
+    # media type is MIME-compatible
+    media_type: str
+    # hash includes algorithm and hash
+    payload_hash: str
+    # size is the number of bytes of the full payload
+    size: int
+
+    derived_properties: dict
+    user_attributes: dict
+
+    # the number of bytes of each chunk, except for the last one
+    chunk_size: int
+    # the IDs of the blocks containing the payload's chunks, in order
+    chunk_ids: list[bytes]
+
+
 @dataclass_json
 @dataclass
 class MessageContent:
-    """The multi-part structure for a single version of a message's content."""
+    """The multi-part structure for a single version of a message's content.
+
+    Parts are indexed by ID as they are added,
+    so adding parts and looking them up by ID take constant time.
+    Parts should only be added with the `add_*_part` methods
+    or by appending to `message_parts`.
+    Parts must not be replaced in place (`message_parts[i] = part`):
+    looking parts up detects it, but part IDs allocated afterwards
+    may clash with the replacements'. Build a new MessageContent instead.
+    """
 
     message_metadata: dict
     message_parts: list[EmbeddedContentPart | ReferencedContentPart]
@@ -150,6 +283,28 @@ class MessageContent:
                             f"Unexpected object type in list: {type(message_part)}"
                         )
 
+    def _index_parts(self) -> None:
+        """Index the parts appended to message_parts since the last call."""
+        if (
+            getattr(self, "_indexed_parts", None) is not self.message_parts
+            or len(self.message_parts) < self._num_indexed_parts
+        ):
+            # message_parts was replaced or parts were removed, reindex all
+            self._indexed_parts = self.message_parts
+            # part ID -> its position, for the first self._num_indexed_parts parts
+            self._part_positions: dict[int, int] = {}
+            self._num_indexed_parts = 0
+            self._next_part_id = 1
+        for position in range(self._num_indexed_parts, len(self.message_parts)):
+            part_id = self.message_parts[position].part_id
+            self._part_positions.setdefault(part_id, position)
+            self._next_part_id = max(self._next_part_id, part_id + 1)
+        self._num_indexed_parts = len(self.message_parts)
+
+    def _add_part(self, message_part: GenericContentPart) -> None:
+        self.message_parts.append(message_part)
+        self._index_parts()
+
     def add_embedded_part(
         self, media_type, rendering_metadata, payload
     ) -> EmbeddedContentPart:
@@ -160,7 +315,7 @@ class MessageContent:
             rendering_metadata=rendering_metadata,
             payload=payload,
         )
-        self.message_parts.append(message_part)
+        self._add_part(message_part)
         return message_part
 
     def add_referenced_part(self, ref_content_id: str, ref_part_id: int):
@@ -170,6 +325,7 @@ class MessageContent:
             ref_content_id=ref_content_id,
             ref_part_id=ref_part_id,
         )
+        self._add_part(message_part_reference)
         return message_part_reference
 
     def add_attached_part(
@@ -183,28 +339,28 @@ class MessageContent:
             rendering_metadata=rendering_metadata,
             attachment_id=attachment_id,
         )
-        self.message_parts.append(message_part_attachment)
+        self._add_part(message_part_attachment)
         return message_part_attachment
 
     def get_next_part_id(self) -> int:
         """Get the next free part ID for the next content part to be created."""
-        return (
-            max(
-                [
-                    mp.part_id
-                    for mp in self.message_parts
-                    if isinstance(mp, EmbeddedContentPart)
-                ]
-                + [0]
-            )
-            + 1
-        )
+        self._index_parts()
+        return self._next_part_id
 
     def get_message_part(self, part_id) -> GenericContentPart:
-        for part in self.message_parts:
-            if part.part_id == part_id:
-                return part
-        raise Exception(f"Part {part_id} not found in this message content.")
+        self._index_parts()
+        position = self._part_positions.get(part_id)
+        if (
+            position is None
+            or self.message_parts[position].part_id != part_id
+        ):
+            # a part may have been replaced in place, reindex all
+            self._indexed_parts = None
+            self._index_parts()
+            position = self._part_positions.get(part_id)
+        if position is None:
+            raise Exception(f"Part {part_id} not found in this message content.")
+        return self.message_parts[position]
 
     # @classmethod
     # def from_bytes(cls, data: bytes):
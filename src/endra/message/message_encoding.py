@@ -2,24 +2,127 @@
 
 Uses versioned encoding, encoding using the set default codec,
 and automatically determining the correct codec for decoding.
+
+Decoded payloads are always `bytes`, whichever codec encoded them,
+except with the `decode_*_view` functions, which return payloads as
+memoryviews into the encoded data instead of copying them.
+To avoid copying large payloads when encoding, the `encode_*_frames`
+functions encode with the framed codecs, keeping the payloads in frames
+of their own.
 """
 
-from .message_encoding_versions import message_encoding_v1, attachment_encoding_v1
-from .message_content import MessageContent, MessageAttachment
+from types import ModuleType, SimpleNamespace
+from .message_encoding_versions import (
+    message_encoding_v1,
+    message_encoding_v2,
+    message_encoding_v3,
+    attachment_encoding_v1,
+    attachment_encoding_v2,
+    attachment_encoding_v3,
+    chunked_attachment_encoding_v1,
+)
+from typing import Callable
+from .message_content import (
+    MessageContent,
+    MessageAttachment,
+    LazyMessageAttachment,
+    ChunkedAttachment,
+)
 from codec_versioning import (
     encode_versioned,
     decode_versioned,
+    load_codec_module,
     load_codec_modules,
 )
 
 
 # ADD NEW ENCODING MODULE VERSIONS HERE
-MESSAGE_CODECS = load_codec_modules([message_encoding_v1])
-ATTACHMENT_CODECS = load_codec_modules([attachment_encoding_v1])
+MESSAGE_CODECS = load_codec_modules(
+    [message_encoding_v1, message_encoding_v2, message_encoding_v3]
+)
+ATTACHMENT_CODECS = load_codec_modules(
+    [attachment_encoding_v1, attachment_encoding_v2, attachment_encoding_v3]
+)
+CHUNKED_ATTACHMENT_CODECS = load_codec_modules([chunked_attachment_encoding_v1])
+
+# attachment codec modules supporting decoding metadata without the payload
+ATTACHMENT_METADATA_CODEC_MODULES = [
+    attachment_encoding_v1,
+    attachment_encoding_v2,
+    attachment_encoding_v3,
+]
 
 # SET DEFAULT ENCODING VERSION HERE
-DEFAULT_MESSAGE_CODEC = MESSAGE_CODECS[message_encoding_v1.CODEC_VERSION]
-DEFAULT_ATTACHMENT_CODEC = ATTACHMENT_CODECS[attachment_encoding_v1.CODEC_VERSION]
+# Messages and attachments are still encoded with v1, which all released
+# versions of Endra can decode. v2 and v3 are decoded, and v3 is encoded
+# by the opt-in `encode_*_frames` functions. Switch the defaults to v3,
+# which encodes and decodes metadata several times faster,
+# once peers that can decode it have rolled out.
+DEFAULT_MESSAGE_CODEC_MODULE = message_encoding_v1
+DEFAULT_ATTACHMENT_CODEC_MODULE = attachment_encoding_v1
+DEFAULT_CHUNKED_ATTACHMENT_CODEC_MODULE = chunked_attachment_encoding_v1
+
+DEFAULT_MESSAGE_CODEC = MESSAGE_CODECS[DEFAULT_MESSAGE_CODEC_MODULE.CODEC_VERSION]
+DEFAULT_ATTACHMENT_CODEC = ATTACHMENT_CODECS[
+    DEFAULT_ATTACHMENT_CODEC_MODULE.CODEC_VERSION
+]
+DEFAULT_CHUNKED_ATTACHMENT_CODEC = CHUNKED_ATTACHMENT_CODECS[
+    DEFAULT_CHUNKED_ATTACHMENT_CODEC_MODULE.CODEC_VERSION
+]
+
+# the codecs the opt-in `encode_*_frames` functions encode with,
+# only peers on releases that can decode them can read what they encode
+FRAMED_MESSAGE_CODEC_MODULE = message_encoding_v3
+FRAMED_ATTACHMENT_CODEC_MODULE = attachment_encoding_v3
+
+
+def _get_version_header(codec_version: int) -> bytes:
+    """Get the header `encode_versioned` prefixes to data of a codec version."""
+    return encode_versioned(
+        None,
+        load_codec_module(
+            SimpleNamespace(
+                CODEC_VERSION=codec_version,
+                CODEC_OBJ_TYPE=object,
+                encode=lambda obj: b"",
+                decode=None,
+            )
+        ),
+    )
+
+
+# version headers and the codec modules they select,
+# for decoding without copying the encoded data
+MESSAGE_CODEC_HEADERS = [
+    (_get_version_header(mod.CODEC_VERSION), mod)
+    for mod in [message_encoding_v1, message_encoding_v2, message_encoding_v3]
+]
+ATTACHMENT_METADATA_CODEC_HEADERS = [
+    (_get_version_header(mod.CODEC_VERSION), mod)
+    for mod in ATTACHMENT_METADATA_CODEC_MODULES
+]
+
+
+def _split_version_header(
+    data: bytes | bytearray | memoryview, codec_headers: list[tuple[bytes, ModuleType]]
+) -> tuple[ModuleType, memoryview]:
+    """Find the codec module of versioned encoded data, without copying it.
+
+    Returns:
+        tuple: the codec module and a view of the data after the version header
+    Raises:
+        ValueError: if the data's version isn't that of one of the codecs
+    """
+    data = memoryview(data).cast("B")
+    for header, codec_module in codec_headers:
+        if data[: len(header)] == header:
+            return codec_module, data[len(header) :]
+    raise ValueError("Unknown encoding version.")
+
+
+def _as_bytes(data: bytes | bytearray | memoryview) -> bytes | bytearray:
+    """Make encoded data decodable by codec_versioning's `decode_versioned`."""
+    return data if isinstance(data, (bytes, bytearray)) else bytes(data)
 
 
 def encode_message(content: MessageContent) -> bytes:
@@ -32,11 +135,119 @@ def encode_attachment(attachment: MessageAttachment) -> bytes:
     return encode_versioned(attachment, DEFAULT_ATTACHMENT_CODEC)
 
 
-def decode_message(data: bytes) -> MessageContent:
+def encode_chunked_attachment(attachment: ChunkedAttachment) -> bytes:
+    """Encode a ChunkedAttachment object with encoding versioning."""
+    return encode_versioned(attachment, DEFAULT_CHUNKED_ATTACHMENT_CODEC)
+
+
+def encode_message_frames(content: MessageContent) -> list[bytes | memoryview]:
+    """Encode a MessageContent without copying its parts' payloads.
+
+    Encodes with the `FRAMED_MESSAGE_CODEC_MODULE`, which peers on older
+    releases can't decode, so only use this in correspondences whose
+    members can.
+
+    Returns:
+        list: the frames of the versioned encoded message, the payloads
+            among them as given, to be written out in order or joined once
+    """
+    frames = FRAMED_MESSAGE_CODEC_MODULE.encode_to_frames(content)
+    header = _get_version_header(FRAMED_MESSAGE_CODEC_MODULE.CODEC_VERSION)
+    return [header + frames[0]] + frames[1:]
+
+
+def encode_attachment_frames(
+    attachment: MessageAttachment,
+) -> list[bytes | memoryview]:
+    """Encode a MessageAttachment without copying its payload.
+
+    Encodes with the `FRAMED_ATTACHMENT_CODEC_MODULE`, which peers on older
+    releases can't decode, so only use this in correspondences whose
+    members can.
+
+    Returns:
+        list: the frames of the versioned encoded attachment, the payload
+            among them as given, to be written out in order or joined once
+    """
+    frames = FRAMED_ATTACHMENT_CODEC_MODULE.encode_to_frames(attachment)
+    header = _get_version_header(FRAMED_ATTACHMENT_CODEC_MODULE.CODEC_VERSION)
+    return [header + frames[0]] + frames[1:]
+
+
+def decode_message(data: bytes | memoryview) -> MessageContent:
     """Decode a MessageContent object with encoding versioning."""
-    return decode_versioned(data, MESSAGE_CODECS)
+    return decode_versioned(_as_bytes(data), MESSAGE_CODECS)
 
 
-def decode_attachment(data: bytes) -> MessageAttachment:
+def decode_attachment(data: bytes | memoryview) -> MessageAttachment:
     """Decode a MessageAttachment object with encoding versioning."""
-    return decode_versioned(data, ATTACHMENT_CODECS)
+    return decode_versioned(_as_bytes(data), ATTACHMENT_CODECS)
+
+
+def decode_chunked_attachment(data: bytes | memoryview) -> ChunkedAttachment:
+    """Decode a ChunkedAttachment object with encoding versioning."""
+    return decode_versioned(_as_bytes(data), CHUNKED_ATTACHMENT_CODECS)
+
+
+def decode_message_view(data: bytes | bytearray | memoryview) -> MessageContent:
+    """Decode a MessageContent whose payloads are views into `data`.
+
+    The payloads of EmbeddedContentParts are memoryviews sharing `data`'s
+    buffer, which stays alive and must not be modified while they are in use.
+    Messages encoded with v1 codecs, which nest the payloads in the protobuf,
+    are decoded with copies of their payloads.
+    """
+    codec_module, data = _split_version_header(data, MESSAGE_CODEC_HEADERS)
+    return codec_module.decode_view(data)
+
+
+def decode_attachment_view(
+    data: bytes | bytearray | memoryview,
+) -> MessageAttachment:
+    """Decode a MessageAttachment whose payload is a view into `data`.
+
+    The payload is a memoryview sharing `data`'s buffer, which stays alive
+    and must not be modified while the payload is in use.
+    """
+    codec_module, data = _split_version_header(
+        data, ATTACHMENT_METADATA_CODEC_HEADERS
+    )
+    return codec_module.decode_view(data)
+
+
+def decode_attachment_metadata(
+    data: bytes | memoryview,
+    payload_loader: Callable[[], bytes | memoryview] | None = None,
+    payload_view_loader: Callable[[], memoryview] | None = None,
+) -> LazyMessageAttachment:
+    """Decode a MessageAttachment's metadata, loading its payload lazily.
+
+    Args:
+        data: the encoded attachment
+        payload_loader: loads the payload when it is first accessed,
+            by default the payload is read from `data`
+        payload_view_loader: loads the payload as a memoryview for
+            `get_payload_view()`, by default the payload is viewed in `data`
+            if `payload_loader` isn't given
+    """
+    codec_module, data = _split_version_header(
+        data, ATTACHMENT_METADATA_CODEC_HEADERS
+    )
+    return codec_module.decode_metadata(
+        data, payload_loader=payload_loader, payload_view_loader=payload_view_loader
+    )
+
+
+def decode_attachment_payload(data: bytes | memoryview) -> bytes:
+    """Decode only the payload of a MessageAttachment."""
+    return bytes(decode_attachment_payload_view(data))
+
+
+def decode_attachment_payload_view(
+    data: bytes | bytearray | memoryview,
+) -> memoryview:
+    """Decode only the payload of a MessageAttachment, as a view into `data`."""
+    codec_module, data = _split_version_header(
+        data, ATTACHMENT_METADATA_CODEC_HEADERS
+    )
+    return codec_module.decode_payload(data)
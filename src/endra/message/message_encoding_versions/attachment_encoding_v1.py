@@ -1,9 +1,12 @@
+from typing import Callable
 from ..message_content import (
     MessageAttachment,
+    LazyMessageAttachment,
 )
 from .message_encoding_utils import (
     dict_to_struct,
     struct_to_dict,
+    split_bytes_field,
 )
 from .message_v1_pb2 import (
     MessageAttachment as PbMessageAttachment,
@@ -12,13 +15,17 @@ from .message_v1_pb2 import (
 CODEC_VERSION = 1
 CODEC_OBJ_TYPE = MessageAttachment
 
+PAYLOAD_FIELD_NUMBER = PbMessageAttachment.DESCRIPTOR.fields_by_name[
+    "payload"
+].number
+
 
 def encode(att: CODEC_OBJ_TYPE) -> bytes:
     pb_msg = PbMessageAttachment()
     pb_msg.media_type = att.media_type
     pb_msg.payload_hash = att.payload_hash
     pb_msg.size = att.size
-    pb_msg.payload = att.payload
+    pb_msg.payload = bytes(att.payload)
     pb_msg.derived_properties.CopyFrom(dict_to_struct(att.derived_properties))
     pb_msg.user_attributes.CopyFrom(dict_to_struct(att.user_attributes))
 
@@ -43,3 +50,64 @@ def decode(data: bytes) -> CODEC_OBJ_TYPE:
         derived_properties=derived_properties,
         user_attributes=user_attributes,
     )
+
+
+def decode_view(data: bytes | memoryview) -> CODEC_OBJ_TYPE:
+    """Decode an attachment whose payload is a view into `data`."""
+    metadata, payload = split_bytes_field(data, PAYLOAD_FIELD_NUMBER)
+    pb_msg = PbMessageAttachment()
+    pb_msg.ParseFromString(metadata)
+    return MessageAttachment(
+        media_type=pb_msg.media_type,
+        payload_hash=pb_msg.payload_hash,
+        size=pb_msg.size,
+        payload=payload if payload is not None else memoryview(b""),
+        derived_properties=struct_to_dict(pb_msg.derived_properties),
+        user_attributes=struct_to_dict(pb_msg.user_attributes),
+    )
+
+
+def decode_metadata(
+    data: bytes | memoryview,
+    payload_loader: Callable[[], bytes | memoryview] | None = None,
+    payload_view_loader: Callable[[], memoryview] | None = None,
+) -> LazyMessageAttachment:
+    """Decode an attachment's metadata without decoding its payload.
+
+    Args:
+        data: the encoded attachment
+        payload_loader: loads the payload when it is accessed, by default
+            the payload is read from `data`
+        payload_view_loader: loads the payload as a memoryview, by default
+            the payload is viewed in `data` if `payload_loader` isn't given
+    """
+    metadata, payload = split_bytes_field(data, PAYLOAD_FIELD_NUMBER)
+    pb_msg = PbMessageAttachment()
+    pb_msg.ParseFromString(metadata)
+    if payload is None:
+        payload = memoryview(b"")
+    if payload_loader is None:
+
+        def payload_loader() -> bytes:
+            return bytes(payload)
+
+        if payload_view_loader is None:
+
+            def payload_view_loader() -> memoryview:
+                return payload
+
+    return LazyMessageAttachment(
+        media_type=pb_msg.media_type,
+        payload_hash=pb_msg.payload_hash,
+        size=pb_msg.size,
+        derived_properties=struct_to_dict(pb_msg.derived_properties),
+        user_attributes=struct_to_dict(pb_msg.user_attributes),
+        payload_loader=payload_loader,
+        payload_view_loader=payload_view_loader,
+    )
+
+
+def decode_payload(data: bytes | memoryview) -> memoryview:
+    """Decode only an encoded attachment's payload, as a view into `data`."""
+    _, payload = split_bytes_field(data, PAYLOAD_FIELD_NUMBER)
+    return payload if payload is not None else memoryview(b"")
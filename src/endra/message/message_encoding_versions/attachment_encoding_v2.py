@@ -0,0 +1,110 @@
+"""Framed attachment encoding, keeping the payload out of the protobuf.
+
+The attachment's metadata is encoded as a v1 protobuf MessageAttachment
+without its payload, and the payload is appended as a separate frame,
+so that encoding doesn't copy the payload and decoding copies it only once,
+or not at all with `decode_view`.
+"""
+
+from typing import Callable
+from ..message_content import (
+    MessageAttachment,
+    LazyMessageAttachment,
+)
+from .message_encoding_utils import (
+    dict_to_struct,
+    struct_to_dict,
+    encode_frames,
+    decode_frames,
+)
+from .message_v1_pb2 import (
+    MessageAttachment as PbMessageAttachment,
+)
+
+CODEC_VERSION = 2
+CODEC_OBJ_TYPE = MessageAttachment
+
+
+def encode_to_frames(att: CODEC_OBJ_TYPE) -> list[bytes | memoryview]:
+    pb_msg = PbMessageAttachment()
+    pb_msg.media_type = att.media_type
+    pb_msg.payload_hash = att.payload_hash
+    pb_msg.size = att.size
+    pb_msg.derived_properties.CopyFrom(dict_to_struct(att.derived_properties))
+    pb_msg.user_attributes.CopyFrom(dict_to_struct(att.user_attributes))
+
+    return encode_frames(pb_msg.SerializeToString(), [att.payload])
+
+
+def encode(att: CODEC_OBJ_TYPE) -> bytes:
+    return b"".join(encode_to_frames(att))
+
+
+def _decode_header(header: memoryview) -> PbMessageAttachment:
+    pb_msg = PbMessageAttachment()
+    pb_msg.ParseFromString(header)
+    return pb_msg
+
+
+def decode(data: bytes | memoryview) -> CODEC_OBJ_TYPE:
+    attachment = decode_view(data)
+    attachment.payload = bytes(attachment.payload)
+    return attachment
+
+
+def decode_view(data: bytes | memoryview) -> CODEC_OBJ_TYPE:
+    """Decode an attachment whose payload is a view into `data`."""
+    header, (payload,) = decode_frames(data)
+    pb_msg = _decode_header(header)
+
+    return MessageAttachment(
+        media_type=pb_msg.media_type,
+        payload_hash=pb_msg.payload_hash,
+        size=pb_msg.size,
+        payload=payload,
+        derived_properties=struct_to_dict(pb_msg.derived_properties),
+        user_attributes=struct_to_dict(pb_msg.user_attributes),
+    )
+
+
+def decode_metadata(
+    data: bytes | memoryview,
+    payload_loader: Callable[[], bytes | memoryview] | None = None,
+    payload_view_loader: Callable[[], memoryview] | None = None,
+) -> LazyMessageAttachment:
+    """Decode an attachment's metadata without decoding its payload.
+
+    Args:
+        data: the encoded attachment
+        payload_loader: loads the payload when it is accessed, by default
+            the payload is read from `data`
+        payload_view_loader: loads the payload as a memoryview, by default
+            the payload is viewed in `data` if `payload_loader` isn't given
+    """
+    header, (payload,) = decode_frames(data)
+    pb_msg = _decode_header(header)
+    if payload_loader is None:
+
+        def payload_loader() -> bytes:
+            return bytes(payload)
+
+        if payload_view_loader is None:
+
+            def payload_view_loader() -> memoryview:
+                return payload
+
+    return LazyMessageAttachment(
+        media_type=pb_msg.media_type,
+        payload_hash=pb_msg.payload_hash,
+        size=pb_msg.size,
+        derived_properties=struct_to_dict(pb_msg.derived_properties),
+        user_attributes=struct_to_dict(pb_msg.user_attributes),
+        payload_loader=payload_loader,
+        payload_view_loader=payload_view_loader,
+    )
+
+
+def decode_payload(data: bytes | memoryview) -> memoryview:
+    """Decode only an encoded attachment's payload, as a view into `data`."""
+    _, (payload,) = decode_frames(data)
+    return payload
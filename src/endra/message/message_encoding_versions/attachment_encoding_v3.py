@@ -0,0 +1,116 @@
+"""Framed attachment encoding with compact metadata dicts.
+
+Like attachment_encoding_v2, but the metadata dicts are also kept out of
+the protobuf and encoded as msgpack maps with `encode_dict`, which is faster
+than protobuf Structs and preserves the types of keys and values.
+
+Frames: derived properties, user attributes, payload.
+"""
+
+from typing import Callable
+from ..message_content import (
+    MessageAttachment,
+    LazyMessageAttachment,
+)
+from .message_encoding_utils import (
+    encode_dict,
+    decode_dict,
+    encode_frames,
+    decode_frames,
+)
+from .message_v1_pb2 import (
+    MessageAttachment as PbMessageAttachment,
+)
+
+CODEC_VERSION = 3
+CODEC_OBJ_TYPE = MessageAttachment
+
+
+def encode_to_frames(att: CODEC_OBJ_TYPE) -> list[bytes | memoryview]:
+    pb_msg = PbMessageAttachment()
+    pb_msg.media_type = att.media_type
+    pb_msg.payload_hash = att.payload_hash
+    pb_msg.size = att.size
+
+    return encode_frames(
+        pb_msg.SerializeToString(),
+        [
+            encode_dict(att.derived_properties),
+            encode_dict(att.user_attributes),
+            att.payload,
+        ],
+    )
+
+
+def encode(att: CODEC_OBJ_TYPE) -> bytes:
+    return b"".join(encode_to_frames(att))
+
+
+def _decode_header(header: memoryview) -> PbMessageAttachment:
+    pb_msg = PbMessageAttachment()
+    pb_msg.ParseFromString(header)
+    return pb_msg
+
+
+def decode(data: bytes | memoryview) -> CODEC_OBJ_TYPE:
+    attachment = decode_view(data)
+    attachment.payload = bytes(attachment.payload)
+    return attachment
+
+
+def decode_view(data: bytes | memoryview) -> CODEC_OBJ_TYPE:
+    """Decode an attachment whose payload is a view into `data`."""
+    header, (derived_properties, user_attributes, payload) = decode_frames(data)
+    pb_msg = _decode_header(header)
+
+    return MessageAttachment(
+        media_type=pb_msg.media_type,
+        payload_hash=pb_msg.payload_hash,
+        size=pb_msg.size,
+        payload=payload,
+        derived_properties=decode_dict(derived_properties),
+        user_attributes=decode_dict(user_attributes),
+    )
+
+
+def decode_metadata(
+    data: bytes | memoryview,
+    payload_loader: Callable[[], bytes | memoryview] | None = None,
+    payload_view_loader: Callable[[], memoryview] | None = None,
+) -> LazyMessageAttachment:
+    """Decode an attachment's metadata without decoding its payload.
+
+    Args:
+        data: the encoded attachment
+        payload_loader: loads the payload when it is accessed, by default
+            the payload is read from `data`
+        payload_view_loader: loads the payload as a memoryview, by default
+            the payload is viewed in `data` if `payload_loader` isn't given
+    """
+    header, (derived_properties, user_attributes, payload) = decode_frames(data)
+    pb_msg = _decode_header(header)
+    if payload_loader is None:
+
+        def payload_loader() -> bytes:
+            return bytes(payload)
+
+        if payload_view_loader is None:
+
+            def payload_view_loader() -> memoryview:
+                return payload
+
+    return LazyMessageAttachment(
+        media_type=pb_msg.media_type,
+        payload_hash=pb_msg.payload_hash,
+        size=pb_msg.size,
+        derived_properties=decode_dict(derived_properties),
+        user_attributes=decode_dict(user_attributes),
+        payload_loader=payload_loader,
+        payload_view_loader=payload_view_loader,
+    )
+
+
+def decode_payload(data: bytes | memoryview) -> memoryview:
+    """Decode only an encoded attachment's payload, as a view into `data`."""
+    _, (_, _, payload) = decode_frames(data)
+    return payload
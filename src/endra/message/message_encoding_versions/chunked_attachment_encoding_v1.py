@@ -0,0 +1,41 @@
+from ..message_content import (
+    ChunkedAttachment,
+)
+from .message_encoding_utils import (
+    dict_to_struct,
+    struct_to_dict,
+)
+from .chunked_attachment_v1_pb2 import (
+    ChunkedAttachment as PbChunkedAttachment,
+)
+
+CODEC_VERSION = 1
+CODEC_OBJ_TYPE = ChunkedAttachment
+
+
+def encode(att: CODEC_OBJ_TYPE) -> bytes:
+    pb_msg = PbChunkedAttachment()
+    pb_msg.media_type = att.media_type
+    pb_msg.payload_hash = att.payload_hash
+    pb_msg.size = att.size
+    pb_msg.derived_properties.CopyFrom(dict_to_struct(att.derived_properties))
+    pb_msg.user_attributes.CopyFrom(dict_to_struct(att.user_attributes))
+    pb_msg.chunk_size = att.chunk_size
+    pb_msg.chunk_ids.extend(att.chunk_ids)
+
+    return pb_msg.SerializeToString()
+
+
+def decode(data: bytes) -> CODEC_OBJ_TYPE:
+    pb_msg = PbChunkedAttachment()
+    pb_msg.ParseFromString(data)
+
+    return ChunkedAttachment(
+        media_type=pb_msg.media_type,
+        payload_hash=pb_msg.payload_hash,
+        size=pb_msg.size,
+        derived_properties=struct_to_dict(pb_msg.derived_properties),
+        user_attributes=struct_to_dict(pb_msg.user_attributes),
+        chunk_size=pb_msg.chunk_size,
+        chunk_ids=list(pb_msg.chunk_ids),
+    )
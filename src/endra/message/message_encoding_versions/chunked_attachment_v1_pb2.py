@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# Generated by the protocol buffer compiler.  DO NOT EDIT!
+# NO CHECKED-IN PROTOBUF GENCODE
+# source: chunked_attachment_v1.proto
+# Protobuf Python Version: 5.29.0
+"""Generated protocol buffer code."""
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import descriptor_pool as _descriptor_pool
+from google.protobuf import runtime_version as _runtime_version
+from google.protobuf import symbol_database as _symbol_database
+from google.protobuf.internal import builder as _builder
+_runtime_version.ValidateProtobufRuntimeVersion(
+    _runtime_version.Domain.PUBLIC,
+    5,
+    29,
+    0,
+    '',
+    'chunked_attachment_v1.proto'
+)
+# @@protoc_insertion_point(imports)
+
+_sym_db = _symbol_database.Default()
+
+
+from google.protobuf import struct_pb2 as google_dot_protobuf_dot_struct__pb2
+
+
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x1b\x63hunked_attachment_v1.proto\x12\tmessaging\x1a\x1cgoogle/protobuf/struct.proto\"\xd9\x01\n\x11\x43hunkedAttachment\x12\x12\n\nmedia_type\x18\x01 \x01(\t\x12\x14\n\x0cpayload_hash\x18\x02 \x01(\t\x12\x0c\n\x04size\x18\x03 \x01(\x04\x12\x33\n\x12\x64\x65rived_properties\x18\x04 \x01(\x0b\x32\x17.google.protobuf.Struct\x12\x30\n\x0fuser_attributes\x18\x05 \x01(\x0b\x32\x17.google.protobuf.Struct\x12\x12\n\nchunk_size\x18\x06 \x01(\r\x12\x11\n\tchunk_ids\x18\x07 \x03(\x0c\x62\x06proto3')
+
+_globals = globals()
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'chunked_attachment_v1_pb2', _globals)
+if not _descriptor._USE_C_DESCRIPTORS:
+  DESCRIPTOR._loaded_options = None
+  _globals['_CHUNKEDATTACHMENT']._serialized_start=73
+  _globals['_CHUNKEDATTACHMENT']._serialized_end=290
+# @@protoc_insertion_point(module_scope)
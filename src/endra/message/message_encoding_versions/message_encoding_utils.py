@@ -1,3 +1,4 @@
+import msgpack
 from enum import Enum
 from google.protobuf.struct_pb2 import Struct
 from .message_v1_pb2 import (
@@ -18,3 +19,152 @@ def dict_to_struct(d: dict) -> Struct:
 
 def struct_to_dict(s: Struct) -> dict:
     return dict(s)
+
+
+# the initial size of the buffer metadata dicts are encoded into,
+# it grows as needed
+METADATA_BUFFER_SIZE = 1024
+
+
+def encode_dict(d: dict) -> bytes:
+    """Encode a metadata dict compactly as a msgpack map.
+
+    Supports None, bool, int, float, str, bytes, list and dict values,
+    with keys of any of those types that are hashable.
+    Unlike JSON or a protobuf Struct, every supported value decodes to
+    an equal value of the same type, e.g. ints don't become floats,
+    non-str keys don't become strs and bytes values are kept.
+    bytearrays are encoded like bytes and decode as bytes.
+
+    Raises:
+        TypeError: if the dict contains a value of an unsupported type,
+            including subclasses of the supported types
+        ValueError: if the dict contains an int outside the range of
+            64-bit ints
+    """
+    if type(d) is not dict:
+        raise TypeError(f"Metadata must be a dict, not {type(d).__name__}")
+    try:
+        # packb() would allocate a 256 KiB buffer for every dict
+        packer = msgpack.Packer(
+            use_bin_type=True, strict_types=True, buf_size=METADATA_BUFFER_SIZE
+        )
+        return packer.pack(d)
+    except OverflowError:
+        raise ValueError("Ints in metadata must fit in 64 bits.") from None
+
+
+def decode_dict(data: bytes | memoryview) -> dict:
+    """Decode a metadata dict encoded with `encode_dict`."""
+    d = msgpack.unpackb(data, raw=False, strict_map_key=False)
+    if type(d) is not dict:
+        raise ValueError("Invalid encoded metadata dict.")
+    return d
+
+
+def _read_varint(data: memoryview, pos: int) -> tuple[int, int]:
+    """Read a protobuf varint, returning its value and the next position."""
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def split_bytes_field(
+    data: bytes | bytearray | memoryview, field_number: int
+) -> tuple[bytes, memoryview | None]:
+    """Separate a top-level bytes field from a serialised protobuf message.
+
+    Scans the message's wire format without parsing it, to avoid copying
+    large payloads when only the message's other fields are needed.
+
+    Returns:
+        tuple: the serialised message without the given field, which can be
+            parsed as usual, and a view of the field's value in `data`, or
+            None if the message doesn't have the field
+    """
+    data = memoryview(data).cast("B")
+    other_fields = bytearray()
+    field_value = None
+    pos = 0
+    while pos < len(data):
+        field_start = pos
+        tag, pos = _read_varint(data, pos)
+        wire_type = tag & 0x07
+        if wire_type == 0:  # varint
+            _, pos = _read_varint(data, pos)
+        elif wire_type == 1:  # 64-bit
+            pos += 8
+        elif wire_type == 2:  # length-delimited
+            length, pos = _read_varint(data, pos)
+            if tag >> 3 == field_number:
+                field_value = data[pos : pos + length]
+                pos += length
+                continue
+            pos += length
+        elif wire_type == 5:  # 32-bit
+            pos += 4
+        else:
+            raise ValueError(f"Unsupported protobuf wire type: {wire_type}")
+        other_fields += data[field_start:pos]
+    return bytes(other_fields), field_value
+
+
+def encode_varint(value: int) -> bytes:
+    """Encode a non-negative integer as a protobuf-style varint."""
+    encoded = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            encoded.append(byte | 0x80)
+        else:
+            encoded.append(byte)
+            return bytes(encoded)
+
+
+def encode_frames(
+    header: bytes, payloads: list[bytes | memoryview]
+) -> list[bytes | memoryview]:
+    """Frame a header and payloads without copying the payloads.
+
+    Layout: header length, header, number of payloads, payload lengths,
+    payloads; all lengths and counts are varints.
+
+    Returns:
+        list: the frames, to be written out in order or joined once
+    """
+    sizes = [encode_varint(len(header)), header, encode_varint(len(payloads))]
+    sizes += [encode_varint(memoryview(payload).nbytes) for payload in payloads]
+    return [b"".join(sizes)] + list(payloads)
+
+
+def decode_frames(
+    data: bytes | bytearray | memoryview,
+) -> tuple[memoryview, list[memoryview]]:
+    """Split framed data into its header and payloads, without copying.
+
+    Returns:
+        tuple: a view of the header and views of the payloads in `data`
+    """
+    data = memoryview(data).cast("B")
+    header_length, pos = _read_varint(data, 0)
+    header = data[pos : pos + header_length]
+    pos += header_length
+    n_payloads, pos = _read_varint(data, pos)
+    sizes = []
+    for _ in range(n_payloads):
+        size, pos = _read_varint(data, pos)
+        sizes.append(size)
+    payloads = []
+    for size in sizes:
+        payloads.append(data[pos : pos + size])
+        pos += size
+    if pos != len(data):
+        raise ValueError("Framed data is longer than its frames.")
+    return header, payloads
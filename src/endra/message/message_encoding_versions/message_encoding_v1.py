@@ -28,7 +28,7 @@ def encode(msg: CODEC_OBJ_TYPE) -> bytes:
             entry.part_data.rendering_metadata.CopyFrom(
                 dict_to_struct(part.rendering_metadata)
             )
-            entry.part_data.payload = part.payload
+            entry.part_data.payload = bytes(part.payload)
         elif isinstance(part, ReferencedContentPart):
             entry.part_ref.part_id = part.part_id
             entry.part_ref.ref_content_id = part.ref_content_id
@@ -83,3 +83,7 @@ def decode(data: bytes) -> CODEC_OBJ_TYPE:
     return MessageContent(
         message_metadata=struct_to_dict(pb_msg.message_metadata), message_parts=parts
     )
+
+
+# the payloads are nested in the protobuf, so they can't be decoded as views
+decode_view = decode
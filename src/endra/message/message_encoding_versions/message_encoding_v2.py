@@ -0,0 +1,109 @@
+"""Framed message encoding, keeping part payloads out of the protobuf.
+
+The message is encoded as a v1 protobuf MessageContent whose
+EmbeddedContentParts have empty payloads, followed by the parts' payloads
+as separate frames in the order of the parts, so that encoding doesn't copy
+the payloads and decoding copies each of them only once,
+or not at all with `decode_view`.
+"""
+
+from ..message_content import (
+    MessageContent,
+    EmbeddedContentPart,
+    ReferencedContentPart,
+    AttachedContentPart,
+)
+from .message_encoding_utils import (
+    dict_to_struct,
+    struct_to_dict,
+    encode_frames,
+    decode_frames,
+)
+from .message_v1_pb2 import (
+    MessageContent as PbMessage,
+)
+
+CODEC_VERSION = 2
+CODEC_OBJ_TYPE = MessageContent
+
+
+def encode_to_frames(msg: CODEC_OBJ_TYPE) -> list[bytes | memoryview]:
+    pb_msg = PbMessage()
+    pb_msg.message_metadata.CopyFrom(dict_to_struct(msg.message_metadata))
+
+    payloads = []
+    for part in msg.message_parts:
+        entry = pb_msg.message_parts.add()
+        if isinstance(part, EmbeddedContentPart):
+            entry.part_data.part_id = part.part_id
+            entry.part_data.media_type = part.media_type
+            entry.part_data.rendering_metadata.CopyFrom(
+                dict_to_struct(part.rendering_metadata)
+            )
+            payloads.append(part.payload)
+        elif isinstance(part, ReferencedContentPart):
+            entry.part_ref.part_id = part.part_id
+            entry.part_ref.ref_content_id = part.ref_content_id
+            entry.part_ref.ref_part_id = part.ref_part_id
+        elif isinstance(part, AttachedContentPart):
+            entry.part_attach.part_id = part.part_id
+            entry.part_attach.rendering_metadata.CopyFrom(
+                dict_to_struct(part.rendering_metadata)
+            )
+            entry.part_attach.attachment_id = part.attachment_id
+        else:
+            raise TypeError(f"Unknown part type: {type(part)}")
+    return encode_frames(pb_msg.SerializeToString(), payloads)
+
+
+def encode(msg: CODEC_OBJ_TYPE) -> bytes:
+    return b"".join(encode_to_frames(msg))
+
+
+def decode(data: bytes | memoryview) -> CODEC_OBJ_TYPE:
+    msg = decode_view(data)
+    for part in msg.message_parts:
+        if isinstance(part, EmbeddedContentPart):
+            part.payload = bytes(part.payload)
+    return msg
+
+
+def decode_view(data: bytes | memoryview) -> CODEC_OBJ_TYPE:
+    """Decode a message whose part payloads are views into `data`."""
+    header, payloads = decode_frames(data)
+    payloads = iter(payloads)
+    pb_msg = PbMessage()
+    pb_msg.ParseFromString(header)
+    parts = []
+    for entry in pb_msg.message_parts:
+        if entry.HasField("part_data"):
+            part_data = entry.part_data
+            parts.append(
+                EmbeddedContentPart(
+                    part_id=part_data.part_id,
+                    media_type=part_data.media_type,
+                    rendering_metadata=struct_to_dict(part_data.rendering_metadata),
+                    payload=next(payloads),
+                )
+            )
+        elif entry.HasField("part_ref"):
+            part_ref = entry.part_ref
+            parts.append(
+                ReferencedContentPart(
+                    part_id=part_ref.part_id,
+                    ref_content_id=part_ref.ref_content_id,
+                    ref_part_id=part_ref.ref_part_id,
+                )
+            )
+        elif entry.HasField("part_attach"):
+            part_attach = entry.part_attach
+            parts.append(
+                AttachedContentPart(
+                    part_id=part_attach.part_id,
+                    rendering_metadata=struct_to_dict(part_attach.rendering_metadata),
+                    attachment_id=part_attach.attachment_id,
+                )
+            )
+    return MessageContent(
+        message_metadata=struct_to_dict(pb_msg.message_metadata), message_parts=parts
+    )
@@ -0,0 +1,105 @@
+"""Framed message encoding with compact metadata dicts.
+
+Like message_encoding_v2, but the metadata dicts are also kept out of the
+protobuf and encoded as msgpack maps with `encode_dict`, which is faster
+than protobuf Structs and preserves the types of keys and values.
+
+Frames: the message metadata, then for each part in order:
+EmbeddedContentPart: its rendering metadata and its payload;
+AttachedContentPart: its rendering metadata.
+"""
+
+from ..message_content import (
+    MessageContent,
+    EmbeddedContentPart,
+    ReferencedContentPart,
+    AttachedContentPart,
+)
+from .message_encoding_utils import (
+    encode_dict,
+    decode_dict,
+    encode_frames,
+    decode_frames,
+)
+from .message_v1_pb2 import (
+    MessageContent as PbMessage,
+)
+
+CODEC_VERSION = 3
+CODEC_OBJ_TYPE = MessageContent
+
+
+def encode_to_frames(msg: CODEC_OBJ_TYPE) -> list[bytes | memoryview]:
+    pb_msg = PbMessage()
+
+    frames = [encode_dict(msg.message_metadata)]
+    for part in msg.message_parts:
+        entry = pb_msg.message_parts.add()
+        if isinstance(part, EmbeddedContentPart):
+            entry.part_data.part_id = part.part_id
+            entry.part_data.media_type = part.media_type
+            frames.append(encode_dict(part.rendering_metadata))
+            frames.append(part.payload)
+        elif isinstance(part, ReferencedContentPart):
+            entry.part_ref.part_id = part.part_id
+            entry.part_ref.ref_content_id = part.ref_content_id
+            entry.part_ref.ref_part_id = part.ref_part_id
+        elif isinstance(part, AttachedContentPart):
+            entry.part_attach.part_id = part.part_id
+            entry.part_attach.attachment_id = part.attachment_id
+            frames.append(encode_dict(part.rendering_metadata))
+        else:
+            raise TypeError(f"Unknown part type: {type(part)}")
+    return encode_frames(pb_msg.SerializeToString(), frames)
+
+
+def encode(msg: CODEC_OBJ_TYPE) -> bytes:
+    return b"".join(encode_to_frames(msg))
+
+
+def decode(data: bytes | memoryview) -> CODEC_OBJ_TYPE:
+    msg = decode_view(data)
+    for part in msg.message_parts:
+        if isinstance(part, EmbeddedContentPart):
+            part.payload = bytes(part.payload)
+    return msg
+
+
+def decode_view(data: bytes | memoryview) -> CODEC_OBJ_TYPE:
+    """Decode a message whose part payloads are views into `data`."""
+    header, frames = decode_frames(data)
+    frames = iter(frames)
+    pb_msg = PbMessage()
+    pb_msg.ParseFromString(header)
+    message_metadata = decode_dict(next(frames))
+    parts = []
+    for entry in pb_msg.message_parts:
+        if entry.HasField("part_data"):
+            part_data = entry.part_data
+            parts.append(
+                EmbeddedContentPart(
+                    part_id=part_data.part_id,
+                    media_type=part_data.media_type,
+                    rendering_metadata=decode_dict(next(frames)),
+                    payload=next(frames),
+                )
+            )
+        elif entry.HasField("part_ref"):
+            part_ref = entry.part_ref
+            parts.append(
+                ReferencedContentPart(
+                    part_id=part_ref.part_id,
+                    ref_content_id=part_ref.ref_content_id,
+                    ref_part_id=part_ref.ref_part_id,
+                )
+            )
+        elif entry.HasField("part_attach"):
+            part_attach = entry.part_attach
+            parts.append(
+                AttachedContentPart(
+                    part_id=part_attach.part_id,
+                    rendering_metadata=decode_dict(next(frames)),
+                    attachment_id=part_attach.attachment_id,
+                )
+            )
+    return MessageContent(message_metadata=message_metadata, message_parts=parts)
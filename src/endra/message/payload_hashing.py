@@ -0,0 +1,55 @@
+"""Hashing of attachment payloads for integrity checks and deduplication.
+
+Payload hashes are strings that include the hashing algorithm,
+e.g. `sha256:9f86d08...`, so that the algorithm can be changed in the future
+without breaking verification of older attachments.
+"""
+
+import hashlib
+import mmap
+from typing import Iterable
+
+DEFAULT_HASH_ALGORITHM = "sha256"
+
+
+class PayloadHasher:
+    """Incrementally calculates a payload hash from streamed chunks."""
+
+    def __init__(self, algorithm: str = DEFAULT_HASH_ALGORITHM):
+        self.algorithm = algorithm
+        self._hasher = hashlib.new(algorithm)
+
+    def update(self, data: bytes | bytearray | memoryview | mmap.mmap) -> None:
+        self._hasher.update(data)
+
+    def get_hash(self) -> str:
+        return f"{self.algorithm}:{self._hasher.hexdigest()}"
+
+
+def hash_payload(
+    payload: bytes | bytearray | memoryview | mmap.mmap | Iterable[bytes],
+    algorithm: str = DEFAULT_HASH_ALGORITHM,
+) -> str:
+    """Calculate the hash of a payload, which may be streamed in chunks."""
+    hasher = PayloadHasher(algorithm)
+    if isinstance(payload, (bytes, bytearray, memoryview, mmap.mmap)):
+        hasher.update(payload)
+    else:
+        for chunk in payload:
+            hasher.update(chunk)
+    return hasher.get_hash()
+
+
+def get_hash_algorithm(payload_hash: str) -> str:
+    """Get the name of the algorithm a payload hash was calculated with."""
+    return payload_hash.split(":", 1)[0]
+
+
+def verify_payload_hash(
+    payload: bytes | bytearray | memoryview | mmap.mmap | Iterable[bytes],
+    payload_hash: str,
+) -> bool:
+    """Check whether a payload matches the given payload hash."""
+    if not payload_hash:
+        return False
+    return hash_payload(payload, get_hash_algorithm(payload_hash)) == payload_hash
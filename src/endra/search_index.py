@@ -0,0 +1,214 @@
+"""Persistent full-text index of a correspondence's message text.
+
+Indexes the text/* content parts of messages in an SQLite FTS5 table,
+so that searching a correspondence's history costs a query on the index
+rather than decoding every message.
+The index is fed incrementally as message blocks are received,
+with edited messages reindexed and deleted messages removed.
+"""
+
+import heapq
+import os
+import sqlite3
+from dataclasses import dataclass
+from threading import Lock
+from typing import Generator, Hashable, Iterable
+
+from .message import EmbeddedContentPart, MessageContent
+
+# the default maximum number of search results
+DEFAULT_SEARCH_LIMIT = 50
+
+
+@dataclass
+class SearchHit:
+    """A message found by searching a profile's correspondences."""
+
+    correspondence_id: str
+    message_id: bytes
+    # relevance, higher is better, the negated FTS5 bm25 rank; as that
+    # depends on each index's word statistics, scores from different
+    # correspondences' indexes are only roughly comparable
+    score: float
+
+
+def get_message_text(message_content: MessageContent) -> str:
+    """Get the text of a message content's text/* embedded parts."""
+    return "\n".join(
+        bytes(part.payload).decode("utf-8", errors="replace")
+        for part in message_content.message_parts
+        if isinstance(part, EmbeddedContentPart)
+        and part.media_type.startswith("text/")
+    )
+
+
+def make_match_expression(query: str) -> str:
+    """Turn a plain search query into an FTS5 expression matching all its words.
+
+    Words are quoted so that FTS5 operators and punctuation in the query
+    are searched for literally instead of raising syntax errors.
+    """
+    return " ".join('"' + word.replace('"', '""') + '"' for word in query.split())
+
+
+class SearchIndex:
+    """Message ID -> text index, searchable by relevance."""
+
+    def __init__(self, index_path: str | None = None):
+        """Load or create a search index.
+
+        Args:
+            index_path: the SQLite database file to persist the index in,
+                or `None` to keep the index in memory only
+        """
+        self.index_path = index_path
+        self._lock = Lock()
+        self._db = sqlite3.connect(index_path or ":memory:", check_same_thread=False)
+        if index_path:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS messages "
+                "(rowid INTEGER PRIMARY KEY, message_id BLOB UNIQUE NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS message_text USING fts5"
+                "(text, tokenize='unicode61 remove_diacritics 2')"
+            )
+
+    def add_message(self, message_id: bytes | bytearray, text: str) -> None:
+        """Index a message's text, replacing any previously indexed version."""
+        message_id = bytes(message_id)
+        with self._lock, self._db:
+            self._remove(message_id)
+            rowid = self._db.execute(
+                "INSERT INTO messages (message_id) VALUES (?)", (message_id,)
+            ).lastrowid
+            self._db.execute(
+                "INSERT INTO message_text (rowid, text) VALUES (?, ?)", (rowid, text)
+            )
+
+    def remove_message(self, message_id: bytes | bytearray) -> None:
+        """Remove a message from the index, if it is indexed."""
+        with self._lock, self._db:
+            self._remove(bytes(message_id))
+
+    def _remove(self, message_id: bytes) -> None:
+        row = self._db.execute(
+            "SELECT rowid FROM messages WHERE message_id = ?", (message_id,)
+        ).fetchone()
+        if row:
+            self._db.execute("DELETE FROM message_text WHERE rowid = ?", row)
+            self._db.execute("DELETE FROM messages WHERE rowid = ?", row)
+
+    def has_message(self, message_id: bytes | bytearray) -> bool:
+        """Check whether the given message has been indexed."""
+        with self._lock:
+            return (
+                self._db.execute(
+                    "SELECT 1 FROM messages WHERE message_id = ?", (bytes(message_id),)
+                ).fetchone()
+                is not None
+            )
+
+    def get_message_ids(self) -> set[bytes]:
+        """Get the IDs of all indexed messages."""
+        with self._lock:
+            return {
+                row[0] for row in self._db.execute("SELECT message_id FROM messages")
+            }
+
+    def search(self, query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[bytes]:
+        """Get the IDs of the messages containing all words of the query.
+
+        Returns:
+            message IDs, most relevant first
+        """
+        return [message_id for _, message_id in self.search_with_scores(query, limit)]
+
+    def search_with_scores(
+        self, query: str, limit: int = DEFAULT_SEARCH_LIMIT
+    ) -> list[tuple[float, bytes]]:
+        """Like `search`, but also get the relevance of each message.
+
+        Returns:
+            relevance scores (higher is better) and message IDs,
+            most relevant first
+        """
+        match_expression = make_match_expression(query)
+        if not match_expression:
+            return []
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT -rank, messages.message_id FROM message_text "
+                "JOIN messages ON messages.rowid = message_text.rowid "
+                "WHERE message_text MATCH ? ORDER BY rank LIMIT ?",
+                (match_expression, limit),
+            ).fetchall()
+        return rows
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def delete(self) -> None:
+        """Close the index and delete its persisted files."""
+        self.close()
+        if self.index_path:
+            for suffix in ["", "-wal", "-shm"]:
+                path = self.index_path + suffix
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+def search_index_file(
+    index_path: str, query: str, limit: int = DEFAULT_SEARCH_LIMIT
+) -> list[tuple[float, bytes]]:
+    """Search a persisted search index without keeping it open.
+
+    Returns:
+        relevance scores (higher is better) and message IDs,
+        most relevant first, or an empty list if there is no such index
+    """
+    if not os.path.exists(index_path):
+        return []
+    search_index = SearchIndex(index_path)
+    try:
+        return search_index.search_with_scores(query, limit)
+    finally:
+        search_index.close()
+
+
+def iter_top_hits(
+    results: Iterable[tuple[Hashable, list[tuple[float, bytes]]]], limit: int
+) -> Generator[tuple[Hashable, float, bytes], None, None]:
+    """Merge search results from many indexes as they arrive.
+
+    Yields each hit that ranks among the best `limit` hits found so far,
+    so the best `limit` of all yielded hits are the overall best ones.
+    Hits yielded early may be outranked later, so up to
+    `limit` times the number of indexes hits can be yielded.
+
+    Args:
+        results: the source of each index's results and the results,
+            as returned by `SearchIndex.search_with_scores`
+        limit: the number of best hits to find
+    Yields:
+        the source, relevance score and message ID of each hit
+    """
+    # min-heap of the scores of the best hits so far
+    top_scores: list[float] = []
+    for source, hits in results:
+        for score, message_id in hits:
+            if len(top_scores) < limit:
+                heapq.heappush(top_scores, score)
+            elif score > top_scores[0]:
+                heapq.heapreplace(top_scores, score)
+            else:
+                break  # the remaining hits rank even lower
+            yield source, score, message_id
@@ -0,0 +1,294 @@
+"""Microbenchmarks for the message and attachment codecs.
+
+Measures encoding and decoding of every registered codec version for
+messages with different numbers of parts and amounts of metadata,
+and attachments with payloads from 1 KB to 100 MB.
+For each case it reports the time per operation, the throughput,
+the number of memory blocks allocated and the peak memory used.
+
+Run it directly:
+    python tests/benchmark_message_encoding.py
+    python tests/benchmark_message_encoding.py --max-payload-size 1000000
+    python tests/benchmark_message_encoding.py --save results.json
+    python tests/benchmark_message_encoding.py --compare results.json
+
+With `--compare`, cases that got slower or use more memory than in the
+saved results by more than `--tolerance` are listed as regressions,
+and the script exits with a non-zero exit code.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from types import ModuleType
+from typing import Callable
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+from endra.message import MessageAttachment, MessageContent  # noqa: E402
+from endra.message.message_encoding import (  # noqa: E402
+    ATTACHMENT_CODECS,
+    MESSAGE_CODECS,
+)
+from endra.message.message_encoding_versions import (  # noqa: E402
+    attachment_encoding_v1,
+    attachment_encoding_v2,
+    attachment_encoding_v3,
+    message_encoding_v1,
+    message_encoding_v2,
+    message_encoding_v3,
+)
+
+# ADD NEW ENCODING MODULE VERSIONS HERE
+MESSAGE_CODEC_MODULES = [message_encoding_v1, message_encoding_v2, message_encoding_v3]
+ATTACHMENT_CODEC_MODULES = [
+    attachment_encoding_v1,
+    attachment_encoding_v2,
+    attachment_encoding_v3,
+]
+
+NUMS_OF_PARTS = [1, 10, 100]
+NUMS_OF_METADATA_FIELDS = [0, 10, 100]
+PAYLOAD_SIZES = [1_000, 100_000, 10_000_000, 100_000_000]
+
+# how long to repeat each operation for when timing it
+MIN_TIMING_DURATION = 0.2
+
+
+@dataclass
+class BenchmarkResult:
+    case: str
+    codec_version: int
+    operation: str
+    data_size: int  # number of bytes of encoded data
+    seconds_per_op: float
+    throughput: float  # encoded bytes per second
+    allocations: int  # number of memory blocks allocated and not yet freed
+    peak_memory: int  # in bytes, above what was allocated before the operation
+
+
+def make_metadata(num_fields: int) -> dict:
+    return {
+        f"field_{i}": (i if i % 3 == 0 else f"value {i}" if i % 3 == 1 else i / 2)
+        for i in range(num_fields)
+    }
+
+
+def make_message(num_parts: int, num_metadata_fields: int) -> MessageContent:
+    message = MessageContent(make_metadata(num_metadata_fields), [])
+    for i in range(num_parts):
+        message.add_embedded_part(
+            "text/plain",
+            make_metadata(num_metadata_fields),
+            f"Part {i} of a benchmark message. ".encode() * 4,
+        )
+    return message
+
+
+def make_attachment(payload_size: int) -> MessageAttachment:
+    return MessageAttachment.create(
+        media_type="application/octet-stream",
+        derived_properties=make_metadata(10),
+        user_attributes={"filename": "benchmark.bin"},
+        payload=os.urandom(payload_size),
+    )
+
+
+def time_operation(operation: Callable[[], object]) -> float:
+    """Get the average number of seconds an operation takes."""
+    num_ops = 0
+    start_time = time.perf_counter()
+    while True:
+        operation()
+        num_ops += 1
+        duration = time.perf_counter() - start_time
+        if duration >= MIN_TIMING_DURATION:
+            return duration / num_ops
+
+
+def measure_memory(operation: Callable[[], object]) -> tuple[int, int]:
+    """Get the allocations and peak memory of an operation.
+
+    Returns:
+        the number of memory blocks allocated by the operation that are still
+        held by its result, and the operation's peak memory usage in bytes
+    """
+    tracemalloc.start()
+    try:
+        baseline_memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.take_snapshot()
+        result = operation()
+        _, peak_memory = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        allocations = sum(
+            max(stat.count_diff, 0)
+            for stat in snapshot.compare_to(baseline, "lineno")
+        )
+        del result
+    finally:
+        tracemalloc.stop()
+    return allocations, peak_memory - baseline_memory
+
+
+def benchmark_codec(
+    case: str, codec_module: ModuleType, obj: object
+) -> list[BenchmarkResult]:
+    data = codec_module.encode(obj)
+    view = memoryview(data)
+    operations = {
+        "encode": lambda: codec_module.encode(obj),
+        "decode": lambda: codec_module.decode(view),
+    }
+    results = []
+    for operation_name, operation in operations.items():
+        seconds_per_op = time_operation(operation)
+        allocations, peak_memory = measure_memory(operation)
+        results.append(
+            BenchmarkResult(
+                case=case,
+                codec_version=codec_module.CODEC_VERSION,
+                operation=operation_name,
+                data_size=len(data),
+                seconds_per_op=seconds_per_op,
+                throughput=len(data) / seconds_per_op,
+                allocations=allocations,
+                peak_memory=peak_memory,
+            )
+        )
+    return results
+
+
+def run_benchmarks(
+    max_payload_size: int, codec_versions: list[int] | None = None
+) -> list[BenchmarkResult]:
+    def selected(modules: list[ModuleType]) -> list[ModuleType]:
+        return [
+            mod
+            for mod in modules
+            if codec_versions is None or mod.CODEC_VERSION in codec_versions
+        ]
+
+    results = []
+    for num_parts in NUMS_OF_PARTS:
+        for num_fields in NUMS_OF_METADATA_FIELDS:
+            message = make_message(num_parts, num_fields)
+            case = f"message/{num_parts}-parts/{num_fields}-fields"
+            for codec_module in selected(MESSAGE_CODEC_MODULES):
+                results += benchmark_codec(case, codec_module, message)
+                print_result_lines(results[-2:])
+    for payload_size in PAYLOAD_SIZES:
+        if payload_size > max_payload_size:
+            continue
+        attachment = make_attachment(payload_size)
+        case = f"attachment/{payload_size}-bytes"
+        for codec_module in selected(ATTACHMENT_CODEC_MODULES):
+            results += benchmark_codec(case, codec_module, attachment)
+            print_result_lines(results[-2:])
+        del attachment
+    return results
+
+
+def format_size(num_bytes: float) -> str:
+    for unit in ["B", "KB", "MB"]:
+        if abs(num_bytes) < 1000:
+            return f"{num_bytes:.1f}{unit}"
+        num_bytes /= 1000
+    return f"{num_bytes:.1f}GB"
+
+
+def print_result_lines(results: list[BenchmarkResult]) -> None:
+    for result in results:
+        print(
+            f"{result.case:36} v{result.codec_version} {result.operation:6} "
+            f"{result.seconds_per_op * 1e6:12.1f}us "
+            f"{format_size(result.throughput):>9}/s "
+            f"{result.allocations:8} allocs "
+            f"{format_size(result.peak_memory):>9} peak"
+        )
+
+
+def find_regressions(
+    results: list[BenchmarkResult],
+    baseline: list[BenchmarkResult],
+    tolerance: float,
+) -> list[str]:
+    """List the results that are worse than the baseline beyond the tolerance."""
+    baseline_results = {
+        (result.case, result.codec_version, result.operation): result
+        for result in baseline
+    }
+    regressions = []
+    for result in results:
+        old = baseline_results.get(
+            (result.case, result.codec_version, result.operation)
+        )
+        if not old:
+            continue
+        for metric in ["seconds_per_op", "peak_memory", "allocations"]:
+            old_value = getattr(old, metric)
+            new_value = getattr(result, metric)
+            if new_value > old_value * (1 + tolerance) and new_value > 0:
+                regressions.append(
+                    f"{result.case} v{result.codec_version} {result.operation}: "
+                    f"{metric} {old_value:.6g} -> {new_value:.6g}"
+                )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--max-payload-size",
+        type=int,
+        default=max(PAYLOAD_SIZES),
+        help="skip attachment payloads larger than this many bytes",
+    )
+    parser.add_argument(
+        "--codec-versions",
+        type=int,
+        nargs="+",
+        help="only benchmark these codec versions",
+    )
+    parser.add_argument("--save", help="save the results to this JSON file")
+    parser.add_argument(
+        "--compare", help="compare the results to those saved in this JSON file"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="relative worsening beyond which a result counts as a regression",
+    )
+    args = parser.parse_args()
+
+    for version in args.codec_versions or []:
+        if version not in MESSAGE_CODECS and version not in ATTACHMENT_CODECS:
+            parser.error(f"Unknown codec version: {version}")
+
+    results = run_benchmarks(args.max_payload_size, args.codec_versions)
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump([asdict(result) for result in results], file, indent=2)
+    if args.compare:
+        with open(args.compare, "r") as file:
+            baseline = [BenchmarkResult(**result) for result in json.load(file)]
+        regressions = find_regressions(results, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions:")
+            for regression in regressions:
+                print(regression)
+            return 1
+        print("\nNo regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+import _auto_run_with_pytest
+
+import time
+from threading import RLock
+
+from endra.activation_manager import ActivationManager
+
+
+class FakeCorrespondence:
+    def __init__(self, manager: ActivationManager):
+        self.manager = manager
+        self.is_active = False
+        self.lock = RLock()
+
+    def access(self) -> None:
+        with self.lock:
+            self.is_active = True
+            self.manager.touch(self)
+
+    def deactivate_if_unused(self) -> None:
+        with self.lock:
+            if not self.manager.is_active(self):
+                self.is_active = False
+
+
+def test_max_active():
+    manager = ActivationManager(max_active=2)
+    corresps = [FakeCorrespondence(manager) for _ in range(3)]
+    corresps[0].access()
+    corresps[1].access()
+    corresps[0].access()  # now corresps[1] is the least recently used
+    corresps[2].access()
+    manager.deactivate_evicted()
+
+    assert [c.is_active for c in corresps] == [True, False, True]
+    assert manager.get_num_active() == 2
+    assert not manager.is_active(corresps[1])
+
+    corresps[1].access()  # reactivated on demand
+    manager.deactivate_evicted()
+    assert [c.is_active for c in corresps] == [False, True, True]
+    manager.terminate()
+
+
+def test_touched_after_eviction():
+    manager = ActivationManager(max_active=1)
+    corresps = [FakeCorrespondence(manager) for _ in range(2)]
+    corresps[0].access()
+    corresps[1].access()  # evicts corresps[0]
+    corresps[0].access()  # used again before or after being deactivated
+    manager.deactivate_evicted()
+
+    assert [c.is_active for c in corresps] == [True, False]
+    assert manager.is_active(corresps[0])
+    manager.terminate()
+
+
+def test_idle_timeout():
+    manager = ActivationManager(idle_timeout=0.2)
+    idle = FakeCorrespondence(manager)
+    busy = FakeCorrespondence(manager)
+    idle.access()
+    for _ in range(8):
+        busy.access()
+        time.sleep(0.05)
+
+    assert not idle.is_active
+    assert busy.is_active
+    assert manager.get_num_active() == 1
+    manager.terminate()
@@ -0,0 +1,104 @@
+import _auto_run_with_pytest
+
+import random
+import threading
+import time
+
+from walytis_mutability.mutablock import DELETION_BLOCK, ORIGINAL_BLOCK, UPDATE_BLOCK
+
+from endra.block_events import (
+    BlockEventPipeline,
+    BlockKind,
+    MessageDeleted,
+    MessageEdited,
+    classify_block,
+)
+from endra.message import BLOCK_TOPIC_ATTACHMENT_CHUNKS, BLOCK_TOPIC_MESSAGES
+
+
+def test_classify_block():
+    assert classify_block([ORIGINAL_BLOCK, BLOCK_TOPIC_MESSAGES]) == BlockKind.MESSAGE
+    assert classify_block([UPDATE_BLOCK, "parent"]) == BlockKind.MESSAGE_EDIT
+    assert classify_block([DELETION_BLOCK, "parent"]) == BlockKind.MESSAGE_DELETION
+    assert classify_block([ORIGINAL_BLOCK, BLOCK_TOPIC_ATTACHMENT_CHUNKS]) is None
+    assert classify_block([]) is None
+
+
+def decoder(i: int):
+    def decode():
+        time.sleep(random.random() * 0.01)  # decoding takes varying time
+        if i % 10 == 0:
+            return None  # blocks that don't produce events
+        if i % 2:
+            return MessageDeleted("corresp", bytes([i]))
+        return MessageEdited("other_corresp", None)
+
+    return decode
+
+
+def test_event_order():
+    pipeline = BlockEventPipeline()
+    events = []
+    deleted_ids = []
+    pipeline.subscribe(events.append)
+    pipeline.subscribe(
+        lambda event: deleted_ids.append(event.message_id),
+        event_types=(MessageDeleted,),
+        correspondence_id="corresp",
+    )
+    for i in range(100):
+        pipeline.submit(decoder(i))
+    pipeline.terminate()
+
+    assert len(events) == 90
+    # events are delivered in the order the blocks were received
+    assert deleted_ids == [bytes([i]) for i in range(1, 100, 2)]
+
+
+def test_slow_handler():
+    pipeline = BlockEventPipeline()
+    unblock = threading.Event()
+    fast_events = []
+    slow = pipeline.subscribe(lambda event: unblock.wait(), max_queue_size=10)
+    pipeline.subscribe(fast_events.append)
+
+    start_time = time.monotonic()
+    for i in range(1, 100, 2):
+        pipeline.submit(decoder(i))
+    assert time.monotonic() - start_time < 0.1  # submitting doesn't block
+
+    time.sleep(0.5)
+    # the slow handler doesn't hold up the fast one
+    assert len(fast_events) == 50
+    # events the slow handler couldn't keep up with were dropped
+    assert slow.num_dropped > 0
+    unblock.set()
+    pipeline.terminate()
+
+
+def test_processing_order():
+    pipeline = BlockEventPipeline()
+    processed = []
+    events = []
+    pipeline.subscribe(events.append)
+
+    def processor(i: int):
+        def process():
+            time.sleep(random.random() * 0.001)
+            processed.append(i)
+            pipeline.submit(decoder(i))
+
+        return process
+
+    for i in range(1, 100, 2):
+        assert pipeline.process(processor(i))
+    pipeline.terminate()
+    # work queued after terminating is refused rather than silently dropped
+    assert not pipeline.process(processor(101))
+
+    # blocks are processed one at a time in order,
+    # and the events they submit are still delivered on terminating
+    assert processed == list(range(1, 100, 2))
+    assert [event.message_id for event in events] == [
+        bytes([i]) for i in range(1, 100, 2)
+    ]
@@ -0,0 +1,48 @@
+import _auto_run_with_pytest
+
+import os
+import tempfile
+
+from endra.block_index import BlockIndex
+
+BLOCK_IDS = [bytes([i, 0, 0, 0, 0]) for i in range(1, 6)]
+
+
+def test_topic_lookup():
+    index = BlockIndex()
+    index.add_block(BLOCK_IDS[0], ["EndraMessage"])
+    index.add_block(BLOCK_IDS[1], ["EndraAttachments", "image/png"])
+    index.add_block(BLOCK_IDS[2], ["EndraMessage"])
+    index.add_block(BLOCK_IDS[0], ["EndraMessage"])  # duplicate
+
+    assert index.get_block_ids("EndraMessage") == [BLOCK_IDS[0], BLOCK_IDS[2]]
+    assert index.get_block_ids("image/png") == [BLOCK_IDS[1]]
+    assert index.get_block_ids("unknown") == []
+    assert len(index) == 3
+
+
+def test_persistence():
+    index_path = os.path.join(tempfile.mkdtemp(), "index.jsonl")
+    index = BlockIndex(index_path)
+    for block_id in BLOCK_IDS:
+        index.add_block(bytearray(block_id), ["EndraMessage"])
+
+    reloaded = BlockIndex(index_path)
+    assert reloaded.get_block_ids("EndraMessage") == BLOCK_IDS
+    assert reloaded.has_block(BLOCK_IDS[3])
+
+    reloaded.delete()
+    assert not os.path.exists(index_path)
+
+
+def test_windowing():
+    index = BlockIndex()
+    for block_id in BLOCK_IDS:
+        index.add_block(block_id, ["EndraMessage"])
+
+    position = index.get_position("EndraMessage", BLOCK_IDS[3])
+    assert position == 3
+    assert index.slice_block_ids("EndraMessage", position - 2, position) == (
+        BLOCK_IDS[1:3]
+    )
+    assert index.count("EndraMessage") == len(BLOCK_IDS)
@@ -0,0 +1,172 @@
+import _auto_run_with_pytest
+
+import json
+import threading
+import time
+
+from brenthy_tools_beta.utils import bytes_to_string, string_to_bytes
+from brenthy_tools_beta.version_utils import encode_version
+
+from endra import endra_api_brenthy_api as api
+from endra.message import MessageContent, decode_message, encode_message
+
+
+class FakeMessage:
+    def __init__(self, message_id: bytes, content: MessageContent):
+        self.id = message_id
+        self.content = content
+
+
+class FakeCorrespondence:
+    def __init__(self, correspondence_id: str):
+        self.id = correspondence_id
+        self.messages: list[FakeMessage] = []
+
+    def add_message(self, message_content: MessageContent) -> None:
+        time.sleep(0.05)  # detect concurrent modifications
+        message_id = bytes([len(self.messages)])
+        self.messages = self.messages + [FakeMessage(message_id, message_content)]
+
+    def get_messages(self, before=None, limit=None) -> list[FakeMessage]:
+        assert before is None
+        return self.messages[-limit:] if limit else self.messages
+
+    def get_num_messages(self) -> int:
+        return len(self.messages)
+
+    def get_attachment(self, attachment_id: bytes):
+        raise KeyError(attachment_id)  # a bug, not a bad request
+
+
+class FakeProfile:
+    def __init__(self, did: str):
+        self.did = did
+        self.correspondences = {"corresp": FakeCorrespondence("corresp")}
+
+    def get_active_correspondences(self) -> set[str]:
+        return set(self.correspondences)
+
+    def get_correspondence(self, corresp_id: str) -> FakeCorrespondence:
+        return self.correspondences[corresp_id]
+
+
+def send_request(function: str, data: dict | bytes | None = None) -> bytearray:
+    """Make a request, returning the reply without the version header."""
+    if isinstance(data, dict):
+        data = json.dumps(data).encode()
+    request = (
+        encode_version((1, 0))
+        + bytearray([0])
+        + function.encode()
+        + bytearray([0])
+        + (data or b"")
+    )
+    reply = api.submit_request(request).result()
+    return reply[reply.index(0) + 1 :]
+
+
+def call(function: str, data: dict | bytes | None = None) -> dict:
+    """Make a request, with parameters given as a dict or encoded JSON."""
+    reply = send_request(function, data)
+    # like brenthy_tools, expect 1 for requests that were processed
+    assert reply[0] == 1
+    return json.loads(bytes(reply[1:]))
+
+
+def test_request_router():
+    profile = FakeProfile("did:fake:profile")
+    api.register_profile(profile)
+    try:
+        reply = call("get_active_correspondences")
+        assert reply == {"success": True, "correspondence_ids": ["corresp"]}
+        assert call("unknown_function")["error"] == api.NOT_UNDERSTOOD_ERROR
+        reply = call("get_profile_did", {"profile_did": "did:fake:other"})
+        assert reply["error"] == api.NO_SUCH_PROFILE_ERROR
+
+        # bad input gets an error reply rather than an internal error
+        reply = call("get_num_messages", {})
+        assert reply == {"success": False, "error": api.INVALID_REQUEST_ERROR}
+        reply = call("get_messages", {"correspondence_id": "corresp", "before": "n0t base64!"})
+        assert reply["error"] == api.INVALID_REQUEST_ERROR
+        reply = call("get_devices", b"[1, 2]")
+        assert reply["error"] == api.INVALID_REQUEST_ERROR
+        reply = call("get_devices", b"{not json")
+        assert reply["error"] == api.INVALID_REQUEST_ERROR
+        reply = call("get_messages", {"correspondence_id": "corresp", "limit": "2"})
+        assert reply["error"] == api.INVALID_REQUEST_ERROR
+        reply = call("add_message", {"correspondence_id": "corresp", "content": ""})
+        assert reply["error"] == api.INVALID_REQUEST_ERROR
+        reply = call("get_num_messages", {"correspondence_id": "other"})
+        assert reply["error"] == api.NO_SUCH_CORRESPONDENCE_ERROR
+
+        # errors in handlers are internal errors, not invalid requests
+        reply = send_request(
+            "get_attachment",
+            {"correspondence_id": "corresp", "attachment_id": "AAAA"},
+        )
+        assert reply[0] == 0
+        assert json.loads(bytes(reply[1:]))["success"] is False
+
+        # modifying requests for the same profile are serialised
+        def add_message(i: int):
+            content = MessageContent({}, [])
+            content.add_embedded_part("text/plain", {}, f"Hello {i}".encode())
+            call(
+                "add_message",
+                {
+                    "correspondence_id": "corresp",
+                    "content": bytes_to_string(encode_message(content)),
+                },
+            )
+
+        threads = [threading.Thread(target=add_message, args=(i,)) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        reply = call("get_num_messages", {"correspondence_id": "corresp"})
+        assert reply["num_messages"] == 5
+
+        reply = call("get_messages", {"correspondence_id": "corresp", "limit": 2})
+        messages = reply["messages"]
+        assert [string_to_bytes(m["message_id"]) for m in messages] == [b"\x03", b"\x04"]
+        content = decode_message(string_to_bytes(messages[0]["content"]))
+        assert bytes(content.message_parts[0].payload).startswith(b"Hello")
+    finally:
+        api.unregister_profile(profile.did)
+
+
+class FakeProtocol:
+    BAP_VERSION = 0
+
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.events: list[dict] = []
+        self.num_publish_calls = 0
+
+    def publish_batch(self, batch: list[dict]) -> None:
+        time.sleep(self.delay)
+        self.num_publish_calls += 1
+        self.events += batch
+
+
+def test_event_publishing():
+    fast_protocol = FakeProtocol()
+    slow_protocol = FakeProtocol(delay=0.5)
+    api.bap_protocol_modules = [fast_protocol, slow_protocol]
+    try:
+        start_time = time.monotonic()
+        for i in range(1000):
+            api.publish_event({"message_id": i}, topics=["messages"])
+        assert time.monotonic() - start_time < 0.5  # publishing doesn't block
+
+        time.sleep(0.2)
+        # the slow protocol doesn't hold up the fast one
+        assert len(fast_protocol.events) == 1000
+        # bursts of events are published in batches
+        assert fast_protocol.num_publish_calls < 100
+    finally:
+        api.stop_event_publishers()
+        api.bap_protocol_modules = []
+    expected_events = [{"topic": "messages", "message_id": i} for i in range(1000)]
+    assert slow_protocol.events == expected_events
@@ -0,0 +1,33 @@
+import _auto_run_with_pytest
+
+import threading
+
+from endra.change_feed import ChangeFeed, ChangeType
+
+
+def test_change_feed():
+    feed = ChangeFeed(max_length=3)
+    assert feed.get_changes() == []
+    feed.add(ChangeType.ADDED, "a")
+    feed.add(ChangeType.ADDED, "b")
+    since = feed.sequence
+    feed.add(ChangeType.REMOVED, "a")
+
+    changes = feed.get_changes(since)
+    assert [(c.change_type, c.key) for c in changes] == [(ChangeType.REMOVED, "a")]
+    assert feed.get_changes(feed.sequence) == []
+
+    feed.add(ChangeType.ADDED, "c")
+    feed.add(ChangeType.ADDED, "d")
+    assert feed.get_changes(0) is None  # the oldest changes are forgotten
+    assert len(feed.get_changes(since)) == 3
+
+
+def test_wait_for_changes():
+    feed = ChangeFeed()
+    assert feed.wait_for_changes(timeout=0.01) == []
+    timer = threading.Timer(0.05, feed.add, (ChangeType.ADDED, "a"))
+    timer.start()
+    changes = feed.wait_for_changes(timeout=5)
+    assert [c.key for c in changes] == ["a"]
+
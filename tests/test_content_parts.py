@@ -0,0 +1,200 @@
+import _auto_run_with_pytest
+
+from dataclasses import dataclass
+
+from endra.message import (
+    EmbeddedContentPart,
+    MessageAttachment,
+    ChunkedAttachment,
+    MessageContent,
+    encode_message,
+    decode_message,
+    encode_attachment,
+    encode_chunked_attachment,
+    load_attachment_metadata,
+    hash_payload,
+    resolve_message_content_parts,
+    get_message_content_parts,
+    BLOCK_TOPIC_ATTACHMENTS,
+    BLOCK_TOPIC_CHUNKED_ATTACHMENTS,
+    BLOCK_TOPIC_ATTACHMENT_CHUNKS,
+    BLOCK_TOPIC_MESSAGES,
+    DecodedCache,
+    decoded_cache,
+)
+
+
+@dataclass
+class FakeBlock:
+    content: bytes
+    topics: list[str]
+
+
+class FakeBlockchain:
+    """In-memory stand-in for a correspondence's blockchain."""
+
+    def __init__(self):
+        self.blocks = {}
+        self.n_get_block_calls = 0
+
+    def add_block(self, block_id: bytes, content: bytes, topics: list[str]):
+        self.blocks[block_id] = FakeBlock(content, topics)
+
+    def get_block(self, block_id: bytes) -> FakeBlock:
+        self.n_get_block_calls += 1
+        return self.blocks[block_id]
+
+
+def test_batch_resolution():
+    decoded_cache.clear()
+    blockchain = FakeBlockchain()
+
+    quoted = MessageContent({}, [])
+    quoted.add_embedded_part("text/plain", {}, "First".encode())
+    quoted.add_embedded_part("text/plain", {}, "Second".encode())
+    blockchain.add_block(b"quoted", encode_message(quoted), [BLOCK_TOPIC_MESSAGES])
+
+    attachment = MessageAttachment.create(
+        media_type="text/plain",
+        derived_properties={},
+        user_attributes={},
+        payload="Attached".encode(),
+    )
+    blockchain.add_block(
+        b"attachment", encode_attachment(attachment), [BLOCK_TOPIC_ATTACHMENTS]
+    )
+
+    messages = []
+    for i in range(10):
+        message = MessageContent({}, [])
+        message.add_embedded_part("text/plain", {}, f"Reply {i}".encode())
+        message.add_referenced_part(b"quoted", 1)
+        message.add_referenced_part(b"quoted", 2)
+        message.add_attached_part({}, b"attachment")
+        messages.append(message)
+
+    resolved = resolve_message_content_parts(blockchain, messages)
+
+    # each referenced block is loaded only once for all messages
+    assert blockchain.n_get_block_calls == 2
+    assert len(resolved) == len(messages)
+    for i, parts in enumerate(resolved):
+        assert [part.payload for part in parts] == [
+            f"Reply {i}".encode(),
+            "First".encode(),
+            "Second".encode(),
+            "Attached".encode(),
+        ]
+    assert get_message_content_parts(blockchain, messages[0]) == resolved[0]
+
+
+def test_part_ids():
+    message = MessageContent({}, [])
+    for i in range(10000):
+        message.add_embedded_part("text/plain", {}, f"Part {i}".encode())
+    reference = message.add_referenced_part(b"quoted", 1)
+    attached = message.add_attached_part({}, b"attachment")
+
+    part_ids = [part.part_id for part in message.message_parts]
+    assert part_ids == list(range(1, 10003))
+    assert message.get_message_part(10001) is reference
+    assert message.get_message_part(10002) is attached
+
+    # part IDs survive encoding, and new parts don't reuse them
+    decoded = decode_message(encode_message(message))
+    assert bytes(decoded.get_message_part(5000).payload) == b"Part 4999"
+    assert decoded.add_embedded_part("text/plain", {}, b"").part_id == 10003
+
+    # parts replaced in place are still found
+    replacement = EmbeddedContentPart(20000, "text/plain", {}, b"Replaced")
+    message.message_parts[0] = replacement
+    assert message.get_message_part(20000) is replacement
+    assert message.get_message_part(10001) is reference
+
+
+def test_decoded_cache_eviction():
+    cache = DecodedCache(max_size=1000, max_entry_size=400)
+    cache.put(b"a", None, "A", size=300)
+    cache.put(b"b", b"v1", "B1", size=300)
+    cache.put(b"b", b"v2", "B2", size=300)
+    assert cache.get(b"a") == "A"  # marks a as recently used
+
+    cache.put(b"c", None, "C", size=300)  # evicts b/v1, the least recently used
+    assert cache.get(b"b", b"v1") is None
+    assert cache.get(b"b", b"v2") == "B2"
+    assert cache.size == 900
+
+    cache.put(b"d", None, "D", size=500)  # too large to cache
+    assert cache.get(b"d") is None
+
+    cache.invalidate(b"b")
+    assert cache.get(b"b", b"v2") is None
+    assert len(cache) == 2 and cache.size == 600
+
+
+def test_decoded_cache_copies():
+    cache = DecodedCache()
+    content = MessageContent({"thread": "a"}, [])
+    content.add_embedded_part("text/plain", {"bold": True}, b"Hello")
+    cached = cache.get_or_decode(b"message", None, lambda: content)
+
+    # modifying what the cache returns doesn't affect other callers
+    cached.add_embedded_part("text/plain", {}, b"there")
+    cached.message_parts[0].rendering_metadata["bold"] = False
+    cached.message_metadata["thread"] = "b"
+    fresh = cache.get(b"message")
+    assert len(fresh.message_parts) == 1
+    assert fresh.message_parts[0].rendering_metadata == {"bold": True}
+    assert fresh.message_metadata == {"thread": "a"}
+    assert fresh.get_next_part_id() == 2
+
+
+def test_decoded_cache_invalidated_while_decoding():
+    cache = DecodedCache()
+
+    def decode_while_edited():
+        content = MessageContent({"version": 1}, [])
+        cache.invalidate(b"message")  # e.g. a remote edit being received
+        return content
+
+    # content decoded before the block was invalidated isn't cached
+    cache.get_or_decode(b"message", None, decode_while_edited)
+    assert cache.get(b"message") is None
+    generation = cache.get_generation(b"message")
+    cache.get_or_decode(b"message", None, lambda: MessageContent({"version": 2}, []))
+    assert cache.get(b"message").message_metadata == {"version": 2}
+    assert cache.get_generation(b"message") == generation
+
+
+def test_lazy_chunked_attachment():
+    blockchain = FakeBlockchain()
+    chunks = [bytes([i]) * 100 for i in range(5)]
+    for i, chunk in enumerate(chunks):
+        blockchain.add_block(f"chunk-{i}".encode(), chunk, [BLOCK_TOPIC_ATTACHMENT_CHUNKS])
+    manifest = ChunkedAttachment(
+        media_type="video/mp4",
+        payload_hash=hash_payload(chunks),
+        size=500,
+        derived_properties={},
+        user_attributes={"filename": "video.mp4"},
+        chunk_size=100,
+        chunk_ids=[f"chunk-{i}".encode() for i in range(5)],
+    )
+    blockchain.add_block(
+        b"manifest",
+        encode_chunked_attachment(manifest),
+        [BLOCK_TOPIC_CHUNKED_ATTACHMENTS],
+    )
+
+    attachment = load_attachment_metadata(blockchain, b"manifest")
+    assert attachment.user_attributes == {"filename": "video.mp4"}
+    assert not attachment.is_payload_loaded
+
+    n_calls = blockchain.n_get_block_calls
+    stream = attachment.open_payload()
+    assert stream.read(150) == chunks[0] + chunks[1][:50]
+    assert blockchain.n_get_block_calls == n_calls + 2  # only read 2 chunks
+    assert not attachment.is_payload_loaded
+
+    assert attachment.payload == b"".join(chunks)
+    assert attachment.verify_hash()
@@ -3,6 +3,7 @@ import walytis_beta_api as waly
 import os
 import shutil
 import tempfile
+import threading
 
 import _testing_utils
 import walytis_identities
@@ -78,6 +79,34 @@ def test_create_correspondence():
         and pytest.corresp.id not in pytest.profile.get_archived_correspondences(),
         "  -> get_active_correspondences() & get_archived_correspondences()"
     )
+    mark(
+        corresp is pytest.corresp,
+        "  -> get_correspondence() reuses Correspondence objects"
+    )
+    changes = pytest.profile.correspondence_changes.get_changes()
+    mark(
+        changes and changes[-1].key == pytest.corresp.id,
+        "  -> correspondence_changes"
+    )
+
+
+def test_lazy_load():
+    pytest.profile.terminate()
+    pytest.profile = Profile.load(
+        pytest.profile_config_dir, pytest.KEY, lazy=True
+    )
+    mark(
+        pytest.corresp.id in pytest.profile.get_active_correspondences(),
+        "Lazy load: correspondences listed before catching up"
+    )
+    pytest.profile.get_correspondence_readiness(pytest.corresp.id).result(60)
+    pytest.profile.wait_until_ready(60)
+    mark(
+        {"keystores", "did_managers", "profile_catch_up", "correspondences_catch_up"}
+        <= set(pytest.profile.startup_timings),
+        "Lazy load: startup timings"
+    )
+    pytest.corresp = pytest.profile.get_correspondence(pytest.corresp.id)
 
 
 def test_archive_correspondence():
@@ -130,6 +159,71 @@ def test_message_edit():
     )
 
 
+def test_block_events():
+    events = []
+    edited = threading.Event()
+
+    def on_event(event):
+        events.append(event)
+        if isinstance(event, endra.MessageEdited):
+            edited.set()
+
+    message_content = MessageContent({}, [])
+    message_content.add_embedded_part("text/plain", {}, b"hello events")
+    new_message_content = MessageContent({}, [])
+    new_message_content.add_embedded_part("text/plain", {}, b"Hello events!")
+
+    subscription = pytest.corresp.subscribe(on_event)
+    pytest.corresp.add_message(message_content)
+    pytest.corresp.get_messages()[-1].edit(new_message_content)
+    edited.wait(10)
+    pytest.corresp.unsubscribe(subscription)
+    mark(
+        [type(event) for event in events]
+        == [endra.MessageReceived, endra.MessageEdited],
+        "Block events: typed events for received blocks"
+    )
+    mark(
+        bytes(events[-1].message.content.message_parts[0].payload)
+        == b"Hello events!",
+        "Block events: decoded message content"
+    )
+
+
+def test_attachment_deduplication():
+    def make_attachment(filename, payload_hash=None):
+        attachment = endra.MessageAttachment.create(
+            media_type="text/plain",
+            derived_properties={},
+            user_attributes={"filename": filename},
+            payload=b"Deduplicated payload",
+        )
+        if payload_hash is not None:
+            attachment.payload_hash = payload_hash
+        return attachment
+
+    attachment_id = pytest.corresp.add_attachment(make_attachment("a.txt"))
+    mark(
+        pytest.corresp.add_attachment(make_attachment("a.txt")) == attachment_id,
+        "Attachment deduplication: same payload & metadata reuses the attachment"
+    )
+    other_id = pytest.corresp.add_attachment(make_attachment("b.txt"))
+    mark(
+        other_id != attachment_id
+        and pytest.corresp.get_attachment(other_id).user_attributes
+        == {"filename": "b.txt"},
+        "Attachment deduplication: different metadata is kept"
+    )
+    forged_id = pytest.corresp.add_attachment(
+        make_attachment("c.txt", payload_hash="sha256:forged")
+    )
+    mark(
+        pytest.corresp.get_attachment(forged_id).verify_hash()
+        and pytest.corresp.find_attachment("sha256:forged") is None,
+        "Attachment deduplication: given payload hashes are recalculated"
+    )
+
+
 def test_delete_profile():
     pytest.profile.delete()
     existing_blockchain_ids = waly.list_blockchain_ids()
@@ -144,8 +238,11 @@ def run_tests():
     test_preparations()
     test_create_profile()
     test_create_correspondence()
+    test_lazy_load()
     test_create_message()
     test_message_edit()
+    test_block_events()
+    test_attachment_deduplication()
     test_archive_correspondence()
 
     test_delete_profile()
@@ -21,23 +21,42 @@ _testing_utils.assert_is_loaded_from_source(
     source_dir=os.path.dirname(os.path.dirname(__file__)), module=endra
 )
 # test.py
+import asyncio
+from contextlib import aclosing
 import threading
 import time
 import grpc
 import pytest
+from types import SimpleNamespace
 from typing import Tuple, List
 from endra.api import myservice_pb2
 from endra.api import myservice_pb2_grpc
+from endra.api.grpc_server import BaseSubscription, MyService, OverflowPolicy
 from endra.api.grpc_server import GrpcServer  # Assuming the server file is named server.py
-from endra.api.grpc_client import send_request, MessageSubscriber  # Assuming client file is client.py
+from endra.api.grpc_aio_server import AsyncGrpcServer
+from endra.api.profile_events import block_event_to_grpc, correspondence_change_to_grpc
+from endra.block_events import AttachmentReceived, MessageReceived
+from endra.change_feed import Change, ChangeType
+from endra.api.grpc_client import send_request, get_client, GrpcClient, AsyncGrpcClient, MessageSubscriber  # Assuming client file is client.py
 
 
 RPC_ADDRESS: Tuple[str, int] = ("127.0.0.1", 50051)
+AIO_RPC_ADDRESS: Tuple[str, int] = ("127.0.0.1", 50052)
+
+def on_request_received(request: myservice_pb2.Request) -> myservice_pb2.Response:
+    return myservice_pb2.Response(result="Processed: " + request.data)
+
+
+def on_stream_request(request: myservice_pb2.Request):
+    """Stream as many responses as the request's number."""
+    for i in range(int(request.data)):
+        yield myservice_pb2.Response(result=f"Response {i}")
+
 
 @pytest.fixture(scope="module")
 def grpc_server():
     """Fixture to start and stop the gRPC server."""
-    server = GrpcServer(RPC_ADDRESS, lambda request: myservice_pb2.Response(result="Processed: " + request.data))
+    server = GrpcServer(RPC_ADDRESS, on_request_received, on_stream_request=on_stream_request)
     thread = threading.Thread(target=lambda: time.sleep(5), daemon=True)
     thread.start()
     yield server
@@ -70,8 +89,252 @@ def test_pubsub_functionality(grpc_server):
     
     mark(test_message in received_messages, "PubSub")
 
+def test_pubsub_fan_out(grpc_server):
+    """Test that every subscriber of a topic receives every message."""
+    received_messages: List[List[str]] = [[], [], []]
+    subscribers = [
+        MessageSubscriber(RPC_ADDRESS, messages.append, topic="fan-out")
+        for messages in received_messages
+    ]
+    time.sleep(1)  # Ensure the subscriptions are active
+    mark(grpc_server.get_num_subscribers("fan-out") == 3, "Subscribers registered")
+
+    test_messages = [f"Message {i}" for i in range(10)]
+    for message in test_messages:
+        grpc_server.publish("fan-out", message)
+    time.sleep(2)  # Allow time for message propagation
+
+    for subscriber in subscribers:
+        subscriber.terminate()
+    mark(all(messages == test_messages for messages in received_messages), "PubSub fan-out")
+
+    time.sleep(1)  # Allow time for the server to notice the cancellations
+    mark(grpc_server.get_num_subscribers("fan-out") == 0, "Subscribers removed")
+
+
+def test_client_reuse(grpc_server):
+    """Test that RPCs and subscriptions share one connection per server."""
+    responses = [
+        send_request(RPC_ADDRESS, myservice_pb2.Request(data=str(i)))
+        for i in range(10)
+    ]
+    mark(all(response.result == f"Processed: {i}" for i, response in enumerate(responses)), "Pooled RPCs")
+    mark(get_client(RPC_ADDRESS) is get_client(RPC_ADDRESS), "Client reused")
+
+    with GrpcClient(RPC_ADDRESS, timeout=5) as client:
+        received_messages: List[str] = []
+        subscriber = client.subscribe("reuse", received_messages.append)
+        time.sleep(1)  # Ensure the subscription is active
+        grpc_server.publish("reuse", "Shared channel message")
+        time.sleep(1)  # Allow time for message propagation
+        subscriber.terminate()
+        # the channel is still usable after the subscriber terminated
+        response = client.send_request(myservice_pb2.Request(data="Again"))
+    mark(received_messages == ["Shared channel message"], "Subscription on shared channel")
+    mark(response.result == "Processed: Again", "RPC after subscription")
+
+
+def test_typed_events(grpc_server):
+    """Test typed events and server-side event filtering."""
+    all_events: List[myservice_pb2.Event] = []
+    filtered_events: List[myservice_pb2.Event] = []
+    with GrpcClient(RPC_ADDRESS) as client:
+        subscribers = [
+            client.subscribe(["events", "other-events"], on_event_received=all_events.append),
+            client.subscribe(
+                "events",
+                on_event_received=filtered_events.append,
+                event_types=["message_received"],
+                correspondence_ids=["did:corresp:1"],
+            ),
+        ]
+        time.sleep(1)  # Ensure the subscriptions are active
+        events = [
+            myservice_pb2.Event(message_received=myservice_pb2.MessageReceived(
+                correspondence_id="did:corresp:1", message_id=b"\xff\x00"
+            )),
+            myservice_pb2.Event(message_received=myservice_pb2.MessageReceived(
+                correspondence_id="did:corresp:2", message_id=b"\xff\x01"
+            )),
+            myservice_pb2.Event(attachment_received=myservice_pb2.AttachmentReceived(
+                correspondence_id="did:corresp:1", attachment_id=b"\xff\x02", media_type="image/png"
+            )),
+        ]
+        for event in events:
+            grpc_server.publish("events", event)
+        grpc_server.publish("other-events", "Text")
+        time.sleep(1)  # Allow time for message propagation
+        for subscriber in subscribers:
+            subscriber.terminate()
+
+    mark(
+        [event.WhichOneof("event") for event in all_events]
+        == ["message_received", "message_received", "attachment_received", "text"],
+        "Typed events"
+    )
+    mark(all_events[0].message_received.message_id == b"\xff\x00", "Binary IDs")
+    mark(all_events[3].topic == "other-events", "Event topics")
+    mark(
+        [event.message_received.message_id for event in filtered_events] == [b"\xff\x00"],
+        "Server-side event filtering"
+    )
+
+
+def test_legacy_subscribe(grpc_server):
+    """Test that clients from before typed events still get text messages."""
+    with GrpcClient(RPC_ADDRESS) as client:
+        call = client.stub.Subscribe(myservice_pb2.SubscriptionRequest(topic="legacy"))
+        time.sleep(1)  # Ensure the subscription is active
+        grpc_server.publish("legacy", myservice_pb2.Event(
+            message_received=myservice_pb2.MessageReceived(message_id=b"\xff\x00")
+        ))
+        grpc_server.publish("legacy", "Legacy message")
+        message = next(call)
+        call.cancel()
+    mark(message.data == "Legacy message", "Legacy subscription")
+
+
+def test_profile_events():
+    """Test converting a profile's events to typed gRPC events."""
+    event = block_event_to_grpc(
+        MessageReceived("did:corresp", SimpleNamespace(id=b"\xff\x00"))
+    )
+    mark(event.message_received.correspondence_id == "did:corresp", "Message event correspondence")
+    mark(event.message_received.message_id == b"\xff\x00", "Message event ID")
+    event = block_event_to_grpc(AttachmentReceived(
+        "did:corresp", b"\xff\x01", SimpleNamespace(media_type="image/png")
+    ))
+    mark(event.attachment_received.media_type == "image/png", "Attachment event")
+    event = correspondence_change_to_grpc(Change(1, ChangeType.REMOVED, "did:corresp"))
+    mark(event.WhichOneof("event") == "correspondence_archived", "Correspondence event")
+
+
+def test_bulk_rpcs(grpc_server):
+    """Test batched, client-streaming and server-streaming RPCs."""
+    requests = [myservice_pb2.Request(data=str(i)) for i in range(250)]
+    expected_results = [f"Processed: {i}" for i in range(250)]
+    with GrpcClient(RPC_ADDRESS) as client:
+        responses = client.send_batch(requests)
+        mark([response.result for response in responses] == expected_results, "Batch RPC")
+
+        responses = client.send_request_stream(request for request in requests)
+        mark([response.result for response in responses] == expected_results, "Client-streaming RPC")
+
+        responses = client.stream_responses(myservice_pb2.Request(data="300"))
+        mark(
+            [response.result for response in responses] == [f"Response {i}" for i in range(300)],
+            "Server-streaming RPC"
+        )
+
+
+def test_incomplete_subscription():
+    class IncompleteSubscription(BaseSubscription):
+        def _notify(self) -> None:
+            pass
+
+    # fails at construction rather than when first delivering events
+    with pytest.raises(TypeError):
+        IncompleteSubscription(["messages"])
+
+
+def test_block_timeout():
+    """Test that subscribers that don't keep up don't stall publishing."""
+    service = MyService(
+        on_request_received,
+        subscriber_queue_size=1,
+        overflow_policy=OverflowPolicy.BLOCK,
+        block_timeout=0.5,
+    )
+    stalled = [service.add_subscription(["block"]) for _ in range(2)]
+    active = service.add_subscription(["block"])
+    service.publish("block", "First")
+    mark(active.get().text == "First", "Blocking publish")
+
+    start_time = time.monotonic()
+    service.publish("block", "Second")
+    duration = time.monotonic() - start_time
+    mark(duration < 0.9, "Full subscribers waited for concurrently")
+    mark(active.get().text == "Second", "Active subscriber not stalled")
+    mark(
+        all(subscription.closed and subscription.num_dropped == 1 for subscription in stalled),
+        "Stalled subscribers disconnected"
+    )
+
+
+def check_async_client(server: AsyncGrpcServer):
+    """Test the asyncio client's RPCs and subscriptions."""
+    async def run() -> tuple[str, List[str]]:
+        async with AsyncGrpcClient(AIO_RPC_ADDRESS) as client:
+            response = await client.send_request(myservice_pb2.Request(data="Async"))
+
+            requests = [myservice_pb2.Request(data=str(i)) for i in range(10)]
+            expected_results = [f"Processed: {i}" for i in range(10)]
+            responses = await client.send_batch(requests)
+            mark([r.result for r in responses] == expected_results, "Async batch RPC")
+            responses = await client.send_request_stream(requests)
+            mark([r.result for r in responses] == expected_results, "Async client-streaming RPC")
+            results = [r.result async for r in client.stream_responses(myservice_pb2.Request(data="5"))]
+            mark(results == [f"Response {i}" for i in range(5)], "Async server-streaming RPC")
+            received_messages: List[str] = []
+
+            async def subscribe() -> None:
+                # cancel the subscription before the channel is closed
+                async with aclosing(client.subscribe("async-client")) as messages:
+                    async for message in messages:
+                        received_messages.append(message)
+                        if len(received_messages) == 2:
+                            break
+            task = asyncio.create_task(subscribe())
+            await asyncio.sleep(1)  # Ensure the subscription is active
+            server.publish("async-client", "First")
+            server.publish("async-client", "Second")
+            await asyncio.wait_for(task, 5)
+        # the channel is closed, let grpc deliver its last events
+        # before asyncio.run closes the event loop
+        await asyncio.sleep(0.1)
+        return response.result, received_messages
+
+    result, received_messages = asyncio.run(run())
+    mark(result == "Processed: Async", "Async client RPC")
+    mark(received_messages == ["First", "Second"], "Async client subscription")
+
+
+def test_aio_server():
+    """Test that many subscriptions don't starve RPCs on the asyncio server."""
+    async def on_stream_request_async(request: myservice_pb2.Request):
+        for response in on_stream_request(request):
+            yield response
+
+    server = AsyncGrpcServer(AIO_RPC_ADDRESS, on_request_received, on_stream_request=on_stream_request_async)
+    received_messages: List[List[str]] = [[] for _ in range(50)]
+    subscribers = [
+        MessageSubscriber(AIO_RPC_ADDRESS, messages.append, topic="aio")
+        for messages in received_messages
+    ]
+    time.sleep(2)  # Ensure the subscriptions are active
+    mark(server.get_num_subscribers("aio") == 50, "aio subscribers registered")
+
+    response = send_request(AIO_RPC_ADDRESS, myservice_pb2.Request(data="Hello, Server!"))
+    mark(response.result == "Processed: Hello, Server!", "aio RPC")
+
+    test_messages = [f"Message {i}" for i in range(10)]
+    for message in test_messages:
+        server.publish("aio", message)
+    time.sleep(2)  # Allow time for message propagation
+
+    for subscriber in subscribers:
+        subscriber.terminate()
+    mark(all(messages == test_messages for messages in received_messages), "aio PubSub fan-out")
+
+    time.sleep(1)  # Allow time for the server to notice the cancellations
+    mark(server.get_num_subscribers("aio") == 0, "aio subscribers removed")
+
+    check_async_client(server)
+    server.terminate()
+
+
 def run_tests():
-    server_instance = GrpcServer(RPC_ADDRESS, lambda request: myservice_pb2.Response(result="Processed: " + request.data))
+    server_instance = GrpcServer(RPC_ADDRESS, on_request_received, on_stream_request=on_stream_request)
     
     test_rpc_functionality(server_instance)
     print("RPC Test Passed")
@@ -79,9 +342,25 @@ def run_tests():
     print("Running PubSub Test...")
     test_pubsub_functionality(server_instance)
     print("PubSub Test Passed")
+
+    test_pubsub_fan_out(server_instance)
+
+    test_client_reuse(server_instance)
+
+    test_bulk_rpcs(server_instance)
+
+    test_typed_events(server_instance)
+
+    test_legacy_subscribe(server_instance)
     
     server_instance.terminate()
-    
+
+    test_block_timeout()
+
+    test_profile_events()
+
+    test_aio_server()
+
     test_threads_cleanup()
 if __name__ == "__main__":
     _testing_utils.PYTEST=False
@@ -1,13 +1,46 @@
 import _auto_run_with_pytest
 
+import mmap
+from enum import IntEnum
+
 from endra.message import (
     MessageAttachment,
+    ChunkedAttachment,
     MessageContent,
     EmbeddedContentPart,
     encode_message,
     decode_message,
     encode_attachment,
     decode_attachment,
+    encode_chunked_attachment,
+    decode_chunked_attachment,
+    iter_chunks,
+    hash_payload,
+    decode_attachment_metadata,
+    decode_attachment_payload,
+    decode_attachment_payload_view,
+    decode_attachment_view,
+    decode_message_view,
+    encode_attachment_frames,
+    encode_message_frames,
+)
+from endra.message.message_encoding_versions import (
+    message_encoding_v1,
+    message_encoding_v2,
+    message_encoding_v3,
+    attachment_encoding_v1,
+    attachment_encoding_v2,
+    attachment_encoding_v3,
+)
+from endra.message.message_encoding_versions.message_encoding_utils import (
+    decode_dict,
+    encode_dict,
+)
+from codec_versioning import (
+    decode_versioned,
+    encode_versioned,
+    load_codec_module,
+    load_codec_modules,
 )
 
 
@@ -37,3 +70,316 @@ def test_attachment_encoding():
     )
 
     assert decode_attachment(encode_attachment(attachment)) == attachment
+
+
+def test_chunked_attachment_encoding():
+    attachment = ChunkedAttachment(
+        media_type="video/mp4",
+        payload_hash="",
+        size=5 * 1024 * 1024 * 1024,
+        derived_properties={"duration": 3600},
+        user_attributes={"filename": "movie.mp4"},
+        chunk_size=1024 * 1024,
+        chunk_ids=[b"chunk-1", b"chunk-2"],
+    )
+
+    assert decode_chunked_attachment(encode_chunked_attachment(attachment)) == (
+        attachment
+    )
+
+
+def test_iter_chunks():
+    payload = bytes(range(256)) * 10
+    chunks = list(iter_chunks(payload, 1000))
+    assert [len(chunk) for chunk in chunks] == [1000, 1000, 560]
+    assert b"".join(chunks) == payload
+
+    # irregularly sized input pieces are re-chunked to the chunk size
+    pieces = [payload[i : i + 7] for i in range(0, len(payload), 7)]
+    assert list(iter_chunks(iter(pieces), 1000)) == chunks
+
+
+def test_attachment_hash():
+    attachment = MessageAttachment.create(
+        media_type="text/plain",
+        derived_properties={},
+        user_attributes={},
+        payload="Hello there!".encode(),
+    )
+    assert attachment.payload_hash.startswith("sha256:")
+    assert attachment.verify_hash()
+
+    # the hash is the same whether or not the payload is streamed in chunks
+    assert hash_payload(iter_chunks(attachment.payload, 5)) == (
+        attachment.payload_hash
+    )
+
+    attachment.payload = "Hello there?".encode()
+    assert not attachment.verify_hash()
+
+
+def test_attachment_metadata_decoding():
+    attachment = MessageAttachment.create(
+        media_type="image/png",
+        derived_properties={"width": 800, "height": 600},
+        user_attributes={"filename": "image.png"},
+        payload=bytes(range(256)) * 100,
+    )
+    data = encode_attachment(attachment)
+
+    loads = []
+
+    def load_payload():
+        loads.append(True)
+        return decode_attachment_payload(data)
+
+    lazy_attachment = decode_attachment_metadata(data, payload_loader=load_payload)
+    assert lazy_attachment.user_attributes == attachment.user_attributes
+    assert lazy_attachment.size == attachment.size
+    assert not lazy_attachment.is_payload_loaded and not loads
+
+    assert lazy_attachment.payload == attachment.payload
+    assert lazy_attachment.open_payload().read() == attachment.payload
+    assert lazy_attachment.verify_hash()
+    assert len(loads) == 1
+
+
+def test_v1_decoding_compatibility():
+    message = MessageContent({"version": 1}, [])
+    message.add_embedded_part("text/plain", {"bold": True}, "Hello!".encode())
+    data = encode_versioned(message, load_codec_module(message_encoding_v1))
+    assert decode_message(data) == message
+
+    attachment = MessageAttachment.create(
+        media_type="text/plain",
+        derived_properties={},
+        user_attributes={},
+        payload="Hello!".encode(),
+    )
+    data = encode_versioned(attachment, load_codec_module(attachment_encoding_v1))
+    assert decode_attachment(data) == attachment
+
+
+def test_buffer_payloads():
+    buffer = mmap.mmap(-1, 1024 * 1024)
+    buffer.write(bytes(range(256)) * 4096)
+    attachment = MessageAttachment.create(
+        media_type="application/octet-stream",
+        derived_properties={},
+        user_attributes={},
+        payload=buffer,
+    )
+
+    # buffers are accepted as payloads, decoded payloads are bytes
+    for codec_module in [attachment_encoding_v1, attachment_encoding_v2]:
+        data = encode_versioned(attachment, load_codec_module(codec_module))
+        decoded = decode_attachment(memoryview(data))
+        assert isinstance(decoded.payload, bytes)
+        assert decoded.payload == buffer[:]
+        assert decoded.verify_hash()
+        assert decode_attachment_payload(data) == buffer[:]
+
+    message = MessageContent({}, [])
+    message.add_embedded_part("text/plain", {}, memoryview(b"Hello!"))
+    for codec_module in [message_encoding_v1, message_encoding_v2]:
+        data = encode_versioned(message, load_codec_module(codec_module))
+        payload = decode_message(data).message_parts[0].payload
+        assert isinstance(payload, bytes)
+        assert payload.decode() == "Hello!"
+
+
+def test_default_encoding_compatibility():
+    # peers that only know the v1 codecs can decode what we encode
+    message = MessageContent({"sender": "Alice"}, [])
+    message.add_embedded_part("text/plain", {}, "Hello!".encode())
+    v1_message_codecs = load_codec_modules([message_encoding_v1])
+    assert decode_versioned(encode_message(message), v1_message_codecs) == message
+
+    attachment = MessageAttachment.create(
+        media_type="text/plain",
+        derived_properties={},
+        user_attributes={},
+        payload="Hello!".encode(),
+    )
+    v1_attachment_codecs = load_codec_modules([attachment_encoding_v1])
+    assert (
+        decode_versioned(encode_attachment(attachment), v1_attachment_codecs)
+        == attachment
+    )
+
+
+def test_metadata_types_preserved():
+    metadata = {"count": 3, "ratio": 0.5, "nested": {"tags": ["a", "b"]}}
+    message = MessageContent(metadata, [])
+    message.add_embedded_part("text/plain", {"line": 12}, "Hello!".encode())
+    message.add_attached_part({"width": 640}, b"attachment")
+    data = encode_versioned(message, load_codec_module(message_encoding_v3))
+    decoded = decode_message(data)
+    assert decoded.message_metadata == metadata
+    assert isinstance(decoded.message_metadata["count"], int)
+    assert isinstance(decoded.message_metadata["nested"], dict)
+    assert decoded.message_parts[1].rendering_metadata == {"width": 640}
+
+    attachment = MessageAttachment.create(
+        media_type="image/png",
+        derived_properties={"width": 640, "height": 480},
+        user_attributes={"filename": "image.png"},
+        payload=b"\x89PNG",
+    )
+    data = encode_versioned(attachment, load_codec_module(attachment_encoding_v3))
+    decoded = decode_attachment(data)
+    assert decoded == attachment
+    assert isinstance(decoded.derived_properties["width"], int)
+    assert decode_attachment_metadata(data).size == 4
+
+
+def test_metadata_dict_encoding():
+    metadata = {
+        "text": "Hellö",
+        1: None,
+        b"key": b"\x00\xff",
+        "numbers": [0, -1, 2**64 - 1, -(2**63), 1.5, True, False],
+        "nested": {2.5: {"list": []}},
+    }
+    decoded = decode_dict(encode_dict(metadata))
+    assert decoded == metadata
+    assert [type(key) for key in decoded] == [str, int, bytes, str, str]
+    assert [type(n) for n in decoded["numbers"]] == [int] * 4 + [float, bool, bool]
+
+    # unsupported types are rejected rather than silently converted
+    for value in [(1, 2), {1, 2}, IntEnum("Flag", ["ON"]).ON, object()]:
+        try:
+            encode_dict({"value": value})
+        except TypeError:
+            continue
+        raise AssertionError(f"encoded unsupported type {type(value)}")
+    try:
+        encode_dict({"value": 2**64})
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("encoded an int that doesn't fit in 64 bits")
+
+
+def test_v2_decoding_compatibility():
+    message = MessageContent({"sender": "Alice"}, [])
+    message.add_embedded_part("text/plain", {"bold": True}, "Hello!".encode())
+    data = encode_versioned(message, load_codec_module(message_encoding_v2))
+    assert decode_message(data) == message
+
+    attachment = MessageAttachment.create(
+        media_type="text/plain",
+        derived_properties={},
+        user_attributes={"filename": "hello.txt"},
+        payload="Hello!".encode(),
+    )
+    data = encode_versioned(attachment, load_codec_module(attachment_encoding_v2))
+    assert decode_attachment(data) == attachment
+    decoded = decode_attachment_metadata(data)
+    assert decoded.user_attributes == attachment.user_attributes
+
+
+def test_compact_decoded_objects():
+    message = MessageContent({}, [])
+    message.add_embedded_part("text/plain", {}, b"Hello")
+    message.add_referenced_part(b"quoted", 1)
+    message.add_attached_part({"width": 640}, b"attachment")
+    attachment = MessageAttachment.create(
+        media_type="text/plain",
+        derived_properties={},
+        user_attributes={},
+        payload=b"Attached",
+    )
+    for codec_module in [message_encoding_v1, message_encoding_v2]:
+        decoded = codec_module.decode(codec_module.encode(message))
+        for part in decoded.message_parts:
+            # slotted, without a per-instance __dict__
+            assert not hasattr(part, "__dict__")
+    for codec_module in [attachment_encoding_v1, attachment_encoding_v2]:
+        decoded = codec_module.decode(codec_module.encode(attachment))
+        assert not hasattr(decoded, "__dict__")
+        assert MessageAttachment.from_json(decoded.to_json()).payload == b"Attached"
+
+
+def test_attachment_metadata_decoding_versions():
+    attachment = MessageAttachment.create(
+        media_type="text/plain",
+        derived_properties={},
+        user_attributes={"filename": "hello.txt"},
+        payload="Hello!".encode(),
+    )
+    for codec_module in [
+        attachment_encoding_v1,
+        attachment_encoding_v2,
+        attachment_encoding_v3,
+    ]:
+        data = encode_versioned(attachment, load_codec_module(codec_module))
+        decoded = decode_attachment_metadata(memoryview(data))
+        assert decoded.user_attributes == attachment.user_attributes
+        assert decoded.payload == attachment.payload
+        assert decode_attachment_payload(data) == attachment.payload
+
+    # data of unknown encoding versions is rejected
+    try:
+        decode_attachment_metadata(b"\x7f\x00")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("decoded data of an unknown encoding version")
+
+
+def test_framed_encoding_views():
+    buffer = mmap.mmap(-1, 64 * 1024)
+    buffer.write(bytes(range(256)) * 256)
+    attachment = MessageAttachment.create(
+        media_type="application/octet-stream",
+        derived_properties={},
+        user_attributes={"filename": "data.bin"},
+        payload=buffer,
+    )
+
+    # the payload is framed as given rather than copied
+    frames = encode_attachment_frames(attachment)
+    assert any(frame is buffer for frame in frames)
+    data = bytearray(b"".join(frames))
+    assert decode_attachment(data).payload == buffer[:]
+
+    # decoded views share the encoded data's buffer
+    decoded = decode_attachment_view(data)
+    assert isinstance(decoded.payload, memoryview)
+    assert decoded.payload.obj is data
+    assert decoded.payload == buffer[:]
+    assert decoded.verify_hash()
+    assert decode_attachment_payload_view(data).obj is data
+    lazy_attachment = decode_attachment_metadata(data)
+    assert lazy_attachment.get_payload_view().obj is data
+    assert not lazy_attachment.is_payload_loaded
+
+    # v1 attachments are decoded as views too
+    data = bytearray(
+        encode_versioned(attachment, load_codec_module(attachment_encoding_v1))
+    )
+    assert decode_attachment_view(data).payload.obj is data
+
+    message = MessageContent({}, [])
+    message.add_embedded_part("text/plain", {}, memoryview(b"Hello!"))
+    data = bytearray(b"".join(encode_message_frames(message)))
+    assert decode_message(data) == message
+    payload = decode_message_view(data).message_parts[0].payload
+    assert isinstance(payload, memoryview) and payload.obj is data
+    assert payload == b"Hello!"
+
+
+def test_non_byte_buffer_payloads():
+    # sizes are counted in bytes, not in items of the buffer's format
+    payload = memoryview(bytes(range(16))).cast("I")
+    attachment = MessageAttachment.create(
+        media_type="application/octet-stream",
+        derived_properties={},
+        user_attributes={},
+        payload=payload,
+    )
+    assert attachment.size == 16
+    data = b"".join(encode_attachment_frames(attachment))
+    assert decode_attachment(data).payload == bytes(range(16))
+    assert decode_attachment(data).verify_hash()
@@ -0,0 +1,98 @@
+import _auto_run_with_pytest
+
+import os
+import tempfile
+import time
+
+from endra.message import MessageContent
+from endra.search_index import SearchIndex, get_message_text, iter_top_hits
+
+MESSAGE_IDS = [bytes([i, 0, 0, 0, 0]) for i in range(1, 6)]
+
+
+def test_message_text():
+    message = MessageContent({}, [])
+    message.add_embedded_part("text/plain", {}, "Hello".encode())
+    message.add_embedded_part("image/png", {}, b"\x89PNG")
+    message.add_embedded_part("text/markdown", {}, memoryview("**there**".encode()))
+    message.add_attached_part({}, b"attachment")
+    assert get_message_text(message) == "Hello\n**there**"
+
+
+def test_search():
+    index = SearchIndex()
+    index.add_message(MESSAGE_IDS[0], "Let's meet at the café tomorrow")
+    index.add_message(MESSAGE_IDS[1], "The cafe is closed, cafe cafe cafe")
+    index.add_message(MESSAGE_IDS[2], "See you tomorrow")
+
+    # ranked by relevance, diacritics ignored
+    assert index.search("cafe") == [MESSAGE_IDS[1], MESSAGE_IDS[0]]
+    # all words must match
+    assert index.search("cafe tomorrow") == [MESSAGE_IDS[0]]
+    # FTS5 syntax in queries is searched for literally
+    assert index.search('tomorrow" OR "closed') == []
+    assert index.search("   ") == []
+    assert index.search("cafe", limit=1) == [MESSAGE_IDS[1]]
+
+    # edits replace the indexed text, deletions remove it
+    index.add_message(MESSAGE_IDS[2], "See you next week")
+    assert index.search("tomorrow") == [MESSAGE_IDS[0]]
+    index.remove_message(MESSAGE_IDS[0])
+    assert index.search("tomorrow") == []
+    assert len(index) == 2
+    assert index.get_message_ids() == {MESSAGE_IDS[1], MESSAGE_IDS[2]}
+
+
+def test_persistence():
+    index_path = os.path.join(tempfile.mkdtemp(), "search.sqlite")
+    index = SearchIndex(index_path)
+    index.add_message(MESSAGE_IDS[0], "Hello there")
+    index.close()
+
+    reloaded = SearchIndex(index_path)
+    assert reloaded.has_message(MESSAGE_IDS[0])
+    assert reloaded.search("hello") == [MESSAGE_IDS[0]]
+
+    reloaded.delete()
+    assert not os.path.exists(index_path)
+
+
+def test_search_speed():
+    index = SearchIndex()
+    for i in range(20000):
+        text = f"message number {i} about topic {i % 100}"
+        index.add_message(i.to_bytes(4, "big"), text)
+    index.add_message(b"needle", "a rare needle in the haystack")
+
+    start_time = time.monotonic()
+    assert index.search("needle") == [b"needle"]
+    assert len(index.search("topic 42", limit=10)) == 10
+    assert time.monotonic() - start_time < 0.5
+
+
+def test_top_hits_streaming():
+    def iter_results():
+        # results arrive from indexes in order of completion,
+        # each index's results ordered by score
+        yield "a", [(9.0, b"a1"), (5.0, b"a2"), (1.0, b"a3")]
+        yield "b", [(7.0, b"b1"), (6.0, b"b2"), (2.0, b"b3")]
+        yield "c", [(8.0, b"c1"), (0.5, b"c2")]
+
+    hits = list(iter_top_hits(iter_results(), limit=3))
+    # hits are yielded as they arrive, as long as they rank in the top 3
+    assert [message_id for _, _, message_id in hits] == [
+        b"a1", b"a2", b"a3", b"b1", b"b2", b"c1"
+    ]
+    top_hits = sorted(hits, key=lambda hit: hit[1], reverse=True)[:3]
+    assert [(source, message_id) for source, _, message_id in top_hits] == [
+        ("a", b"a1"), ("c", b"c1"), ("b", b"b1")
+    ]
+
+
+def test_search_with_scores():
+    index = SearchIndex()
+    index.add_message(MESSAGE_IDS[0], "I attached the invoice to this message")
+    index.add_message(MESSAGE_IDS[1], "Invoice: invoice number 3")
+    results = index.search_with_scores("invoice")
+    assert [message_id for _, message_id in results] == [MESSAGE_IDS[1], MESSAGE_IDS[0]]
+    assert results[0][0] > results[1][0]